@@ -0,0 +1,108 @@
+"""
+Measure the download throughput against a local IOC stand-in, for several concurrency settings.
+
+Usage:
+
+    python -m benchmarks.bench_download [LATENCY_SECONDS]
+
+Every station is synthetic, so nothing is read from the network. Each request
+is delayed by the given latency (default 0.2s, about a round trip to the IOC
+server), which is what makes the number of threads and the client-side rate
+limit matter.
+
+The bulk downloader (`download_station_years`) is measured the same way, on
+whole years and including the Parquet writes.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import multiprocessing
+import sys
+import tempfile
+import time
+
+import limits
+import multifutures
+import pandas as pd
+
+import ioc_cleanup as C
+
+STATIONS = [f"st{i:02d}" for i in range(8)]
+START = pd.Timestamp("2021-01-01")
+# four 30-day requests per station, 32 in total
+END = START + pd.Timedelta(days=115)
+
+
+def serve(latency: float, queue: multiprocessing.Queue[str]) -> None:
+    with C.StandInServer(latency=latency) as server:
+        queue.put(server.base_url)
+        while True:
+            time.sleep(3600)
+
+
+def run(base_url: str, threads: int, rate: str, *, parse_in_threads: bool) -> tuple[float, int]:
+    rate_limit = multifutures.RateLimit(rate_limit=limits.parse(rate))
+    began = time.perf_counter()
+    with (
+        concurrent.futures.ThreadPoolExecutor(threads) as executor,
+        concurrent.futures.ThreadPoolExecutor(threads) if parse_in_threads else contextlib.nullcontext() as parser,
+    ):
+        dataframes = C.download_raw(
+            STATIONS,
+            START,
+            END,
+            base_url=base_url,
+            rate_limit=rate_limit,
+            executor=executor,
+            parse_executor=parser,
+        )
+    elapsed = time.perf_counter() - began
+    return elapsed, sum(len(df) for df in dataframes.values())
+
+
+def run_bulk(base_url: str, concurrency: int, rate: float | None) -> tuple[float, int]:
+    began = time.perf_counter()
+    with tempfile.TemporaryDirectory() as data_folder:
+        summary = C.download_station_years(
+            STATIONS[:4],
+            [START.year],
+            data_folder,
+            base_url=base_url,
+            concurrency=concurrency,
+            rate=rate,
+        )
+    elapsed = time.perf_counter() - began
+    return elapsed, int(summary.rows.sum())
+
+
+def main(latency: float = 0.2) -> None:
+    # the server runs in its own process, so that it does not compete with the client for the GIL
+    context = multiprocessing.get_context("spawn")
+    queue: multiprocessing.Queue[str] = context.Queue()
+    process = context.Process(target=serve, args=(latency, queue), daemon=True)
+    process.start()
+    base_url = queue.get()
+    try:
+        for parse_in_threads in (False, True):
+            for rate in ("5/second", "20/second", "1000/second"):
+                for threads in (1, 4, 16):
+                    elapsed, rows = run(base_url, threads, rate, parse_in_threads=parse_in_threads)
+                    print(  # noqa: T201
+                        f"parse={'threads' if parse_in_threads else 'processes':<9} rate={rate:<12} "
+                        f"threads={threads:>2} elapsed={elapsed:6.2f}s rows/s={rows / elapsed:>10,.0f}",
+                    )
+        for rate_per_second in (5.0, 20.0, None):
+            for concurrency in (1, 4, 16):
+                elapsed, rows = run_bulk(base_url, concurrency, rate_per_second)
+                print(  # noqa: T201
+                    f"{'bulk':<15} rate={rate_per_second or 'unlimited'!s:<12} "
+                    f"concurrency={concurrency:>2} elapsed={elapsed:6.2f}s rows/s={rows / elapsed:>10,.0f}",
+                )
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main(*(float(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,55 @@
+"""
+Compare the single-sort `calc_raw_statistics` against the previous pandas implementation.
+
+Usage:
+
+    python -m benchmarks.bench_statistics [N_REPEAT]
+
+The series are synthetic, covering the full `DETIDE_START`-`DETIDE_END` period
+(six years) at typical IOC sampling intervals, with ~10% gaps.
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from ioc_cleanup._legacy import legacy_statistics
+from ioc_cleanup import _statistics
+from ioc_cleanup._constants import DETIDE_END
+from ioc_cleanup._constants import DETIDE_START
+
+
+# Fraction of the samples that are missing
+GAPS = 0.1
+
+
+def synthetic_series(freq: str) -> pd.Series:
+    rng = np.random.default_rng(0)
+    index = pd.date_range(DETIDE_START, DETIDE_END, freq=freq)
+    index = index[rng.random(len(index)) > GAPS]
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    values = np.sin(2 * np.pi * hours / 12.42) + rng.normal(scale=0.05, size=len(index))
+    return pd.Series(values, index=index)
+
+
+def main(repeat: int = 3) -> None:
+    for freq in ("1min", "2min", "5min"):
+        sr = synthetic_series(freq)
+        expected = legacy_statistics(sr)
+        result = _statistics.calc_raw_statistics(sr)
+        for key, value in expected.items():
+            assert np.isclose(result[key], value) if isinstance(value, float) else result[key] == value, key
+        legacy = min(timeit.repeat(lambda: legacy_statistics(sr), number=1, repeat=repeat))  # noqa: B023
+        kernel = min(timeit.repeat(lambda: _statistics.calc_raw_statistics(sr), number=1, repeat=repeat))  # noqa: B023
+        print(  # noqa: T201
+            f"freq={freq:<5} rows={len(sr):>9,} legacy={legacy:7.3f}s kernel={kernel:7.3f}s "
+            f"speedup={legacy / kernel:5.1f}x",
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""
+Compare the vectorized `transform` against the previous label-slicing loop.
+
+Usage:
+
+    python -m benchmarks.bench_transform [N_FILES]
+
+The largest transformation files are applied to a synthetic one-minute series
+covering their `[start, end]` window, so no raw data are needed.
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup._legacy import legacy_transform
+
+
+def synthetic_frame(trans: C.Transformation) -> pd.DataFrame:
+    index = pd.date_range(trans.start, trans.end, freq="min")
+    index = index.union(pd.DatetimeIndex(trans.dropped_timestamps))
+    index = index[(index >= trans.start) & (index <= trans.end)]
+    values = np.random.default_rng(0).normal(size=len(index))
+    return pd.DataFrame({trans.sensor: values}, index=index)
+
+
+def main(n_files: int = 3) -> None:
+    paths = sorted(C.TRANSFORMATIONS_DIR.glob("*.json"), key=lambda p: p.stat().st_size, reverse=True)
+    for path in paths[:n_files]:
+        trans = C.load_transformation_from_path(path)
+        df = synthetic_frame(trans)
+        expected = legacy_transform(df, trans)
+        result = C.transform(df, trans)
+        # the legacy loop never dropped timestamps on the first/last sample of the window
+        pd.testing.assert_frame_equal(result.iloc[1:-1], expected.iloc[1:-1], check_freq=False)
+        legacy = min(timeit.repeat(lambda: legacy_transform(df, trans), number=1, repeat=3))  # noqa: B023
+        vectorized = min(timeit.repeat(lambda: C.transform(df, trans), number=1, repeat=3))  # noqa: B023
+        print(  # noqa: T201
+            f"{path.name:<20} rows={len(df):>9,} timestamps={len(trans.dropped_timestamps):>7,} "
+            f"ranges={len(trans.dropped_date_ranges):>4} legacy={legacy:8.3f}s vectorized={vectorized:8.3f}s "
+            f"speedup={legacy / vectorized:6.1f}x",
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Compare the vectorized `extract_waves` against the previous per-wave loop.
+
+Usage:
+
+    python -m benchmarks.bench_waves [N_REPEAT]
+
+The records are synthetic one-minute surge series with a tsunami-like
+oscillation and noise: one year of a single station, and one month of a
+(station, time) batch.
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup._legacy import legacy_extract_waves
+
+
+def synthetic_records(n_stations: int, periods: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2025-01-01", periods=periods, freq="1min").to_numpy()
+    minutes = np.arange(periods)
+    eta = 0.2 * np.sin(2 * np.pi * minutes / 20) + rng.normal(scale=0.05, size=(n_stations, periods))
+    return time, eta
+
+
+def main(repeat: int = 3) -> None:
+    time, eta = synthetic_records(1, 365 * 1440)
+    expected = legacy_extract_waves(time, eta[0])
+    pd.testing.assert_frame_equal(C.extract_waves(time, eta[0]), expected, check_dtype=False)
+    legacy = min(timeit.repeat(lambda: legacy_extract_waves(time, eta[0]), number=1, repeat=repeat))
+    kernel = min(timeit.repeat(lambda: C.extract_waves(time, eta[0]), number=1, repeat=repeat))
+    print(  # noqa: T201
+        f"single   samples={eta.size:>10,} waves={len(expected):>9,} legacy={legacy:7.3f}s "
+        f"kernel={kernel:7.3f}s speedup={legacy / kernel:5.1f}x",
+    )
+
+    time, eta = synthetic_records(100, 30 * 1440)
+    legacy = min(
+        timeit.repeat(lambda: [legacy_extract_waves(time, row) for row in eta], number=1, repeat=repeat),
+    )
+    kernel = min(timeit.repeat(lambda: C.extract_waves(time, eta), number=1, repeat=repeat))
+    print(  # noqa: T201
+        f"batch    samples={eta.size:>10,} stations={len(eta):>6} legacy={legacy:7.3f}s "
+        f"kernel={kernel:7.3f}s speedup={legacy / kernel:5.1f}x",
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:]))
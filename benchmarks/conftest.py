@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import os
+
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from benchmarks import synthetic
+
+# Length of the synthetic record. The default matches the DETIDE period of the catalog.
+YEARS = int(os.environ.get("IOC_CLEANUP_BENCH_YEARS", "6"))
+
+
+@pytest.fixture(scope="session")
+def raw():
+    end = pd.Timestamp("2020-01-01") + pd.DateOffset(years=YEARS)
+    return synthetic.synthetic_series("2020-01-01", end)
+
+
+@pytest.fixture(scope="session")
+def transformation(raw):
+    return synthetic.synthetic_transformation(raw)
+
+
+@pytest.fixture(scope="session")
+def archive(tmp_path_factory, raw, transformation):
+    """
+    A working directory with the synthetic station in `data/` and its transformation in `transformations/`.
+    """
+    root = tmp_path_factory.mktemp("bench")
+    synthetic.write_archive(raw, root / "data")
+    (root / "transformations").mkdir()
+    C.dump_transformation(transformation, root / "transformations")
+    return root
+
+
+@pytest.fixture(scope="session")
+def cleaned(raw, transformation):
+    return C.transform(raw.to_frame(), transformation)[synthetic.SENSOR]
@@ -0,0 +1,85 @@
+"""
+Offline benchmarks of the hot paths, on synthetic data (see `benchmarks/synthetic.py`).
+
+Usage:
+
+    make bench            # run and save the results under .benchmarks/
+    make bench-compare    # run and fail if slower than the last saved run
+
+The benchmarks are not collected by the default `pytest` run.
+"""
+
+from __future__ import annotations
+
+import pandas as pd
+
+import ioc_cleanup as C
+from benchmarks import synthetic
+from ioc_cleanup import _statistics
+from ioc_cleanup import _tools
+
+# In metres: the synthetic series are tide and noise around a constant level
+MAX_MEAN = 0.1
+
+
+def test_load_station(benchmark, archive):
+    df = benchmark(C.load_station, synthetic.STATION, archive / "data", 2020, 2020 + 100)
+    assert len(df)
+
+
+def test_load_transformation_from_json(benchmark, archive):
+    path = archive / "transformations" / f"{synthetic.STATION}_{synthetic.SENSOR}.json"
+    trans = benchmark(C.load_transformation_from_path, path, use_cache=False)
+    assert len(trans.dropped_timestamps) == synthetic.N_DROPPED
+
+
+def test_load_transformation_from_cache(benchmark, archive):
+    path = archive / "transformations" / f"{synthetic.STATION}_{synthetic.SENSOR}.json"
+    C.load_transformation_from_path(path)
+    trans = benchmark(C.load_transformation_from_path, path)
+    assert len(trans.dropped_timestamps) == synthetic.N_DROPPED
+
+
+def test_transform(benchmark, raw, transformation):
+    df = raw.to_frame()
+    rules = C.compile_rules(transformation)
+    out = benchmark(C.transform, df, rules)
+    assert out[synthetic.SENSOR].isna().sum() >= synthetic.N_DROPPED
+
+
+def test_clean(benchmark, archive, raw, monkeypatch):
+    monkeypatch.chdir(archive)
+    df = raw.to_frame()
+    out = benchmark(C.clean, df, synthetic.STATION, synthetic.SENSOR)
+    assert out.isna().sum() >= synthetic.N_DROPPED
+
+
+def test_demean_signal(benchmark, cleaned):
+    out = benchmark(_tools.demean_signal, cleaned)
+    assert abs(out.mean()) < MAX_MEAN
+
+
+def test_surge(benchmark, cleaned):
+    # a year is what `load_surge_ts_for_year` detides
+    ts = _tools.demean_signal(cleaned).dropna()
+    ts = ts.loc[ts.index[-1] - pd.Timedelta(days=365) :]
+    opts = {**_tools.OPTS, "lat": 40.0, "verbose": False}
+    out = benchmark.pedantic(C.surge, args=(ts, opts, _tools.RESAMPLE), rounds=3, iterations=1)
+    assert out.abs().median() < MAX_MEAN
+
+
+def test_find_spikes(benchmark, raw):
+    spikes = benchmark(C.find_spikes, raw)
+    # some of the spikes fall in the gaps
+    assert len(spikes) > 0.8 * synthetic.N_SPIKES
+
+
+def test_calc_raw_statistics(benchmark, raw):
+    stats = benchmark(_statistics.calc_raw_statistics, raw)
+    assert stats["main_interval"] == pd.Timedelta("1min")
+
+
+def test_find_breakpoints(benchmark, raw):
+    breakpoints = benchmark(C.find_breakpoints, raw)
+    compared = C.compare_breakpoints(breakpoints, raw.attrs["steps"], times=raw.index)
+    assert (compared.status == "matched").all()
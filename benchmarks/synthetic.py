@@ -0,0 +1,123 @@
+"""
+Synthetic IOC data for the offline benchmarks.
+
+The series mimic a real one-minute tide gauge: a few tidal constituents, noise,
+isolated spikes, level steps at sensor changes and multi-day gaps. The matching
+transformation has the shape of the heaviest real ones (`mins_prs.json`: ~100k
+dropped timestamps, a dozen dropped ranges, breakpoints at the steps).
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+
+# (period in hours, amplitude in metres) of M2, S2, K1 and O1
+CONSTITUENTS = ((12.4206, 0.6), (12.0, 0.2), (23.9345, 0.15), (25.8193, 0.1))
+STATION = "synt"
+SENSOR = "prs"
+N_SPIKES = 50_000
+N_DROPPED = 100_000
+
+
+def synthetic_series(
+    start: str | pd.Timestamp = "2020-01-01",
+    end: str | pd.Timestamp = "2026-01-01",
+    freq: str = "1min",
+    *,
+    n_spikes: int = N_SPIKES,
+    n_steps: int = 2,
+    n_gaps: int = 12,
+    seed: int = 0,
+) -> pd.Series:
+    """
+    Return a synthetic raw sea-level series.
+
+    Parameters:
+        start: First timestamp.
+        end: End of the series (exclusive).
+        freq: Sampling interval.
+        n_spikes: Number of isolated outliers.
+        n_steps: Number of level shifts (sensor changes), at evenly spaced dates.
+        n_gaps: Number of missing stretches, one to five days long.
+        seed: Seed of the random generator.
+
+    Returns:
+        Series named `SENSOR` with a `time` index. The dates of the level steps
+        are in `attrs["steps"]`.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, end, freq=freq, inclusive="left", name="time")
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    values = np.full(len(index), 2.0)
+    for period, amplitude in CONSTITUENTS:
+        values += amplitude * np.sin(2 * np.pi * hours / period + rng.uniform(0, 2 * np.pi))
+    values += rng.normal(scale=0.02, size=len(index))
+    steps = np.linspace(0, len(index), n_steps + 2)[1:-1].astype(int)
+    for step in steps:
+        values[step:] += rng.uniform(-1, 1)
+    spikes = rng.choice(len(index), size=min(n_spikes, len(index)), replace=False)
+    values[spikes] += rng.choice([-1, 1], size=len(spikes)) * rng.uniform(2, 10, size=len(spikes))
+    keep = np.ones(len(index), dtype=bool)
+    samples_per_day = int(pd.Timedelta("1D") / pd.Timedelta(freq))
+    for gap_start in rng.choice(len(index), size=n_gaps, replace=False):
+        keep[gap_start : gap_start + rng.integers(1, 6) * samples_per_day] = False
+    sr = pd.Series(values[keep], index=index[keep], name=SENSOR)
+    sr.attrs["steps"] = index[steps].to_list()
+    return sr
+
+
+def synthetic_transformation(
+    sr: pd.Series,
+    *,
+    n_dropped: int = N_DROPPED,
+    n_ranges: int = 16,
+    seed: int = 0,
+) -> C.Transformation:
+    """
+    Return a transformation for `synthetic_series`, shaped like `mins_prs.json`.
+
+    The breakpoints are placed at the level steps of the series.
+
+    Parameters:
+        sr: Series returned by `synthetic_series`.
+        n_dropped: Number of dropped timestamps.
+        n_ranges: Number of dropped date ranges, a few hours each.
+        seed: Seed of the random generator.
+
+    Returns:
+        Transformation of `STATION`/`SENSOR` over the whole series.
+    """
+    rng = np.random.default_rng(seed)
+    index = sr.index
+    dropped = index[np.sort(rng.choice(len(index), size=min(n_dropped, len(index)), replace=False))]
+    range_starts = index[np.sort(rng.choice(len(index), size=n_ranges, replace=False))]
+    return C.Transformation(
+        ioc_code=STATION,
+        sensor=SENSOR,
+        notes="synthetic",
+        start=index[0],
+        end=index[-1],
+        dropped_date_ranges=[(ts, ts + pd.Timedelta(hours=rng.integers(1, 12))) for ts in range_starts],
+        dropped_timestamps=dropped.to_list(),
+        breakpoints=sr.attrs.get("steps", []),
+    )
+
+
+def write_archive(sr: pd.Series, data_dir: Path, station: str = STATION) -> list[Path]:
+    """
+    Write `sr` in the `<data_dir>/<year>/<station>.parquet` layout of `download_year_station`.
+    """
+    paths = []
+    for year, chunk in sr.groupby(sr.index.year):
+        path = data_dir / str(year) / f"{station}.parquet"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        frame = chunk.to_frame()
+        frame.attrs = {}
+        frame.to_parquet(path)
+        paths.append(path)
+    return paths
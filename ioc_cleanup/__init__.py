@@ -1,60 +1,150 @@
 from __future__ import annotations
 
+from ._build import build_clean
+from ._build import load_clean
+from ._cache import SeriesCache
+from ._cache import get_series_cache
+from ._compact import compact_transformation
+from ._compact import compact_transformations
 from ._constants import DETIDE_END
 from ._constants import DETIDE_START
 from ._constants import SIMULATION_END
 from ._constants import SIMULATION_START
 from ._constants import SPLIT_DIR
 from ._constants import TRANSFORMATIONS_DIR
+from ._cube import build_cube
+from ._cube import open_cube
+from ._detide import detide_catalog
+from ._download import download_station_years
+from ._download import download_station_years_async
+from ._events import surge_events
+from ._events import tsunami_events
+from ._harmonics import clear_harmonics
+from ._harmonics import evict_harmonics
+from ._harmonics import list_harmonics
+from ._models import Segment
 from ._models import Transformation
 from ._plots import plot_geographic_coverage
 from ._plots import select_points
+from ._profiling import clear_profiling
+from ._profiling import disable_profiling
+from ._profiling import enable_profiling
+from ._profiling import is_profiling
+from ._profiling import profile_stage
+from ._profiling import profiling_records
+from ._profiling import profiling_summary
+from ._profiling import write_profiling_report
+from ._rules import compile_rules
+from ._rules import Rules
 from ._searvey import download_raw
 from ._searvey import download_year_station
 from ._searvey import get_meta
 from ._searvey import load_station
+from ._searvey import read_manifest
+from ._searvey import refresh_meta
+from ._spikes import detect_spikes
+from ._spikes import find_spikes
+from ._spikes import propose_spikes
+from ._spikes import spike_scores
+from ._standin import StandInServer
 from ._statistics import calc_station_statistics
 from ._statistics import calc_station_statistics_from_json
 from ._statistics import calc_station_statistics_from_path
 from ._statistics import calc_statistics
 from ._statistics import calc_statistics_json
+from ._steps import compare_breakpoints
+from ._steps import detect_breakpoints
+from ._steps import find_breakpoints
 from ._tools import clean
 from ._tools import dump_transformation
+from ._tools import fit_tide
+from ._tools import load_clean_ts
 from ._tools import load_clean_ts_for_year
+from ._tools import load_rules
+from ._tools import load_rules_from_path
+from ._tools import load_surge_ts_for_window
 from ._tools import load_surge_ts_for_year
 from ._tools import load_transformation
 from ._tools import load_transformation_from_path
+from ._tools import load_transformation_header
+from ._tools import merge_selection
 from ._tools import surge
 from ._tools import transform
+from ._waves import extract_waves
 
 
 __all__: list[str] = [
+    "build_clean",
+    "build_cube",
     "calc_station_statistics_from_path",
     "calc_station_statistics_from_json",
     "calc_statistics_json",
     "calc_station_statistics",
     "calc_statistics",
     "clean",
+    "clear_harmonics",
+    "clear_profiling",
+    "compact_transformation",
+    "compare_breakpoints",
+    "compact_transformations",
+    "compile_rules",
     "DETIDE_END",
     "DETIDE_START",
+    "detide_catalog",
+    "detect_breakpoints",
+    "detect_spikes",
+    "disable_profiling",
     "download_raw",
+    "download_station_years",
+    "download_station_years_async",
     "download_year_station",
     "dump_transformation",
+    "enable_profiling",
+    "evict_harmonics",
+    "extract_waves",
+    "find_breakpoints",
+    "find_spikes",
+    "fit_tide",
     "get_meta",
+    "get_series_cache",
+    "is_profiling",
+    "list_harmonics",
+    "load_clean",
+    "load_clean_ts",
     "load_clean_ts_for_year",
+    "load_rules",
+    "load_rules_from_path",
     "load_series_from_json",
     "load_series_from_parquet",
+    "load_surge_ts_for_window",
     "load_surge_ts_for_year",
     "load_station",
     "load_transformation",
     "load_transformation_from_path",
+    "load_transformation_header",
+    "merge_selection",
+    "open_cube",
     "plot_geographic_coverage",
+    "profile_stage",
+    "profiling_records",
+    "profiling_summary",
+    "propose_spikes",
+    "read_manifest",
+    "refresh_meta",
+    "Rules",
+    "Segment",
     "select_points",
+    "spike_scores",
     "SIMULATION_END",
     "SIMULATION_START",
     "SPLIT_DIR",
+    "StandInServer",
+    "SeriesCache",
     "surge",
+    "surge_events",
     "TRANSFORMATIONS_DIR",
     "transform",
+    "tsunami_events",
+    "write_profiling_report",
     "Transformation",
 ]
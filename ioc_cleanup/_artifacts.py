@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import os
+import typing as T
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import _hashing
+from . import _store
+
+# Derived products (surge series, cleaned series, ...) are written as Parquet files whose
+# schema metadata holds a fingerprint of their inputs. A product is up to date when the
+# fingerprint of its current inputs matches the stored one.
+FINGERPRINT_KEY = b"ioc_cleanup.fingerprint"
+INFO_KEY = b"ioc_cleanup.info"
+
+
+def raw_files(station: str, data_dir: Path, start_year: int, end_year: int) -> list[Path]:
+    """
+    Return the raw Parquet files of a station for `[start_year, end_year)`, in either layout.
+    """
+    if _store.is_store(station, data_dir):
+        root = _store.station_dir(station, data_dir)
+        candidates = [root / f"year={year}" / _store.FILENAME for year in range(start_year, end_year)]
+    else:
+        candidates = [data_dir / str(year) / f"{station}.parquet" for year in range(start_year, end_year)]
+    return [path for path in candidates if path.exists()]
+
+
+def fingerprint(raw: T.Iterable[Path], transformation: str | os.PathLike[str], **params: T.Any) -> str:
+    """
+    Fingerprint the inputs of a derived product.
+
+    Raw files are identified by their name, size and modification time, which is
+    cheap for multi-GB trees. The transformation file is identified by its contents.
+
+    Parameters:
+        raw: Raw Parquet files the product is computed from.
+        transformation: Transformation JSON file.
+        params: Any other setting that affects the product (options, resampling, ...).
+
+    Returns:
+        Hex digest of the inputs.
+    """
+    stats = []
+    for path in raw:
+        stat = os.stat(path)
+        stats.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return _hashing.digest_json(
+        {"raw": stats, "transformation": _hashing.digest_file(transformation), "params": params},
+    )
+
+
+def read_fingerprint(path: Path) -> str | None:
+    """
+    Return the fingerprint stored in a product, or `None` if missing or unreadable.
+    """
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowException):
+        return None
+    value = metadata.get(FINGERPRINT_KEY)
+    return value.decode() if value is not None else None
+
+
+def is_fresh(path: Path, expected: str) -> bool:
+    return read_fingerprint(path) == expected
+
+
+def write_series(path: Path, sr: pd.Series, fingerprint: str, **info: T.Any) -> None:
+    """
+    Atomically write a series as a one-column Parquet file tagged with `fingerprint`.
+
+    Parameters:
+        path: Destination.
+        sr: Series to write. Its name is used as the column name.
+        fingerprint: Fingerprint of the inputs, see `fingerprint`.
+        info: Extra JSON serializable metadata.
+    """
+    frame = sr.to_frame(name=str(sr.name))
+    # pyarrow would serialize `attrs` in the pandas metadata; pass what is needed through `info` instead
+    frame.attrs = {}
+    table = pa.Table.from_pandas(frame)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FINGERPRINT_KEY] = fingerprint.encode()
+    metadata[INFO_KEY] = json.dumps(info, default=str).encode()
+    table = table.replace_schema_metadata(metadata)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp, compression=_store.COMPRESSION)
+    os.replace(tmp, path)
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import logging
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import multifutures
+import pandas as pd
+import pyarrow.parquet as pq
+
+from . import _artifacts
+from . import _profiling
+from . import _rules
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+CLEAN_DIR = Path("./clean")
+# Bump whenever the cleaning itself changes, so that every product gets rebuilt
+BUILD_VERSION = 1
+
+
+def clean_path(station: str, sensor: str, out_dir: Path = CLEAN_DIR) -> Path:
+    return out_dir / f"{station}_{sensor}.parquet"
+
+
+def _inputs(path: Path, data_dir: Path) -> tuple[_rules.Rules, list[Path]]:
+    station, _ = path.stem.split("_")
+    rules = _tools.load_rules_from_path(path)
+    first, last = pd.DatetimeIndex([rules.start, rules.end]).year
+    return rules, _artifacts.raw_files(station, data_dir, first, last + 1)
+
+
+def build_station(path: Path, data_dir: Path, out_dir: Path, fingerprint: str) -> str:
+    """
+    Clean the raw data of one transformation and write them to `out_dir`.
+
+    Returns:
+        `"built"`, or `"empty"` if there are no raw data in the transformation window.
+    """
+    station, sensor = path.stem.split("_")
+    rules, _ = _inputs(path, data_dir)
+    bounds = pd.DatetimeIndex([rules.start, rules.end])
+    df = _searvey.load_station(
+        station,
+        data_dir,
+        bounds.year[0],
+        bounds.year[1] + 1,
+        columns=[sensor],
+        start=bounds[0],
+        end=bounds[1],
+    )
+    if df.empty or sensor not in df.columns:
+        return "empty"
+    sr = _tools.transform(df, rules)[sensor]
+    breakpoints = [ts.isoformat() for ts in sr.attrs["breakpoints"]]
+    _artifacts.write_series(clean_path(station, sensor, out_dir), sr, fingerprint, breakpoints=breakpoints)
+    return "built"
+
+
+def build_clean(
+    paths: abc.Iterable[Path] | None = None,
+    data_dir: Path = Path("./data"),
+    out_dir: Path = CLEAN_DIR,
+    *,
+    force: bool = False,
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    progress_bar: bool = False,
+) -> pd.DataFrame:
+    """
+    Materialize the cleaned series of the catalog as `<out_dir>/<ioc_code>_<sensor>.parquet`.
+
+    Every output is tagged with a fingerprint of its inputs: the raw files it
+    is built from and the content of the transformation JSON. Only the outputs
+    whose inputs changed are rebuilt, so after editing one transformation a
+    rebuild only cleans that station.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`.
+        data_dir: Base directory of the raw data.
+        out_dir: Output directory.
+        force: Rebuild every output, even if it is up to date.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+        progress_bar: Whether to display a progress bar.
+
+    Returns:
+        DataFrame with one row per transformation and its status: `built`,
+        `skipped` (up to date), `no data`, `empty` or `failed`.
+    """
+    if paths is None:
+        paths = _tools.get_transformation_paths()
+    rows: list[dict[str, T.Any]] = []
+    func_kwargs = []
+    for path in map(Path, paths):
+        station, sensor = path.stem.split("_")
+        out = clean_path(station, sensor, out_dir)
+        row: dict[str, T.Any] = {"station": station, "sensor": sensor, "path": out}
+        rows.append(row)
+        _, raw = _inputs(path, data_dir)
+        fingerprint = _artifacts.fingerprint(raw, path, version=BUILD_VERSION)
+        if not raw:
+            row["status"] = "no data"
+        elif not force and _artifacts.is_fresh(out, fingerprint):
+            row["status"] = "skipped"
+        else:
+            row["status"] = "pending"
+            func_kwargs.append({"path": path, "data_dir": data_dir, "out_dir": out_dir, "fingerprint": fingerprint})
+
+    skipped = sum(row["status"] == "skipped" for row in rows)
+    logger.info("Building %d cleaned series, %d up to date", len(func_kwargs), skipped)
+    results = multifutures.multiprocess(
+        build_station,
+        func_kwargs,
+        max_workers=max_workers,
+        executor=executor,
+        check=False,
+        progress_bar=progress_bar,
+    )
+    statuses = {}
+    for result in results:
+        path = T.cast(dict[str, T.Any], result.kwargs)["path"]
+        if result.exception is not None:
+            logger.error("Building failed for %s: %s", path.stem, result.exception)
+            statuses[path.stem] = ("failed", str(result.exception))
+        else:
+            statuses[path.stem] = (result.result, "")
+    for row in rows:
+        key = f"{row['station']}_{row['sensor']}"
+        if key in statuses:
+            row["status"], row["error"] = statuses[key]
+    _profiling.log_summary()
+    return pd.DataFrame(rows, columns=["station", "sensor", "status", "path", "error"])
+
+
+def load_clean(station: str, sensor: str, clean_dir: Path = CLEAN_DIR) -> pd.Series:
+    """
+    Load a cleaned series written by `build_clean`.
+
+    Parameters:
+        station: IOC station code.
+        sensor: Sensor identifier.
+        clean_dir: Directory of the cleaned series.
+
+    Returns:
+        The cleaned series, as returned by `clean`: removed samples are NaN and
+        the breakpoints are in its attributes.
+    """
+    path = clean_path(station, sensor, clean_dir)
+    table = pq.read_table(path)
+    info = json.loads((table.schema.metadata or {}).get(_artifacts.INFO_KEY, b"{}"))
+    sr = table.to_pandas()[sensor]
+    sr.attrs["breakpoints"] = [pd.Timestamp(ts) for ts in info.get("breakpoints", [])]
+    sr.attrs["status"] = "transformed"
+    return T.cast(pd.Series, sr)
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import collections
+import logging
+import threading
+import typing as T
+from pathlib import Path
+
+import pandas as pd
+
+from . import _constants
+from . import _rules
+from . import _searvey
+from . import _store
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+PandasObject = T.TypeVar("PandasObject", pd.Series, pd.DataFrame)
+
+
+def nbytes(obj: pd.Series | pd.DataFrame) -> int:
+    """
+    Return the memory used by `obj`, including its index.
+    """
+    usage = obj.memory_usage(index=True, deep=True)
+    return int(usage if isinstance(usage, int) else usage.sum())
+
+
+class SeriesCache:
+    """
+    Thread-safe LRU cache of pandas objects, bounded by their size in bytes.
+
+    When an entry would push the total size over `max_bytes`, the least
+    recently used entries are evicted first. Entries larger than `max_bytes`
+    are returned without being cached. Concurrent requests of a missing key
+    wait for a single load instead of repeating it.
+
+    The cached objects are shared between all the callers: they must not be
+    modified in place.
+
+    Parameters:
+        max_bytes: Maximum total size of the entries, see `nbytes`.
+    """
+
+    def __init__(self, max_bytes: int = _constants.SERIES_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: collections.OrderedDict[T.Hashable, tuple[T.Any, int]] = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # the lock of every key being loaded, and the number of threads holding or waiting for it
+        self._loading: dict[T.Hashable, threading.Lock] = {}
+        self._waiting: collections.Counter[T.Hashable] = collections.Counter()
+
+    def _lookup(self, key: T.Hashable) -> tuple[bool, T.Any]:
+        # must be called with the lock held
+        if key not in self._entries:
+            return False, None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, self._entries[key][0]
+
+    def _store(self, key: T.Hashable, value: T.Any) -> None:
+        size = nbytes(value)
+        with self._lock:
+            if size > self.max_bytes:
+                logger.debug("Not caching %s: %d bytes", key, size)
+                return
+            while self._bytes + size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+    def get(self, key: T.Hashable, load: T.Callable[[], PandasObject]) -> PandasObject:
+        """
+        Return the entry of `key`, calling `load()` to create it if it is missing.
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return T.cast(PandasObject, value)
+            loading = self._loading.setdefault(key, threading.Lock())
+            self._waiting[key] += 1
+        try:
+            with loading:
+                with self._lock:
+                    # another thread may have loaded it meanwhile
+                    found, value = self._lookup(key)
+                    if found:
+                        return T.cast(PandasObject, value)
+                    self.misses += 1
+                loaded = load()
+                self._store(key, loaded)
+                return loaded
+        finally:
+            with self._lock:
+                # the last thread out removes the lock, so that later requests never load alongside a waiting one
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+                    del self._loading[key]
+
+    def clear(self) -> None:
+        """
+        Drop all the entries and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of `entries`, their size in `bytes`, `max_bytes` and
+        the `hits`, `misses` and `evictions` so far.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_SERIES_CACHE = SeriesCache()
+
+
+def get_series_cache() -> SeriesCache:
+    """
+    Return the process-wide cache of the dashboard, sized by `$IOC_CLEANUP_SERIES_CACHE_BYTES` (1 GiB by default).
+    """
+    return _SERIES_CACHE
+
+
+def _mtime(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _data_mtimes(station: str, year: int, folder: Path) -> tuple[int | None, int | None]:
+    # either layout of `load_station`
+    return (
+        _mtime(folder / str(year) / f"{station}.parquet"),
+        _mtime(_store.station_dir(station, folder) / f"year={year}" / _store.FILENAME),
+    )
+
+
+def _transformation_mtime(station: str, sensor: str) -> int | None:
+    return _mtime(_tools._transformation_path(station, sensor))
+
+
+def load_raw_year(station: str, sensor: str, year: int, folder: Path) -> pd.DataFrame:
+    """
+    Cached `load_station` of one sensor and year, keyed by the modification times of the data files.
+    """
+    start, end = pd.Timestamp(f"{year}-01-01"), pd.Timestamp(f"{year + 1}-01-01") - pd.Timedelta(1, "ns")
+    key = ("raw", station, sensor, year, folder, _data_mtimes(station, year, folder))
+    return _SERIES_CACHE.get(
+        key,
+        lambda: _searvey.load_station(station, folder, year, year + 1, columns=[sensor], start=start, end=end),
+    )
+
+
+def _clean_year(station: str, sensor: str, year: int, folder: Path, *, segments: bool = True) -> pd.Series:
+    start, end = pd.Timestamp(f"{year}-01-01"), pd.Timestamp(f"{year + 1}-01-01") - pd.Timedelta(1, "ns")
+    empty = pd.Series(dtype=float, index=pd.DatetimeIndex([], name="time"), name=sensor)
+    rules = _tools._window_rules(station, sensor, start, end)
+    if not segments:
+        rules = _rules.without_segments(rules)
+    if rules.start > rules.end:
+        return empty
+    raw = load_raw_year(station, sensor, year, folder)
+    if raw.empty or sensor not in raw.columns:
+        return empty
+    return _tools.transform(raw, rules)[sensor].dropna()
+
+
+def load_clean_year(station: str, sensor: str, year: int, folder: Path, *, demean: bool) -> pd.Series:
+    """
+    Cached `load_clean_ts_for_year`, keyed by the modification times of the transformation and the data files.
+
+    The demeaned series is derived from the cached cleaned one, so toggling
+    `demean` does not clean the data again.
+    """
+    mtimes = (_transformation_mtime(station, sensor), _data_mtimes(station, year, folder))
+    if demean:
+        return _SERIES_CACHE.get(
+            ("demeaned", station, sensor, year, folder, mtimes),
+            lambda: _tools.demean_signal(load_clean_year(station, sensor, year, folder, demean=False)),
+        )
+    return _SERIES_CACHE.get(
+        ("clean", station, sensor, year, folder, mtimes),
+        lambda: _clean_year(station, sensor, year, folder),
+    )
+
+
+def load_uncorrected_year(station: str, sensor: str, year: int, folder: Path) -> pd.Series:
+    """
+    Cached cleaned series without the segment corrections, keyed like `load_clean_year`.
+
+    The dashboard computes the offset of a new segment on it, so that the
+    corrections already in the transformation do not cancel it out.
+    """
+    mtimes = (_transformation_mtime(station, sensor), _data_mtimes(station, year, folder))
+    return _SERIES_CACHE.get(
+        ("uncorrected", station, sensor, year, folder, mtimes),
+        lambda: _clean_year(station, sensor, year, folder, segments=False),
+    )
+
+
+def load_surge_year(station: str, sensor: str, year: int, folder: Path, *, demean: bool) -> pd.Series:
+    """
+    Cached `load_surge_ts_for_year`, keyed like `load_clean_year`.
+    """
+    mtimes = (_transformation_mtime(station, sensor), _data_mtimes(station, year, folder))
+    return _SERIES_CACHE.get(
+        ("surge", station, sensor, year, folder, demean, mtimes),
+        lambda: _tools._detide_year(load_clean_year(station, sensor, year, folder, demean=demean), station, sensor),
+    )
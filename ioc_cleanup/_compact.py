@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import multifutures
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from . import _models
+from . import _profiling
+from . import _rules
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+COMPACT_COLUMNS = [
+    "station",
+    "sensor",
+    "status",
+    "interval",
+    "timestamps_before",
+    "timestamps_after",
+    "ranges_added",
+    "bytes_before",
+    "bytes_after",
+    "error",
+]
+
+
+def compact_transformation(
+    trans: _models.Transformation,
+    interval: str | pd.Timedelta,
+    *,
+    times: npt.ArrayLike | None = None,
+    min_run: int = _rules.COMPACT_MIN_RUN,
+) -> _models.Transformation:
+    """
+    Fold the runs of consecutive `dropped_timestamps` into `dropped_date_ranges`.
+
+    A run is a sequence of dropped timestamps that are exactly `interval` apart.
+    Since the ranges are inclusive, they drop the same samples as long as the
+    data have no sample between the timestamps of a run. Pass the sample `times`
+    of the station to guarantee it: runs are then also split wherever a sample
+    lies in between.
+
+    Parameters:
+        trans: Transformation to compact.
+        interval: Sampling interval of the station, e.g. `"1min"`.
+        times: Sample times of the raw data.
+        min_run: Minimum number of timestamps of a run to fold.
+
+    Returns:
+        A copy of `trans`. The new ranges are merged with the existing ones,
+        sorted by start.
+    """
+    step = pd.Timedelta(interval).value
+    sample_times = None if times is None else np.sort(_rules.to_ns(np.asarray(times)))
+    ranges, remaining = _rules.compact_timestamps(
+        _rules.to_ns(trans.dropped_timestamps),
+        step,
+        times=sample_times,
+        min_run=min_run,
+    )
+    if len(ranges) == 0:
+        return trans.model_copy()
+    added = list(zip(_rules.to_datetimes(ranges[:, 0]), _rules.to_datetimes(ranges[:, 1]), strict=True))
+    return trans.model_copy(
+        update={
+            "dropped_date_ranges": sorted(
+                [*trans.dropped_date_ranges, *added],
+                key=lambda pair: _rules.to_ns([pair[0]])[0],
+            ),
+            "dropped_timestamps": _rules.to_datetimes(remaining),
+        },
+    )
+
+
+def _main_interval(times: npt.NDArray[np.int64]) -> int | None:
+    steps = np.diff(times)
+    steps = steps[steps > 0]
+    if len(steps) == 0:
+        return None
+    values, counts = np.unique(steps, return_counts=True)
+    return int(values[np.argmax(counts)])
+
+
+def compact_station(path: Path, data_dir: Path, *, write: bool, min_run: int) -> dict[str, T.Any]:
+    """
+    Compact one transformation against the raw data of its station.
+
+    The transformation is only rewritten (with `write`) if cleaning the raw data
+    gives identical results before and after the compaction.
+
+    Returns:
+        One row of the `compact_transformations` summary.
+    """
+    station, sensor = path.stem.split("_")
+    row: dict[str, T.Any] = {"station": station, "sensor": sensor, "bytes_before": path.stat().st_size}
+    trans = _tools.load_transformation_from_path(path)
+    row["timestamps_before"] = row["timestamps_after"] = len(trans.dropped_timestamps)
+    row["ranges_added"] = 0
+    bounds = pd.DatetimeIndex([trans.start, trans.end])
+    df = _searvey.load_station(
+        station,
+        data_dir,
+        bounds.year[0],
+        bounds.year[1] + 1,
+        columns=[sensor],
+        start=bounds[0],
+        end=bounds[1],
+    )
+    if df.empty or sensor not in df.columns:
+        return {**row, "status": "no data"}
+    times = _rules.to_ns(df.sort_index().index)
+    interval = _main_interval(times)
+    if interval is None:
+        return {**row, "status": "no data"}
+    row["interval"] = pd.Timedelta(interval)
+    with _profiling.profile_stage("compact", station=station, rows=len(trans.dropped_timestamps)):
+        compacted = compact_transformation(trans, row["interval"], times=times, min_run=min_run)
+    row["timestamps_after"] = len(compacted.dropped_timestamps)
+    row["ranges_added"] = len(compacted.dropped_date_ranges) - len(trans.dropped_date_ranges)
+    if row["ranges_added"] == 0:
+        return {**row, "status": "unchanged"}
+    before = _tools.transform(df, trans)[sensor]
+    after = _tools.transform(df, compacted)[sensor]
+    if not before.equals(after):
+        logger.error("Compacting %s changes the cleaned series, keeping it as is", path.name)
+        return {**row, "status": "mismatch"}
+    # the size of the file written by `dump_transformation`
+    row["bytes_after"] = len(compacted.model_dump_json(indent=2, round_trip=True).encode()) + 1
+    if write:
+        _tools.dump_transformation(compacted, path.parent)
+    return {**row, "status": "compacted"}
+
+
+def compact_transformations(
+    paths: abc.Iterable[Path] | None = None,
+    data_dir: Path = Path("./data"),
+    *,
+    write: bool = False,
+    min_run: int = _rules.COMPACT_MIN_RUN,
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    progress_bar: bool = False,
+) -> pd.DataFrame:
+    """
+    Fold the consecutive `dropped_timestamps` of the catalog into `dropped_date_ranges`.
+
+    The sampling interval of every station is the most common one of its raw
+    data, and runs are split wherever the raw data have a sample in between, so
+    the compacted rules drop exactly the same samples. This is verified by
+    cleaning the raw data with both versions; transformations whose cleaned
+    series would change are left alone, as are the ones without raw data.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`.
+        data_dir: Base directory of the raw data.
+        write: Rewrite the compacted JSON files. Otherwise only report what would change.
+        min_run: Minimum number of timestamps of a run to fold.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+        progress_bar: Whether to display a progress bar.
+
+    Returns:
+        DataFrame with one row per transformation and its status: `compacted`,
+        `unchanged`, `no data`, `mismatch` or `failed`, the number of dropped
+        timestamps before and after, the number of ranges added and the file
+        sizes before and after.
+    """
+    if paths is None:
+        paths = _tools.get_transformation_paths()
+    func_kwargs = [
+        {"path": path, "data_dir": data_dir, "write": write, "min_run": min_run} for path in map(Path, paths)
+    ]
+    results = multifutures.multiprocess(
+        compact_station,
+        func_kwargs,
+        max_workers=max_workers,
+        executor=executor,
+        check=False,
+        progress_bar=progress_bar,
+    )
+    rows = []
+    for result in results:
+        path = T.cast(dict[str, T.Any], result.kwargs)["path"]
+        if result.exception is not None:
+            logger.error("Compacting failed for %s: %s", path.stem, result.exception)
+            station, sensor = path.stem.split("_")
+            rows.append({"station": station, "sensor": sensor, "status": "failed", "error": str(result.exception)})
+        else:
+            rows.append({**result.result, "error": ""})
+    _profiling.log_summary()
+    summary = pd.DataFrame(rows, columns=COMPACT_COLUMNS)
+    return summary.sort_values(["station", "sensor"], ignore_index=True)
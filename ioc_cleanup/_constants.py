@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 import pathlib
 
 import pandas as pd
@@ -7,6 +8,21 @@ import pandas as pd
 SPLIT_DIR = pathlib.Path("split")
 TRANSFORMATIONS_DIR = pathlib.Path("transformations")
 
+# Snapshot of the IOC station metadata, see `get_meta()`
+META_PATH = pathlib.Path(
+    os.environ.get("IOC_CLEANUP_META_PATH", pathlib.Path.home() / ".cache" / "ioc_cleanup" / "ioc_meta.parquet"),
+)
+META_TTL = pd.Timedelta(days=30)
+
+# Fitted tidal harmonics, see `_harmonics`
+HARMONICS_DIR = pathlib.Path(
+    os.environ.get("IOC_CLEANUP_HARMONICS_DIR", pathlib.Path.home() / ".cache" / "ioc_cleanup" / "harmonics"),
+)
+HARMONICS_MAX_BYTES = 512 * 1024 * 1024
+
+# Loaded, cleaned and detided series kept in memory by the dashboard, see `_cache`
+SERIES_CACHE_MAX_BYTES = int(os.environ.get("IOC_CLEANUP_SERIES_CACHE_BYTES", str(1024 * 1024 * 1024)))
+
 DETIDE_START = pd.Timestamp("2020-01-01T00:00:00")
 DETIDE_END = pd.Timestamp("2025-12-31T23:59:59")
 
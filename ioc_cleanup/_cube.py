@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import dask.array as da
+import multifutures
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import xarray as xr
+
+from . import _build
+from . import _constants
+from . import _detide
+from . import _profiling
+from . import _rules
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+CUBE_PATH = Path("./cube.zarr")
+VARIABLES = ("clean", "surge")
+_META_COLUMNS = ("lon", "lat", "country", "location")
+
+
+def to_grid(sr: pd.Series, start: pd.Timestamp, freq: pd.Timedelta, size: int) -> npt.NDArray[np.float32]:
+    """
+    Average a time series onto the regular grid `start + k * freq`, `0 <= k < size`.
+
+    Every sample falls in the bin that starts at or before it; bins without
+    any valid sample are NaN.
+    """
+    if sr.empty:
+        return np.full(size, np.nan, dtype=np.float32)
+    bins = (_rules.to_ns(sr.index) - start.value) // freq.value
+    values = sr.to_numpy(dtype=np.float64)
+    valid = (bins >= 0) & (bins < size) & ~np.isnan(values)
+    sums = np.bincount(bins[valid], weights=values[valid], minlength=size)
+    counts = np.bincount(bins[valid], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts).astype(np.float32)
+
+
+def _load_surge(station: str, sensor: str, surge_dir: Path, start: pd.Timestamp, end: pd.Timestamp) -> pd.Series:
+    paths = [_detide.surge_path(station, sensor, year, surge_dir) for year in range(start.year, end.year + 1)]
+    years = [pd.read_parquet(path)[sensor] for path in paths if path.exists()]
+    return pd.concat(years) if years else pd.Series(dtype=float)
+
+
+def _write_block(
+    dest: Path,
+    labels: list[str],
+    *,
+    offset: int,
+    time: pd.DatetimeIndex,
+    freq: str,
+    clean_dir: Path,
+    surge_dir: Path,
+) -> int:
+    step = pd.Timedelta(freq)
+    data = {name: np.full((len(labels), len(time)), np.nan, dtype=np.float32) for name in VARIABLES}
+    for row, label in enumerate(labels):
+        station, sensor = label.split("_")
+        if _build.clean_path(station, sensor, clean_dir).exists():
+            clean = _build.load_clean(station, sensor, clean_dir)
+            data["clean"][row] = to_grid(clean, time[0], step, len(time))
+        surge = _load_surge(station, sensor, surge_dir, time[0], time[-1])
+        data["surge"][row] = to_grid(surge, time[0], step, len(time))
+    block = xr.Dataset({name: (("station", "time"), values) for name, values in data.items()})
+    region = {"station": slice(offset, offset + len(labels)), "time": slice(None)}
+    block.to_zarr(dest, region=region, consolidated=False)
+    return len(labels)
+
+
+def build_cube(
+    paths: abc.Iterable[Path] | None = None,
+    clean_dir: Path = _build.CLEAN_DIR,
+    surge_dir: Path = _detide.SURGE_DIR,
+    dest: Path = CUBE_PATH,
+    *,
+    start: pd.Timestamp = _constants.DETIDE_START,
+    end: pd.Timestamp = _constants.DETIDE_END,
+    freq: str = f"{_tools.RESAMPLE}min",
+    meta: pd.DataFrame | None = None,
+    station_chunk: int = 16,
+    time_chunk: str = "30D",
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+) -> Path:
+    """
+    Export the cleaned and surge series of the catalog to a Zarr dataset.
+
+    The dataset has a `clean` and a `surge` variable with dimensions
+    `(station, time)`, where `station` is `<ioc_code>_<sensor>` and `time` is a
+    regular axis with step `freq` (samples are averaged per step). The station
+    coordinates (`ioc_code`, `sensor`, `lon`, `lat`, `country`, `location`) come
+    from `get_meta()`. Blocks of `station_chunk` stations are written in
+    parallel, so memory usage does not grow with the size of the catalog.
+
+    The inputs are the products of `build_clean` and `detide_catalog`; stations
+    without them are left as NaN.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`.
+        clean_dir: Directory of the cleaned series, see `build_clean`.
+        surge_dir: Directory of the surge series, see `detide_catalog`.
+        dest: Path of the Zarr store. It is overwritten.
+        start: Start of the time axis.
+        end: End of the time axis.
+        freq: Step of the time axis, e.g. `"1min"`.
+        meta: Station metadata. Defaults to `get_meta()`.
+        station_chunk: Number of stations per Zarr chunk.
+        time_chunk: Duration of a Zarr chunk along time.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+
+    Returns:
+        `dest`.
+    """
+    if paths is None:
+        paths = _tools.get_transformation_paths()
+    labels = sorted(Path(path).stem for path in paths)
+    if meta is None:
+        meta = _searvey.get_meta()
+    time = pd.date_range(start, end, freq=freq)
+    chunks = (station_chunk, max(1, pd.Timedelta(time_chunk).value // pd.Timedelta(freq).value))
+    ioc_codes, sensors = zip(*(label.split("_") for label in labels), strict=True) if labels else ((), ())
+    station_meta = pd.DataFrame(meta).drop_duplicates("ioc_code").set_index("ioc_code").reindex(list(ioc_codes))
+    # Strings are stored as variable-length strings, which is the only string type specified by Zarr v3
+    coords: dict[str, T.Any] = {
+        "station": np.array(labels, dtype=object),
+        "time": time,
+        "ioc_code": ("station", np.array(ioc_codes, dtype=object)),
+        "sensor": ("station", np.array(sensors, dtype=object)),
+    }
+    for column in _META_COLUMNS:
+        values = station_meta[column].to_numpy() if column in station_meta else np.full(len(labels), np.nan)
+        if column in ("lon", "lat"):
+            coords[column] = ("station", values.astype(float))
+        else:
+            coords[column] = ("station", np.array([str(value) for value in values], dtype=object))
+    shape = (len(labels), len(time))
+    empty = da.full(shape, np.nan, dtype=np.float32, chunks=chunks)  # type: ignore[no-untyped-call]
+    template = xr.Dataset(dict.fromkeys(VARIABLES, (("station", "time"), empty)), coords=coords)
+    template.attrs = {"freq": freq, "source": "ioc_cleanup"}
+    # Only the metadata and the coordinates are written here, the blocks fill in the data
+    template.to_zarr(dest, mode="w", compute=False, consolidated=False)
+
+    func_kwargs = [
+        {
+            "dest": dest,
+            "labels": labels[offset : offset + station_chunk],
+            "offset": offset,
+            "time": time,
+            "freq": freq,
+            "clean_dir": clean_dir,
+            "surge_dir": surge_dir,
+        }
+        for offset in range(0, len(labels), station_chunk)
+    ]
+    multifutures.multiprocess(_write_block, func_kwargs, max_workers=max_workers, executor=executor, check=True)
+    logger.info("Wrote %d stations x %d timestamps to %s", *shape, dest)
+    _profiling.log_summary()
+    return dest
+
+
+def open_cube(path: Path = CUBE_PATH) -> xr.Dataset:
+    """
+    Lazily open the dataset written by `build_cube`.
+
+    Slicing, e.g. `open_cube().surge.sel(time=slice("2025-07-29", "2025-08-03"))`,
+    only reads the chunks that overlap the selection.
+    """
+    return T.cast(xr.Dataset, xr.open_zarr(path, consolidated=False))
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import multifutures
+import pandas as pd
+
+from . import _artifacts
+from . import _constants
+from . import _profiling
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+SURGE_DIR = Path("./surge")
+_BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+@contextlib.contextmanager
+def _single_threaded_blas() -> abc.Iterator[None]:
+    # Worker processes are spawned while this is active and inherit the environment. Without it,
+    # every worker would start one BLAS thread per core and the pool would not scale with cores.
+    previous = {name: os.environ.get(name) for name in _BLAS_THREAD_VARS}
+    os.environ.update(dict.fromkeys(_BLAS_THREAD_VARS, "1"))
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def surge_path(station: str, sensor: str, year: int, out_dir: Path = SURGE_DIR) -> Path:
+    return out_dir / str(year) / f"{station}_{sensor}.parquet"
+
+
+def detide_station_year(
+    station: str,
+    sensor: str,
+    year: int,
+    *,
+    path: Path,
+    lat: float,
+    data_dir: Path,
+    out_dir: Path,
+    fingerprint: str,
+    demean: bool,
+) -> str:
+    """
+    Compute the surge of one station sensor for one year, cleaned with the
+    transformation at `path`, and write it to `out_dir`.
+
+    Returns:
+        `"computed"`, or `"empty"` if there is no clean data for that year.
+    """
+    clean = _tools.load_clean_ts_for_year(station, sensor, year, data_dir, demean=demean, path=path)
+    if clean.empty:
+        return "empty"
+    opts = {**_tools.OPTS, "lat": lat, "verbose": False}
+    surge = _tools.surge(clean, opts, _tools.RESAMPLE).rename(sensor)
+    path = surge_path(station, sensor, year, out_dir)
+    _artifacts.write_series(path, surge, fingerprint, station=station, sensor=sensor, year=year, demean=demean)
+    return "computed"
+
+
+def detide_catalog(
+    paths: abc.Iterable[Path] | None = None,
+    data_dir: Path = Path("./data"),
+    out_dir: Path = SURGE_DIR,
+    years: abc.Iterable[int] = range(_constants.DETIDE_START.year, _constants.DETIDE_END.year + 1),
+    *,
+    demean: bool = True,
+    force: bool = False,
+    meta: pd.DataFrame | None = None,
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    progress_bar: bool = False,
+) -> pd.DataFrame:
+    """
+    Detide every station sensor of the catalog, one year per job, over a process pool.
+
+    Each job writes `<out_dir>/<year>/<ioc_code>_<sensor>.parquet` as soon as it
+    finishes. The file is tagged with a fingerprint of its inputs (raw files,
+    transformation, options), and jobs whose output is already up to date are
+    not submitted at all. An interrupted run therefore resumes where it stopped,
+    and a rerun after editing one transformation only recomputes that station.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`,
+            except those marked as `skip`.
+        data_dir: Base directory of the raw data.
+        out_dir: Output directory.
+        years: Years to detide.
+        demean: Whether to demean the signal between breakpoints.
+        force: Recompute every job, even if its output is up to date.
+        meta: Station metadata, used for the latitudes. Defaults to `get_meta()`.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+        progress_bar: Whether to display a progress bar.
+
+    Returns:
+        DataFrame with one row per job and its status: `computed`, `skipped`
+        (output up to date), `no data`, `no meta` (station missing from `meta`),
+        `empty` or `failed`.
+    """
+    if paths is None:
+        paths = [path for path in _tools.get_transformation_paths() if not _tools.load_transformation_header(path).skip]
+    if meta is None:
+        meta = _searvey.get_meta()
+    lats = dict(zip(meta.ioc_code, meta.lat, strict=True))
+    opts = {key: value for key, value in _tools.OPTS.items() if key not in ("lat", "verbose")}
+
+    rows: list[dict[str, T.Any]] = []
+    jobs: list[tuple[int, dict[str, T.Any]]] = []
+    for path in paths:
+        station, sensor = Path(path).stem.split("_")
+        for year in years:
+            out = surge_path(station, sensor, year, out_dir)
+            row: dict[str, T.Any] = {"station": station, "sensor": sensor, "year": year, "path": out}
+            rows.append(row)
+            raw = _artifacts.raw_files(station, data_dir, year, year + 1)
+            if not raw:
+                row["status"] = "no data"
+                continue
+            lat = lats.get(station)
+            if lat is None:
+                # the latitude is required by the tidal analysis
+                row["status"] = "no meta"
+                continue
+            fingerprint = _artifacts.fingerprint(
+                raw,
+                path,
+                year=year,
+                demean=demean,
+                opts=opts,
+                rsmp=_tools.RESAMPLE,
+                lat=lat,
+            )
+            if not force and _artifacts.is_fresh(out, fingerprint):
+                row["status"] = "skipped"
+                continue
+            size = sum(file.stat().st_size for file in raw)
+            kwargs = {
+                "station": station,
+                "sensor": sensor,
+                "year": year,
+                "path": Path(path),
+                "lat": lat,
+                "data_dir": data_dir,
+                "out_dir": out_dir,
+                "fingerprint": fingerprint,
+                "demean": demean,
+            }
+            jobs.append((size, kwargs))
+            row["status"] = "pending"
+
+    # Largest inputs first, so that the pool is not left waiting for a single big station at the end
+    func_kwargs = [kwargs for _, kwargs in sorted(jobs, key=lambda job: job[0], reverse=True)]
+    logger.info("Detiding %d jobs, %d up to date", len(func_kwargs), sum(r["status"] == "skipped" for r in rows))
+    with _single_threaded_blas():
+        results = multifutures.multiprocess(
+            detide_station_year,
+            func_kwargs,
+            max_workers=max_workers,
+            executor=executor,
+            check=False,
+            progress_bar=progress_bar,
+        )
+
+    statuses = {}
+    for result in results:
+        kwargs = T.cast(dict[str, T.Any], result.kwargs)
+        key = (kwargs["station"], kwargs["sensor"], kwargs["year"])
+        if result.exception is not None:
+            logger.error("Detiding failed for %s: %s", key, result.exception)
+            statuses[key] = ("failed", str(result.exception))
+        else:
+            statuses[key] = (result.result, "")
+    for row in rows:
+        key = (row["station"], row["sensor"], row["year"])
+        if key in statuses:
+            row["status"], row["error"] = statuses[key]
+    _profiling.log_summary()
+    return pd.DataFrame(rows, columns=["station", "sensor", "year", "status", "path", "error"])
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import io
+import logging
+import random
+import time
+import typing as T
+from collections import abc
+from concurrent import futures
+from pathlib import Path
+
+import httpx
+import pandas as pd
+from searvey import _ioc_api
+
+from . import _profiling
+from . import _searvey
+
+logger = logging.getLogger(__name__)
+
+# Requests in flight at once
+DOWNLOAD_CONCURRENCY = 8
+# Requests per second to every host, like the searvey default
+DOWNLOAD_RATE = 5.0
+DOWNLOAD_RETRIES = 5
+# In seconds, doubled after every failed attempt
+DOWNLOAD_BACKOFF = 1.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DOWNLOAD_COLUMNS = [
+    "station",
+    "year",
+    "status",
+    "start",
+    "end",
+    "requests",
+    "retries",
+    "rows",
+    "bytes",
+    "seconds",
+    "error",
+]
+
+
+class _HostRateLimit:
+    """
+    Space out the requests to every host by `1 / rate` seconds.
+    """
+
+    def __init__(self, rate: float | None) -> None:
+        self.interval = 0.0 if not rate else 1 / rate
+        self._next: dict[str, float] = {}
+
+    async def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        at = max(now, self._next.get(host, now))
+        self._next[host] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+def _retry_delay(response: httpx.Response | None, attempt: int, backoff: float) -> float:
+    # honour the Retry-After of a 429/503, else back off exponentially with jitter
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return float(response.headers["Retry-After"])
+    return backoff * 2.0**attempt * random.uniform(0.5, 1.5)  # noqa: S311
+
+
+async def _fetch(
+    client: httpx.AsyncClient,
+    url: httpx.URL,
+    *,
+    slots: asyncio.Semaphore,
+    rate_limit: _HostRateLimit,
+    retries: int,
+    backoff: float,
+) -> tuple[str, int]:
+    """
+    Return the body of `url` and the number of attempts it took.
+    """
+    attempt = 0
+    while True:
+        response = None
+        # the slot is taken first, so that the requests leave no faster than the rate limit
+        async with slots:
+            await rate_limit.wait(url.host)
+            try:
+                response = await client.get(url)
+            except httpx.TransportError as e:
+                if attempt == retries:
+                    raise
+                logger.warning("Retrying %s after: %r", url, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return response.text, attempt + 1
+                logger.warning("Retrying %s after: HTTP %d", url, response.status_code)
+        await asyncio.sleep(_retry_delay(response, attempt, backoff))
+        attempt += 1
+
+
+def _parse_and_store(
+    texts: list[str],
+    station: str,
+    year: int,
+    data_folder: Path,
+    *,
+    partitioned: bool,
+    existing: pd.DataFrame,
+) -> int:
+    """
+    Parse the responses of one station-year like `download_raw` and store them with `_store_year`.
+
+    Returns:
+        The number of rows stored.
+    """
+    with _profiling.profile_stage("parse", station=station) as stage:
+        # stations without data answer with `[]` or `[{"error": ...}]`
+        texts = [text for text in texts if not text.startswith(("[]", '[{"error"'))]
+        frames = [_ioc_api._parse_json(io.StringIO(text), station) for text in texts]
+        if frames:
+            df = pd.concat(frames).sort_index()
+            df = df[~df.index.duplicated()]
+        else:
+            df = pd.DataFrame(columns=["time"], dtype="datetime64[ns]").set_index("time")
+        stage.rows = len(df)
+    df = _searvey._store_year(df, station, year, data_folder, partitioned=partitioned, existing=existing)
+    return len(df)
+
+
+async def _download_station_year(
+    client: httpx.AsyncClient,
+    station: str,
+    year: int,
+    data_folder: Path,
+    *,
+    base_url: httpx.URL | None,
+    partitioned: bool,
+    incremental: bool,
+    slots: asyncio.Semaphore,
+    rate_limit: _HostRateLimit,
+    retries: int,
+    backoff: float,
+    parse_executor: futures.Executor | None,
+) -> dict[str, T.Any]:
+    began = time.perf_counter()
+    row: dict[str, T.Any] = {"station": station, "year": year, "requests": 0, "retries": 0, "rows": 0, "bytes": 0}
+    start, end, existing = await asyncio.to_thread(
+        _searvey._requested_span,
+        station,
+        year,
+        data_folder,
+        partitioned=partitioned,
+        incremental=incremental,
+    )
+    row.update(start=start, end=end)
+    if start >= end:
+        logger.info("  %s for %d is up to date", station, year)
+        return {**row, "status": "up to date", "seconds": time.perf_counter() - began}
+    # the same 30-day requests as `download_raw`
+    urls = [httpx.URL(url) for url in _ioc_api._generate_urls(station, start, end)]
+    if base_url is not None:
+        urls = [url.copy_with(scheme=base_url.scheme, host=base_url.host, port=base_url.port) for url in urls]
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(
+                    _fetch(client, url, slots=slots, rate_limit=rate_limit, retries=retries, backoff=backoff),
+                )
+                for url in urls
+            ]
+    except ExceptionGroup as e:
+        # the first failure cancels the other requests of the station-year
+        raise e.exceptions[0] from None
+    responses = [task.result() for task in tasks]
+    texts = [text for text, _ in responses]
+    attempts = sum(attempt for _, attempt in responses)
+    row.update(requests=attempts, retries=attempts - len(urls), bytes=sum(len(text) for text in texts))
+    # parsing is CPU bound: keep it off the event loop, so that the other downloads go on meanwhile
+    rows = await asyncio.get_running_loop().run_in_executor(
+        parse_executor,
+        functools.partial(
+            _parse_and_store,
+            texts,
+            station,
+            year,
+            data_folder,
+            partitioned=partitioned,
+            existing=existing,
+        ),
+    )
+    _searvey._update_manifest(data_folder, station, year, start=start, end=end, rows=rows)
+    status = "downloaded" if rows else "no data"
+    return {**row, "rows": rows, "status": status, "seconds": time.perf_counter() - began}
+
+
+async def download_station_years_async(
+    stations: abc.Iterable[str],
+    years: abc.Iterable[int],
+    data_folder: str | Path = "./data",
+    *,
+    partitioned: bool = False,
+    incremental: bool = False,
+    base_url: str | None = None,
+    http_client: httpx.AsyncClient | None = None,
+    concurrency: int = DOWNLOAD_CONCURRENCY,
+    rate: float | None = DOWNLOAD_RATE,
+    retries: int = DOWNLOAD_RETRIES,
+    backoff: float = DOWNLOAD_BACKOFF,
+    parse_executor: futures.Executor | None = None,
+) -> pd.DataFrame:
+    """
+    Coroutine version of `download_station_years`, e.g. for a running event loop like Jupyter's.
+    """
+    data_folder = Path(data_folder).absolute()
+    years = list(years)
+    pairs = [(station, year) for station in stations for year in years]
+    base = _searvey.ioc_base_url(base_url)
+    target = None if base is None else httpx.URL(base)
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout=10, read=30),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+    slots = asyncio.Semaphore(concurrency)
+    rate_limit = _HostRateLimit(rate)
+    # a few more station-years than requests in flight, so that parsing overlaps with downloading
+    # without the responses piling up in memory
+    pending = asyncio.Semaphore(2 * concurrency)
+
+    async def download(station: str, year: int) -> dict[str, T.Any]:
+        async with pending:
+            try:
+                return await _download_station_year(
+                    http_client,
+                    station,
+                    year,
+                    data_folder,
+                    base_url=target,
+                    partitioned=partitioned,
+                    incremental=incremental,
+                    slots=slots,
+                    rate_limit=rate_limit,
+                    retries=retries,
+                    backoff=backoff,
+                    parse_executor=parse_executor,
+                )
+            except Exception as e:
+                logger.error("Error for %s in %d: %r", station, year, e)
+                return {"station": station, "year": year, "status": "failed", "error": repr(e)}
+
+    began = time.perf_counter()
+    async with http_client:
+        rows = await asyncio.gather(*(download(station, year) for station, year in pairs))
+    elapsed = time.perf_counter() - began
+    summary = pd.DataFrame(rows, columns=DOWNLOAD_COLUMNS).fillna({"error": ""})
+    logger.info(
+        "Downloaded %d station-years in %.1fs: %d requests, %.1f MB, %d rows",
+        len(summary),
+        elapsed,
+        summary.requests.sum(),
+        summary.bytes.sum() / 1e6,
+        summary.rows.sum(),
+    )
+    _profiling.log_summary()
+    return summary.sort_values(["station", "year"], ignore_index=True)
+
+
+def download_station_years(
+    stations: abc.Iterable[str],
+    years: abc.Iterable[int],
+    data_folder: str | Path = "./data",
+    *,
+    partitioned: bool = False,
+    incremental: bool = False,
+    base_url: str | None = None,
+    http_client: httpx.AsyncClient | None = None,
+    concurrency: int = DOWNLOAD_CONCURRENCY,
+    rate: float | None = DOWNLOAD_RATE,
+    retries: int = DOWNLOAD_RETRIES,
+    backoff: float = DOWNLOAD_BACKOFF,
+    parse_executor: futures.Executor | None = None,
+) -> pd.DataFrame:
+    """
+    Download and store many years of IOC data for many stations at once.
+
+    Every station-year is requested in the same 30-day chunks as `download_raw`,
+    but all of them share one pooled `httpx.AsyncClient`, with at most
+    `concurrency` requests in flight and at most `rate` requests per second to
+    every host. Transport errors and HTTP 429/5xx responses are retried with
+    exponential backoff (or after the `Retry-After` delay of the server). Each
+    station-year is parsed and stored as soon as its responses are in, exactly
+    like `download_year_station` does, and recorded in the manifest, so an
+    interrupted run loses at most the station-years in flight.
+
+        summary = download_station_years(["abed", "nuku"], range(2020, 2026), partitioned=True)
+
+    Parameters:
+        stations: IOC station codes.
+        years: Years to download for every station.
+        data_folder: Base directory for storing downloaded data.
+        partitioned: Whether to use the partitioned store layout.
+        incremental: Only download the data after the last stored timestamp,
+            see `download_year_station`.
+        base_url: Optional server to query instead of the IOC one, e.g. a
+            `StandInServer`. Defaults to `$IOC_CLEANUP_BASE_URL`.
+        http_client: Optional `httpx.AsyncClient`. It is closed once the download is over.
+        concurrency: Maximum number of requests in flight.
+        rate: Maximum number of requests per second to every host. `None` disables the limit.
+        retries: Maximum number of retries of every request.
+        backoff: Delay in seconds before the first retry, doubled after every attempt.
+        parse_executor: Pool parsing and storing the responses. Defaults to the
+            thread pool of the event loop.
+
+    Returns:
+        DataFrame with one row per station-year and its status: `downloaded`,
+        `no data`, `up to date` or `failed`, the requested time range, the number
+        of requests and retries, the rows stored, the bytes downloaded and the
+        wall time in seconds.
+    """
+    return asyncio.run(
+        download_station_years_async(
+            stations,
+            years,
+            data_folder,
+            partitioned=partitioned,
+            incremental=incremental,
+            base_url=base_url,
+            http_client=http_client,
+            concurrency=concurrency,
+            rate=rate,
+            retries=retries,
+            backoff=backoff,
+            parse_executor=parse_executor,
+        ),
+    )
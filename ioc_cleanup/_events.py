@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import multifutures
+import pandas as pd
+
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+
+def tsunami_events(
+    paths: abc.Iterable[Path] | None = None,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """
+    List the `tsunami` windows of the transformations.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`.
+        start: If given, only keep the windows that start after it.
+        end: If given, only keep the windows that end before it.
+
+    Returns:
+        DataFrame with `station`, `sensor`, `start` and `end` columns.
+    """
+    if paths is None:
+        paths = _tools.get_transformation_paths()
+    rows = []
+    for path in paths:
+        trans = _tools.load_transformation_from_path(path)
+        for window_start, window_end in trans.tsunami:
+            if start is not None and window_start <= start:
+                continue
+            if end is not None and window_end >= end:
+                continue
+            rows.append((trans.ioc_code, trans.sensor, pd.Timestamp(window_start), pd.Timestamp(window_end)))
+    return pd.DataFrame(rows, columns=["station", "sensor", "start", "end"])
+
+
+def surge_events(
+    events: pd.DataFrame,
+    folder: Path = Path("./data"),
+    *,
+    demean: bool = True,
+    meta: pd.DataFrame | None = None,
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    progress_bar: bool = False,
+) -> pd.DataFrame:
+    """
+    Compute the surge within many (station, window) pairs in parallel.
+
+    Each event only loads and detides the data around its own window, see
+    `load_surge_ts_for_window`.
+
+    Parameters:
+        events: DataFrame with `station`, `sensor`, `start` and `end` columns,
+            e.g. `tsunami_events()`.
+        folder: Base directory containing yearly Parquet files.
+        demean: Whether to demean the signal between breakpoints.
+        meta: Station metadata, used for the latitudes. Defaults to `get_meta()`.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+        progress_bar: Whether to display a progress bar.
+
+    Returns:
+        A copy of `events` with a `surge` column holding the surge series of each
+        event (empty on failure) and an `error` column.
+    """
+    if meta is None:
+        meta = _searvey.get_meta()
+    lats = dict(zip(meta.ioc_code, meta.lat, strict=True))
+    func_kwargs = [
+        {
+            "station": row.station,
+            "sensor": row.sensor,
+            "start": row.start,
+            "end": row.end,
+            "folder": folder,
+            "demean": demean,
+            "lat": lats.get(row.station),
+        }
+        for row in events.itertuples(index=False)
+    ]
+    results = multifutures.multiprocess(
+        _tools.load_surge_ts_for_window,
+        func_kwargs,
+        max_workers=max_workers,
+        executor=executor,
+        check=False,
+        progress_bar=progress_bar,
+    )
+    by_event = {}
+    for result in results:
+        kwargs = T.cast(dict[str, T.Any], result.kwargs)
+        key = (kwargs["station"], kwargs["sensor"], kwargs["start"], kwargs["end"])
+        if result.exception is not None:
+            logger.error("Surge failed for %s: %s", key, result.exception)
+            by_event[key] = (pd.Series(dtype=float), str(result.exception))
+        else:
+            by_event[key] = (result.result, "")
+    keys = list(zip(events.station, events.sensor, events.start, events.end, strict=True))
+    out = events.copy()
+    out["surge"] = pd.Series([by_event[key][0] for key in keys], index=out.index, dtype=object)
+    out["error"] = [by_event[key][1] for key in keys]
+    return out
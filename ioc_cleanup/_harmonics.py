@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+import typing as T
+from pathlib import Path
+
+import pandas as pd
+
+from . import _constants
+from . import _hashing
+
+logger = logging.getLogger(__name__)
+
+# Each entry is a pickled `utide` coefficient object (`<key>.pkl`) plus a JSON
+# sidecar (`<key>.json`) describing what it was fitted on. The modification time
+# of the pickle is bumped on every hit and drives the LRU eviction.
+_SUFFIX = ".pkl"
+_INFO_SUFFIX = ".json"
+
+
+def _resolve(cache_dir: Path | None) -> Path:
+    return _constants.HARMONICS_DIR if cache_dir is None else cache_dir
+
+
+def harmonics_key(
+    station: str,
+    sensor: str,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    *,
+    rsmp: int | None,
+    opts: T.Mapping[str, T.Any],
+    transformation_digest: str,
+    data_digest: str = "",
+) -> str:
+    """
+    Return the cache key of a tidal fit.
+
+    Parameters:
+        station: IOC station code.
+        sensor: Sensor identifier.
+        start: First timestamp of the analysed series.
+        end: Last timestamp of the analysed series.
+        rsmp: Resampling interval used before the fit.
+        opts: UTide solver options.
+        transformation_digest: Digest of the transformation JSON file.
+        data_digest: Optional digest of the analysed series itself.
+
+    Returns:
+        Hex digest identifying the fit.
+    """
+    return _hashing.digest_json(
+        {
+            "station": station,
+            "sensor": sensor,
+            "start": pd.Timestamp(start).isoformat(),
+            "end": pd.Timestamp(end).isoformat(),
+            "rsmp": rsmp,
+            "opts": dict(opts),
+            "transformation": transformation_digest,
+            "data": data_digest,
+        },
+    )
+
+
+def load_harmonics(key: str, cache_dir: Path | None = None) -> T.Any | None:
+    """
+    Return the cached `utide` coefficients for `key`, or `None` on a miss.
+    """
+    cache_dir = _resolve(cache_dir)
+    path = cache_dir / f"{key}{_SUFFIX}"
+    try:
+        with open(path, "rb") as fd:
+            coef = pickle.load(fd)  # noqa: S301  # only our own cache files are loaded
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    os.utime(path)
+    return coef
+
+
+def save_harmonics(
+    key: str,
+    coef: T.Any,
+    info: T.Mapping[str, T.Any],
+    cache_dir: Path | None = None,
+    max_bytes: int = _constants.HARMONICS_MAX_BYTES,
+) -> None:
+    """
+    Store `utide` coefficients in the cache and evict the oldest entries above `max_bytes`.
+
+    Parameters:
+        key: Cache key, see `harmonics_key`.
+        coef: The `utide.solve` result.
+        info: JSON serializable description of the fit, shown by `list_harmonics`.
+        cache_dir: Cache directory. Defaults to `HARMONICS_DIR`.
+        max_bytes: Maximum total size of the cache.
+    """
+    cache_dir = _resolve(cache_dir)
+    # the partial pickle, until it is moved into place
+    tmp: Path | None = None
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".tmp", delete=False) as fd:
+            tmp = Path(fd.name)
+            pickle.dump(coef, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        (cache_dir / f"{key}{_INFO_SUFFIX}").write_text(json.dumps({**info, "key": key}, default=str))
+        os.replace(tmp, cache_dir / f"{key}{_SUFFIX}")
+        tmp = None
+    except OSError as e:
+        logger.warning("Could not write tidal harmonics cache %s: %s", cache_dir, e)
+        return
+    finally:
+        if tmp is not None:
+            tmp.unlink(missing_ok=True)
+    evict_harmonics(max_bytes=max_bytes, cache_dir=cache_dir)
+
+
+def list_harmonics(cache_dir: Path | None = None) -> pd.DataFrame:
+    """
+    Describe the cached tidal fits, most recently used first.
+
+    Parameters:
+        cache_dir: Cache directory. Defaults to `HARMONICS_DIR`.
+
+    Returns:
+        DataFrame with one row per fit, including its size and last access time.
+    """
+    cache_dir = _resolve(cache_dir)
+    rows = []
+    for path in cache_dir.glob(f"*{_SUFFIX}"):
+        try:
+            info = json.loads(path.with_suffix(_INFO_SUFFIX).read_text())
+            stat = path.stat()
+        except (OSError, ValueError):
+            continue
+        info["bytes"] = stat.st_size
+        info["last_used"] = pd.Timestamp.fromtimestamp(stat.st_mtime)
+        rows.append(info)
+    if not rows:
+        return pd.DataFrame(columns=["key", "bytes", "last_used"])
+    return pd.DataFrame(rows).sort_values("last_used", ascending=False, ignore_index=True)
+
+
+def evict_harmonics(
+    max_bytes: int = _constants.HARMONICS_MAX_BYTES,
+    max_age: pd.Timedelta | None = None,
+    cache_dir: Path | None = None,
+) -> int:
+    """
+    Remove the least recently used fits until the cache fits in `max_bytes`.
+
+    Parameters:
+        max_bytes: Maximum total size of the cache.
+        max_age: If given, fits that have not been used for longer are removed too.
+        cache_dir: Cache directory. Defaults to `HARMONICS_DIR`.
+
+    Returns:
+        The number of evicted fits.
+    """
+    cache_dir = _resolve(cache_dir)
+    entries = []
+    for path in cache_dir.glob(f"*{_SUFFIX}"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(reverse=True)
+    now = time.time()
+    total = 0
+    evicted = 0
+    for mtime, size, path in entries:
+        total += size
+        if total > max_bytes or (max_age is not None and now - mtime > max_age.total_seconds()):
+            path.unlink(missing_ok=True)
+            path.with_suffix(_INFO_SUFFIX).unlink(missing_ok=True)
+            evicted += 1
+    return evicted
+
+
+def clear_harmonics(cache_dir: Path | None = None) -> int:
+    """
+    Remove every cached fit.
+
+    Returns:
+        The number of removed fits.
+    """
+    return evict_harmonics(max_bytes=-1, cache_dir=cache_dir)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import typing as T
+
+import pandas as pd
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def digest_file(path: str | os.PathLike[str]) -> str:
+    """
+    Return the hex digest of the contents of a file.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fd:
+        while chunk := fd.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def digest_json(obj: T.Any) -> str:
+    """
+    Return the hex digest of the canonical JSON representation of `obj`.
+
+    Keys are sorted and values that are not JSON serializable (e.g. timestamps
+    or paths) are converted to strings.
+    """
+    contents = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.blake2b(contents.encode(), digest_size=16).hexdigest()
+
+
+def digest_series(sr: pd.Series) -> str:
+    """
+    Return the hex digest of the index and values of a series.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(sr.index.to_numpy().tobytes())
+    hasher.update(sr.to_numpy().tobytes())
+    return hasher.hexdigest()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import typing as T
+
+import numpy as np
+import pandas as pd
+
+from . import _constants
+from . import _models
+
+# The implementations that the vectorized kernels replaced, kept as the single reference
+# of the tests and of the comparison scripts in `benchmarks/`.
+
+# Shorter zero-crossing segments are skipped
+MAX = 2
+
+
+def legacy_extract_waves(time: np.ndarray, eta: np.ndarray, crossing: str = "up") -> pd.DataFrame:
+    eta = np.asarray(eta)
+    time = np.asarray(time)
+    fluc = eta - eta.mean()
+    sgn = np.sign(fluc)
+    if crossing == "up":
+        zc = np.where((sgn[:-1] < 0) & (sgn[1:] > 0))[0]
+    else:
+        zc = np.where((sgn[:-1] > 0) & (sgn[1:] < 0))[0]
+    waves = []
+    for i in range(len(zc) - 1):
+        i0 = zc[i] + 1
+        i1 = zc[i + 1]
+        if i1 - i0 < MAX:
+            continue
+        segment = fluc[i0:i1]
+        seg_time = time[i0:i1]
+        crest_idx = np.argmax(segment)
+        trough_idx = np.argmin(segment)
+        waves.append(
+            {
+                "wave": i + 1,
+                "H": segment[crest_idx] + abs(segment[trough_idx]),
+                "T": time[i1] - time[i0],
+                "t_crest": seg_time[crest_idx],
+                "t_trough": seg_time[trough_idx],
+            },
+        )
+    return pd.DataFrame(waves)
+
+
+def legacy_transform(df: pd.DataFrame, transformation: _models.Transformation) -> pd.DataFrame:
+    df = df.copy()
+    df = df[transformation.start : transformation.end]  # type: ignore[misc]
+    for start, end in transformation.dropped_date_ranges:
+        df[start:end] = np.nan  # type: ignore[misc]
+    if transformation.dropped_timestamps:
+        t_ = pd.DatetimeIndex(transformation.dropped_timestamps)
+        t0 = df.index[0]
+        t1 = df.index[-1]
+        drop_index = np.where(np.logical_and(t_ > t0, t_ < t1))[0]
+        df.loc[t_[drop_index], :] = np.nan
+    return df
+
+
+def legacy_ratio(sr: pd.Series, period: pd.DatetimeIndex) -> float:
+    sr = sr[(period[0] <= sr.index) & (sr.index <= period[-1])]
+    return len(sr) / len(period)
+
+
+def legacy_statistics(sr: pd.Series) -> dict[str, T.Any]:
+    interval_value_counts = sr.index.to_series().diff().value_counts()
+    main_interval = interval_value_counts.index[0]
+    periods = {
+        name: pd.date_range(start, end, freq=main_interval, inclusive="left")
+        for name, start, end in (
+            ("detide", _constants.DETIDE_START, _constants.DETIDE_END),
+            ("simulation", _constants.SIMULATION_START, _constants.SIMULATION_END),
+        )
+    }
+    return {
+        "count": len(sr),
+        "main_interval": main_interval,
+        "main_interval_ratio": interval_value_counts.iloc[0] / len(sr),
+        "detide_ratio": legacy_ratio(sr, periods["detide"]),
+        "simulation_ratio": legacy_ratio(sr, periods["simulation"]),
+        "min": sr.min(),
+        "q001": sr.quantile(0.001),
+        "q01": sr.quantile(0.01),
+        "q25": sr.quantile(0.25),
+        "mean": sr.mean(),
+        "median": sr.median(),
+        "q75": sr.quantile(0.75),
+        "q99": sr.quantile(0.99),
+        "q999": sr.quantile(0.999),
+        "max": sr.max(),
+        "range": abs(sr.max() - sr.min()),
+        "std": sr.std(),
+        "skew": sr.skew(),
+        "kurtosis": sr.kurtosis(),
+    }
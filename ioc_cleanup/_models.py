@@ -5,6 +5,17 @@ import datetime
 import pydantic
 
 
+class Segment(pydantic.BaseModel):
+    """
+    Linear correction of the sensor values within `[start, end]`: `value * scale_factor + offset`.
+    """
+
+    start: datetime.datetime
+    end: datetime.datetime
+    offset: float = 0.0
+    scale_factor: float = 1.0
+
+
 class Transformation(pydantic.BaseModel):
     ioc_code: str
     sensor: str
@@ -19,3 +30,4 @@ class Transformation(pydantic.BaseModel):
     dropped_timestamps: list[datetime.datetime] = []
     breakpoints: list[datetime.datetime] = []
     tsunami: list[tuple[datetime.datetime, datetime.datetime]] = []
+    segments: list[Segment] = []
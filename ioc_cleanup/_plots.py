@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import os
+import time
 import typing as T
 from pathlib import Path
 
 import holoviews as hv
 import holoviews.streams
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 import panel as pn
 import param
 
+from . import _cache
+from . import _constants
+from . import _models
+from . import _profiling
 from . import _tools
 
 
@@ -34,6 +42,17 @@ class UI:
         name="Demean between breakpoints",
         value=True,
     )
+    rasterize: T.Any = pn.widgets.Checkbox(
+        name="Rasterize (datashader)",
+        value=True,
+    )
+    n_years: T.Any = pn.widgets.IntInput(
+        name="Number of years",
+        value=1,
+        start=1,
+        step=1,
+        width=200,
+    )
     station_sensor: T.Any = pn.widgets.Select(
         name="Station and Sensor from the json list",
         options=_tools.get_station_names(),
@@ -73,49 +92,128 @@ def plot_geographic_coverage(
     return (plot_bad * plot_good).opts(title=title)
 
 
-# Create a function to print selected points
-def print_all_points(df: pd.Series, indices: list[int], text_box: pn.widgets.TextAreaInput) -> T.Any:
-    if indices:
-        indices = sorted(indices)
-        timestamps = [f'    "{df.index[id_].strftime("%Y-%m-%dT%H:%M:%S")}"' for id_ in indices]
-        value = ",\n".join(timestamps)
+def selection_positions(indices: npt.ArrayLike) -> npt.NDArray[np.int64]:
+    """
+    Return the sorted, unique positions of a selection.
+    """
+    return np.unique(np.asarray(indices, dtype=np.int64))
+
+
+def format_timestamps(index: pd.Index[T.Any]) -> npt.NDArray[np.str_]:
+    # numpy formats large selections orders of magnitude faster than `strftime`
+    return np.datetime_as_string(index.to_numpy(dtype="datetime64[s]"), unit="s")
+
+
+def selected_segment(
+    df: pd.Series,
+    positions: npt.NDArray[np.int64],
+    clean: pd.Series | None = None,
+) -> _models.Segment:
+    """
+    Return the segment spanning a selection, with the offset that cancels its mean.
+
+    Parameters:
+        df: The displayed time series.
+        positions: Sorted positions of the selected samples in `df`.
+        clean: The cleaned series without demeaning nor segment corrections,
+            see `load_uncorrected`. Defaults to `df`.
+    """
+    first, last = positions[0], positions[-1]
+    start, end = df.index[first], df.index[last]
+    if clean is None:
+        values = df.iloc[first:last]
+    else:
+        values = clean[(clean.index >= start) & (clean.index < end)]
+    # the correction is `value * scale_factor + offset`, see `Segment`
+    return _models.Segment(start=start, end=end, offset=-values.mean(), scale_factor=1.0)
+
+
+def print_all_points(df: pd.Series, indices: npt.ArrayLike, text_box: pn.widgets.TextAreaInput) -> T.Any:
+    positions = selection_positions(indices)
+    if len(positions):
+        value = '    "' + '",\n    "'.join(format_timestamps(df.index[positions]).tolist()) + '"'
     else:
         value = "No selection!"
     text_box.value = value
 
 
-def print_range(df: pd.Series, indices: list[int], text_box: pn.widgets.TextAreaInput) -> T.Any:
-    if indices:
-        indices = sorted(indices)
-        first_ts = df.index[indices[0]].strftime("%Y-%m-%dT%H:%M:%S")
-        last_ts = df.index[indices[-1]].strftime("%Y-%m-%dT%H:%M:%S")
+def print_range(df: pd.Series, indices: npt.ArrayLike, text_box: pn.widgets.TextAreaInput) -> T.Any:
+    positions = selection_positions(indices)
+    if len(positions):
+        first_ts, last_ts = format_timestamps(df.index[positions[[0, -1]]])
         value = f'["{first_ts}", "{last_ts}"],'
     else:
         value = "No selection!"
     text_box.value = value
 
 
-def print_segment(df: pd.Series, indices: list[int], text_box: pn.widgets.TextAreaInput) -> T.Any:
-    if indices:
-        first_ts = df.index[indices[0]].strftime("%Y-%m-%dT%H:%M:%S")
-        last_ts = df.index[indices[-1]].strftime("%Y-%m-%dT%H:%M:%S")
-        mean = df.iloc[indices[0] : indices[-1]].mean()
-
+def print_segment(
+    df: pd.Series,
+    indices: npt.ArrayLike,
+    text_box: pn.widgets.TextAreaInput,
+    clean: pd.Series | None = None,
+) -> T.Any:
+    positions = selection_positions(indices)
+    if len(positions):
+        segment = selected_segment(df, positions, clean)
+        first_ts, last_ts = format_timestamps(pd.DatetimeIndex([segment.start, segment.end]))
         value = "{\n"
         value += f'  "start": "{first_ts}",\n'
         value += f'  "end": "{last_ts}",\n'
-        value += f'  "offset": {mean},\n'
-        value += '  "scale_factor": 1.0\n'
+        value += f'  "offset": {segment.offset},\n'
+        value += f'  "scale_factor": {segment.scale_factor}\n'
         value += "}"
     else:
         value = "No selection!"
     text_box.value = value
 
 
+def save_selection(
+    df: pd.Series,
+    indices: npt.ArrayLike,
+    kind: str,
+    *,
+    station: str,
+    sensor: str,
+    trans_dir: Path = _constants.TRANSFORMATIONS_DIR,
+    clean: pd.Series | None = None,
+) -> _models.Transformation:
+    """
+    Merge a selection into the transformation of the station and write it back.
+
+    Parameters:
+        df: The displayed time series.
+        indices: Positions of the selected samples in `df`.
+        kind: `"points"` to drop every selected timestamp, `"range"` to drop the
+            range they span, or `"segment"` to add the offset correction of `print_segment`.
+        station: IOC station code.
+        sensor: Sensor identifier.
+        trans_dir: Directory of the transformation JSON files.
+        clean: The cleaned series without demeaning nor segment corrections,
+            see `selected_segment`.
+
+    Returns:
+        The updated transformation.
+    """
+    positions = selection_positions(indices)
+    if not len(positions):
+        raise ValueError("No selection!")
+    if kind == "points":
+        update: dict[str, T.Any] = {"dropped_timestamps": df.index[positions]}
+    elif kind == "range":
+        update = {"dropped_date_ranges": [(df.index[positions[0]], df.index[positions[-1]])]}
+    elif kind == "segment":
+        update = {"segments": [selected_segment(df, positions, clean)]}
+    else:
+        raise ValueError(f"kind must be 'points', 'range' or 'segment', not {kind!r}")
+    trans = _tools.load_transformation_from_path(Path(trans_dir) / f"{station}_{sensor}.json")
+    merged = _tools.merge_selection(trans, **update)
+    _tools.dump_transformation(merged, trans_dir)
+    return merged
+
+
 def get_notes(station: str, sensor: str) -> str:
-    trans = _tools.load_transformation_from_path(
-        f"./transformations/{station}_{sensor}.json",
-    )
+    trans = _tools.load_transformation_header(_tools._transformation_path(station, sensor))
     return trans.notes if trans.notes else "No notes"
 
 
@@ -127,26 +225,54 @@ def load_surge_tide(
     surge: bool,
     demean: bool,
     folder: Path = Path("./data"),
+    n_years: int = 1,
 ) -> pd.Series:
-    if surge:
-        return _tools.load_surge_ts_for_year(
-            station,
-            sensor,
-            year,
-            folder,
-            demean=demean,
-        )
-    else:
-        return _tools.load_clean_ts_for_year(
-            station,
-            sensor,
-            year,
-            folder,
-            demean=demean,
-        )
+    # cached across the sessions of the server, see `_cache.get_series_cache`
+    load = _cache.load_surge_year if surge else _cache.load_clean_year
+    years = [load(station, sensor, year_, folder, demean=demean) for year_ in range(year, year + n_years)]
+    return _concat_years(years, sensor)
 
 
-def plot_line(df: pd.Series) -> hv.Curve:
+def load_uncorrected(
+    station: str,
+    sensor: str,
+    year: int,
+    *,
+    folder: Path = Path("./data"),
+    n_years: int = 1,
+) -> pd.Series:
+    """
+    The cleaned series without the segment corrections, on which new segment offsets are computed.
+
+    The offset of the segment that covers a sample replaces the existing one, so it
+    must cancel the mean of the uncorrected values, not of the corrected ones.
+    """
+    years = [_cache.load_uncorrected_year(station, sensor, year_, folder) for year_ in range(year, year + n_years)]
+    return _concat_years(years, sensor)
+
+
+def _concat_years(years: list[pd.Series], sensor: str) -> pd.Series:
+    years = [ts for ts in years if not ts.empty]
+    if not years:
+        return pd.Series(dtype=float, name=sensor)
+    return pd.concat(years) if len(years) > 1 else years[0]
+
+
+def plot_line(df: pd.Series, *, rasterize: bool = False) -> hv.Curve | hv.DynamicMap:
+    if rasterize:
+        # Aggregated by datashader on the server and re-aggregated on every zoom/pan,
+        # so only an image the size of the plot is sent to the browser
+        return df.hvplot.line(
+            rasterize=True,
+            tools=["box_select", "crosshair", "undo"],
+            grid=True,
+            cmap="Reds",
+            colorbar=False,
+        ).opts(
+            active_tools=["box_zoom"],
+            responsive=True,
+            ylim=(df.min() * 1.001, df.max() * 1.001),
+        )
     return df.hvplot.line(
         tools=["hover", "crosshair", "undo"],
         grid=True,
@@ -173,6 +299,144 @@ def plot_points(df: pd.Series) -> hv.Scatter:
     )
 
 
+def _to_datetime64(value: T.Any) -> np.datetime64:
+    # Bokeh reports datetime axes either as datetimes or as milliseconds since the epoch
+    if isinstance(value, int | float | np.number):
+        return pd.Timestamp(float(value), unit="ms").to_datetime64()
+    return pd.Timestamp(value).to_datetime64()
+
+
+def positions_in_bounds(df: pd.Series, bounds: tuple[T.Any, T.Any, T.Any, T.Any] | None) -> npt.NDArray[np.int64]:
+    """
+    Return the positions of the samples of `df` inside a box selection.
+
+    Parameters:
+        df: Time series, sorted by time.
+        bounds: The `(x0, y0, x1, y1)` box of a `BoundsXY` stream.
+
+    Returns:
+        Sorted positional indices, as `Selection1D` would report them.
+    """
+    if bounds is None:
+        return np.empty(0, dtype=np.int64)
+    x0, y0, x1, y1 = bounds
+    times = df.index.to_numpy()
+    lo = np.searchsorted(times, _to_datetime64(min(x0, x1)), side="left")
+    hi = np.searchsorted(times, _to_datetime64(max(x0, x1)), side="right")
+    values = df.to_numpy()[lo:hi]
+    inside = np.flatnonzero((values >= min(y0, y1)) & (values <= max(y0, y1)))
+    return (inside + lo).astype(np.int64)
+
+
+def indices_in_bounds(df: pd.Series, bounds: tuple[T.Any, T.Any, T.Any, T.Any] | None) -> list[int]:
+    """
+    Like `positions_in_bounds`, as a list.
+    """
+    return T.cast(list[int], positions_in_bounds(df, bounds).tolist())
+
+
+def plot_selected(df: pd.Series, indices: npt.ArrayLike, max_points: int = 20_000) -> hv.Scatter:
+    # Highlighting is only a visual aid: large selections are thinned out so that the browser stays responsive
+    positions = np.asarray(indices, dtype=np.int64)
+    step = max(1, -(-len(positions) // max_points))
+    return hv.Scatter(df.iloc[positions[::step]]).opts(color="red", size=3, responsive=True)
+
+
+def timings_panel(since: float) -> list[T.Any]:
+    """
+    Per-stage timings of what this process did since `since`, if profiling is enabled.
+    """
+    if not _profiling.is_profiling():
+        return []
+    records = _profiling.profiling_records()
+    records = records[(records.pid == os.getpid()) & (records.started >= since)]
+    summary = _profiling.profiling_summary(records)
+    return [pn.Row(pn.Column("## Timings:", pn.pane.DataFrame(summary.round(3), sizing_mode="stretch_width")))]
+
+
+def cache_panel(before: dict[str, int]) -> pn.pane.Markdown:
+    """
+    Hits and misses of the series cache since the `before` stats were taken, and its current usage.
+    """
+    stats = _cache.get_series_cache().stats()
+    return pn.pane.Markdown(
+        f"Cache: {stats['hits'] - before['hits']} hits, {stats['misses'] - before['misses']} misses. "
+        f"{stats['entries']} entries, {stats['bytes'] / 2**20:.0f} of {stats['max_bytes'] / 2**20:.0f} MiB, "
+        f"{stats['hits']} hits, {stats['misses']} misses and {stats['evictions']} evictions in total.",
+    )
+
+
+def save_buttons(
+    df: pd.Series,
+    selection: dict[str, npt.NDArray[np.int64]],
+    *,
+    station: str,
+    sensor: str,
+    status: pn.pane.Markdown,
+    clean: pd.Series | None = None,
+    disabled: bool = False,
+) -> list[pn.widgets.Button]:
+    """
+    Buttons merging the current `selection["positions"]` into the transformation, see `save_selection`.
+
+    They are `disabled` when `df` is only a placeholder, e.g. after a loading error.
+    """
+
+    def on_click(kind: str) -> T.Callable[[T.Any], None]:
+        def save(_event: T.Any) -> None:
+            positions = selection["positions"]
+            try:
+                trans = save_selection(df, positions, kind, station=station, sensor=sensor, clean=clean)
+            except Exception as e:
+                status.object = f"<span style='color:red;'>{e}</span>"
+            else:
+                status.object = (
+                    f"Saved {len(positions)} points to `{station}_{sensor}.json`: "
+                    f"{len(trans.dropped_timestamps)} timestamps, {len(trans.dropped_date_ranges)} ranges, "
+                    f"{len(trans.segments)} segments"
+                )
+
+        return save
+
+    buttons = []
+    for kind, name in (("points", "Drop points"), ("range", "Drop range"), ("segment", "Add segment")):
+        button = pn.widgets.Button(name=name, button_type="primary", disabled=disabled)
+        button.on_click(on_click(kind))
+        buttons.append(button)
+    return buttons
+
+
+def placeholder_series(year: int) -> pd.Series:
+    ts = pd.date_range(f"{year}", f"{year + 1}", freq="24h")
+    return pd.Series([0.0] * len(ts), index=ts)
+
+
+def plot_selectable(
+    df: pd.Series,
+    on_select: T.Callable[[npt.NDArray[np.int64]], None],
+    *,
+    rasterize: bool,
+) -> T.Any:
+    """
+    Plot `df`, calling `on_select` with the positions of every new selection.
+    """
+    if rasterize:
+        # The box selection is mapped back to the exact samples on the server
+        curve = plot_line(df, rasterize=True)
+        bounds = holoviews.streams.BoundsXY(source=curve, bounds=None)
+        bounds.add_subscriber(lambda bounds: on_select(positions_in_bounds(df, bounds)))
+        selected = hv.DynamicMap(
+            lambda bounds: plot_selected(df, positions_in_bounds(df, bounds)),
+            streams=[bounds],
+        )
+        return curve * selected
+    curve = plot_line(df)
+    points = plot_points(df)
+    selection_stream = holoviews.streams.Selection1D(source=points)
+    selection_stream.add_subscriber(on_select)
+    return curve * points
+
+
 def select_points() -> T.Any:
     on_apply = pn.depends(UI.apply)
 
@@ -180,6 +444,8 @@ def select_points() -> T.Any:
         year = UI.year.value
         surge = UI.surge.value
         demean = UI.demean.value
+        rasterize = UI.rasterize.value
+        n_years = UI.n_years.value
         station_sensor = UI.station_sensor.value
         station, sensor = station_sensor.split("_")
 
@@ -188,47 +454,66 @@ def select_points() -> T.Any:
         segment = pn.widgets.TextAreaInput(value="", height=200, placeholder="Selected indices will appear here")
         notes = pn.pane.Markdown("Notes inserted in the JSON will appear here")
         error = pn.pane.Markdown("If there is any Error, it will appear here")
+        saved = pn.pane.Markdown("")
+        loading_started = time.time()
+        cache_before = _cache.get_series_cache().stats()
+        # the current selection, as sorted positions in `df`
+        selection = {"positions": np.empty(0, dtype=np.int64)}
+        # the segment offsets apply to the uncorrected cleaned series, whatever is displayed
+        clean = None
 
         try:
-            df = load_surge_tide(station, sensor, year, surge=surge, demean=demean)
+            df = load_surge_tide(station, sensor, year, surge=surge, demean=demean, n_years=n_years)
+            clean = load_uncorrected(station, sensor, year, n_years=n_years)
             notes.object = get_notes(station, sensor)
+            placeholder = df.empty
             if df.empty:
-                ts = pd.date_range(f"{year}", f"{year+1}", freq="24h")
-                df = pd.Series([0.0] * len(ts), index=ts)
+                df = placeholder_series(year)
                 error.object = (
                     "<span style='color:red;'>Empty TS, no data for this year. Check start/end in JSON</span>"
                 )
 
-            curve = plot_line(df)
-            points = plot_points(df)
-            selection = holoviews.streams.Selection1D(source=points)
-            selection.add_subscriber(lambda index: print_range(df=df, indices=index, text_box=points_range))
-            selection.add_subscriber(lambda index: print_all_points(df=df, indices=index, text_box=points_all))
-            selection.add_subscriber(lambda index: print_segment(df=df, indices=index, text_box=segment))
+            def on_select(index: npt.ArrayLike) -> None:
+                positions = selection["positions"] = selection_positions(index)
+                print_range(df=df, indices=positions, text_box=points_range)
+                print_all_points(df=df, indices=positions, text_box=points_all)
+                print_segment(df=df, indices=positions, text_box=segment, clean=clean)
 
-            plot = curve * points
+            plot = plot_selectable(df, on_select, rasterize=rasterize)
 
         except Exception as e:
-            ts = pd.date_range(f"{year}", f"{year+1}", freq="24h")
-            df = pd.Series([0.0] * len(ts), index=ts)
+            placeholder = True
+            df = placeholder_series(year)
             hv_ = T.cast(T.Any, df).hvplot
             plot = hv_.line() * hv_.scatter()
             error.object = f"<span style='color:red;'>{e}</span>"
 
+        save_points, save_range, save_segment = save_buttons(
+            df,
+            selection,
+            station=station,
+            sensor=sensor,
+            status=saved,
+            clean=clean,
+            disabled=placeholder,
+        )
+
         return pn.Column(
             pn.Row(
                 pn.pane.HoloViews(plot.opts(responsive=True), sizing_mode="stretch_width", height=700),
                 width_policy="max",
             ),
             pn.Row(
-                pn.Column("## Selected Indices:", points_all),
-                pn.Column("## Selected Ranges:", points_range),
-                pn.Column("## Segment info:", segment),
-                pn.Column("## Notes:", notes),
+                pn.Column("## Selected Indices:", points_all, save_points),
+                pn.Column("## Selected Ranges:", points_range, save_range),
+                pn.Column("## Segment info:", segment, save_segment),
+                pn.Column("## Notes:", notes, saved),
             ),
             pn.Row(
                 pn.Column("## Error:", error),
+                pn.Column("## Cache:", cache_panel(cache_before)),
             ),
+            *timings_panel(loading_started),
         )
 
     page = pn.template.FastListTemplate(
@@ -239,6 +524,8 @@ def select_points() -> T.Any:
             UI.year,
             UI.surge,
             UI.demean,
+            UI.n_years,
+            UI.rasterize,
             UI.apply,
         ],
         main=pn.Column(
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import typing as T
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# `IOC_CLEANUP_PROFILE=1` enables the profiling in every process, including the workers
+# of batch runs. Any other value is the path of a JSON lines log shared by all of them.
+# Without a log, a temporary one is created, so that the summary covers the workers.
+PROFILE_ENV = "IOC_CLEANUP_PROFILE"
+PROFILE_MEMORY_ENV = "IOC_CLEANUP_PROFILE_MEMORY"
+RECORD_COLUMNS = ["stage", "station", "rows", "wall", "peak_mb", "pid", "started"]
+
+
+class _State:
+    enabled: bool = False
+    memory: bool = False
+    log_path: Path | None = None
+    # the temporary log created by `enable_profiling` in this process, if any
+    temporary: Path | None = None
+    records: T.ClassVar[list[dict[str, T.Any]]] = []
+    lock = threading.Lock()
+    local = threading.local()
+
+
+class _NullStage:
+    """
+    What `profile_stage` returns while profiling is off: entering and leaving it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> _NullStage:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    @property
+    def rows(self) -> int | None:
+        return None
+
+    @rows.setter
+    def rows(self, value: int | None) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """
+    A timed stage. Set `rows` within the `with` block if the number of rows is only known then.
+    """
+
+    def __init__(self, name: str, station: str | None, rows: int | None) -> None:
+        self.name = name
+        self.station = station
+        self.rows = rows
+        self._base = 0
+        self._peak = 0
+
+    def __enter__(self) -> Stage:
+        stack = _stack()
+        if self.station is None and stack:
+            # e.g. `utide.solve` within the `surge` stage of a station
+            self.station = stack[-1].station
+        if _State.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # the peak is reset for this stage, so the enclosing one keeps track of its own so far
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, peak)
+            tracemalloc.reset_peak()
+            self._base = current
+            self._peak = current
+        stack.append(self)
+        self._started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        wall = time.perf_counter() - self._start
+        stack = _stack()
+        stack.pop()
+        peak_mb = None
+        if _State.memory and tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            peak_mb = (self._peak - self._base) / 2**20
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+        _record(
+            {
+                "stage": self.name,
+                "station": self.station,
+                "rows": self.rows,
+                "wall": wall,
+                "peak_mb": peak_mb,
+                "pid": os.getpid(),
+                "started": self._started,
+            },
+        )
+
+
+def _stack() -> list[Stage]:
+    stack: list[Stage] | None = getattr(_State.local, "stack", None)
+    if stack is None:
+        stack = _State.local.stack = []
+    return stack
+
+
+def _record(record: dict[str, T.Any]) -> None:
+    with _State.lock:
+        _State.records.append(record)
+        if _State.log_path is not None:
+            # a single short append per line, so that the workers of a batch run can share the file
+            with open(_State.log_path, "a") as fd:
+                fd.write(json.dumps(record) + "\n")
+    logger.debug("stage %s", json.dumps(record))
+
+
+def profile_stage(name: str, *, station: str | None = None, rows: int | None = None) -> Stage | _NullStage:
+    """
+    Time a stage of the processing, if profiling is enabled.
+
+        with profile_stage("transform", station=station) as stage:
+            df = ...
+            stage.rows = len(df)
+
+    While profiling is disabled, this returns a shared no-op context manager.
+
+    Parameters:
+        name: Name of the stage, e.g. `"parquet"` or `"utide.solve"`.
+        station: IOC station code, if the stage is about one station.
+        rows: Number of rows processed, if already known.
+    """
+    if not _State.enabled:
+        return _NULL_STAGE
+    return Stage(name, station, rows)
+
+
+def enable_profiling(*, memory: bool = False, log_path: str | os.PathLike[str] | None = None) -> None:
+    """
+    Start recording the wall time, rows and peak memory of every stage.
+
+    Parameters:
+        memory: Also record the peak memory with `tracemalloc`. This slows
+            allocation-heavy code down noticeably.
+        log_path: Also append every record to this JSON lines file. The worker
+            processes of the batch runs inherit the setting, so this is where
+            their records end up. Defaults to a temporary file, removed by
+            `disable_profiling` or at exit.
+    """
+    _State.enabled = True
+    _State.memory = memory
+    if log_path is not None:
+        _remove_temporary_log()
+        _State.log_path = Path(log_path)
+    elif _State.temporary is None:
+        fd, name = tempfile.mkstemp(prefix="ioc_cleanup_profile_", suffix=".jsonl")
+        os.close(fd)
+        _State.log_path = _State.temporary = Path(name)
+    else:
+        _State.log_path = _State.temporary
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    # spawned workers configure themselves from the environment when importing the package
+    os.environ[PROFILE_ENV] = str(_State.log_path)
+    os.environ[PROFILE_MEMORY_ENV] = "1" if memory else "0"
+
+
+def _remove_temporary_log() -> None:
+    if _State.temporary is not None:
+        _State.temporary.unlink(missing_ok=True)
+        _State.temporary = None
+
+
+# forked workers leave through `os._exit`, so only the process that created the log removes it
+atexit.register(_remove_temporary_log)
+
+
+def disable_profiling() -> None:
+    _State.enabled = False
+    _remove_temporary_log()
+    _State.log_path = None
+    os.environ.pop(PROFILE_ENV, None)
+    os.environ.pop(PROFILE_MEMORY_ENV, None)
+    if _State.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _State.memory = False
+
+
+def is_profiling() -> bool:
+    return _State.enabled
+
+
+def clear_profiling() -> None:
+    """
+    Forget the records of this process, and those of the temporary log shared with its workers.
+    """
+    with _State.lock:
+        _State.records.clear()
+        if _State.temporary is not None:
+            _State.temporary.write_text("")
+
+
+def profiling_records(log_path: str | os.PathLike[str] | None = None) -> pd.DataFrame:
+    """
+    Return the stage records, one row per stage execution.
+
+    Parameters:
+        log_path: JSON lines log to read, e.g. the one shared by the workers of a
+            batch run. Defaults to the configured log, see `enable_profiling`,
+            else the records of this process.
+    """
+    path = Path(log_path) if log_path is not None else _State.log_path
+    if path is None:
+        with _State.lock:
+            records = list(_State.records)
+    elif path.exists():
+        records = [json.loads(line) for line in path.read_text().splitlines() if line]
+    else:
+        records = []
+    return pd.DataFrame(records, columns=RECORD_COLUMNS)
+
+
+def profiling_summary(records: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Summarize the records per stage.
+
+    Parameters:
+        records: Records as returned by `profiling_records`. Defaults to `profiling_records()`.
+
+    Returns:
+        DataFrame indexed by stage, sorted by total time, with the number of calls,
+        the total/mean/max wall time, the rows processed, the throughput and the
+        maximum peak memory.
+    """
+    if records is None:
+        records = profiling_records()
+    grouped = records.groupby("stage")
+    summary = pd.DataFrame(
+        {
+            "calls": grouped.size(),
+            "stations": grouped.station.nunique(),
+            "total_s": grouped.wall.sum(),
+            "mean_s": grouped.wall.mean(),
+            "max_s": grouped.wall.max(),
+            "rows": grouped.rows.sum(min_count=1),
+            "peak_mb": grouped.peak_mb.max(),
+        },
+    )
+    summary["rows_per_s"] = summary.rows / summary.total_s
+    return summary.sort_values("total_s", ascending=False)
+
+
+def log_summary() -> None:
+    """
+    Log the per-stage summary, if profiling is enabled. Called at the end of the batch runs.
+    """
+    if _State.enabled:
+        summary = profiling_summary()
+        if not summary.empty:
+            logger.info("Per-stage summary:\n%s", summary.round(3).to_string())
+
+
+def write_profiling_report(path: str | os.PathLike[str], records: pd.DataFrame | None = None) -> None:
+    """
+    Write the records and their summary as a JSON report.
+    """
+    if records is None:
+        records = profiling_records()
+    report = {
+        "records": json.loads(records.to_json(orient="records")),
+        "summary": json.loads(profiling_summary(records).reset_index().to_json(orient="records")),
+    }
+    Path(path).write_text(json.dumps(report, indent=2))
+
+
+def _from_environment() -> None:
+    value = os.environ.get(PROFILE_ENV, "")
+    if value.lower() in {"", "0", "false", "no"}:
+        return
+    memory = os.environ.get(PROFILE_MEMORY_ENV, "").lower() in {"1", "true", "yes"}
+    enable_profiling(memory=memory, log_path=None if value.lower() in {"1", "true", "yes"} else value)
+
+
+_from_environment()
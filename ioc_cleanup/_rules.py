@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import tempfile
+import typing as T
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from . import _models
+
+logger = logging.getLogger(__name__)
+
+Int64Array: T.TypeAlias = npt.NDArray[np.int64]
+Float64Array: T.TypeAlias = npt.NDArray[np.float64]
+BoolArray: T.TypeAlias = npt.NDArray[np.bool_]
+
+# Compiled transformations are cached next to the JSON files, e.g. `transformations/.cache/abur_rad.npz`.
+# Bump `CACHE_VERSION` whenever `Transformation` or the cache layout changes.
+CACHE_DIRNAME = ".cache"
+CACHE_VERSION = 2
+# Smaller files are parsed faster than the cache can be opened, so they are not cached.
+CACHE_MIN_BYTES = 64 * 1024
+# Shorter runs of dropped timestamps take more room as a range than listed one by one.
+COMPACT_MIN_RUN = 3
+_DATETIME_FIELDS = ("dropped_timestamps", "breakpoints")
+_RANGE_FIELDS = ("dropped_date_ranges", "tsunami")
+
+
+@dataclasses.dataclass(frozen=True)
+class Rules:
+    """
+    Compiled form of a `Transformation`.
+
+    All timestamps are stored as sorted `int64` nanoseconds since the epoch,
+    so that applying the rules to a time series only requires `searchsorted`
+    and interval arithmetic instead of Python loops over datetimes.
+    """
+
+    ioc_code: str
+    sensor: str
+    start: np.int64
+    end: np.int64
+    high: float | None
+    low: float | None
+    dropped_ranges: Int64Array  # shape (n, 2), inclusive on both ends
+    dropped_timestamps: Int64Array
+    breakpoints: Int64Array
+    segment_ranges: Int64Array  # shape (n, 2), inclusive on both ends, sorted by start
+    segment_offsets: Float64Array
+    segment_scales: Float64Array
+
+
+def to_ns(values: T.Any) -> Int64Array:
+    """
+    Convert datetimes to `int64` nanoseconds since the epoch.
+
+    Timezone-aware values are converted to UTC and made naive, which is the
+    convention used both by the IOC data and by the transformation files.
+    """
+    index = pd.DatetimeIndex(values)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    return T.cast(Int64Array, index.as_unit("ns").to_numpy().view(np.int64))
+
+
+def _sorted_unique(values: Int64Array) -> Int64Array:
+    # `np.unique` is hash based in recent numpy versions, which is much slower
+    # than sorting for the (mostly already sorted) timestamps of the transformations.
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return T.cast(Int64Array, values[np.concatenate([[True], values[1:] != values[:-1]])])
+
+
+def _ranges_to_ns(ranges: T.Sequence[tuple[T.Any, T.Any]]) -> Int64Array:
+    if not ranges:
+        return np.empty((0, 2), dtype=np.int64)
+    starts, ends = zip(*ranges, strict=True)
+    return np.column_stack([to_ns(starts), to_ns(ends)])
+
+
+def _compile_segments(segments: T.Sequence[_models.Segment]) -> dict[str, T.Any]:
+    ranges = _ranges_to_ns([(segment.start, segment.end) for segment in segments])
+    order = np.argsort(ranges[:, 0], kind="stable")
+    return {
+        "segment_ranges": ranges[order],
+        "segment_offsets": np.array([segment.offset for segment in segments], dtype=np.float64)[order],
+        "segment_scales": np.array([segment.scale_factor for segment in segments], dtype=np.float64)[order],
+    }
+
+
+def compile_rules(transformation: _models.Transformation) -> Rules:
+    """
+    Compile a transformation into sorted `int64` arrays.
+
+    Parameters:
+        transformation: Cleaning transformation.
+
+    Returns:
+        The compiled rules.
+    """
+    dropped_ranges = _ranges_to_ns(transformation.dropped_date_ranges)
+    dropped_ranges = dropped_ranges[np.argsort(dropped_ranges[:, 0], kind="stable")]
+    return Rules(
+        ioc_code=transformation.ioc_code,
+        sensor=transformation.sensor,
+        start=to_ns([transformation.start])[0],
+        end=to_ns([transformation.end])[0],
+        high=transformation.high,
+        low=transformation.low,
+        dropped_ranges=dropped_ranges,
+        dropped_timestamps=_sorted_unique(to_ns(transformation.dropped_timestamps)),
+        breakpoints=_sorted_unique(to_ns(transformation.breakpoints)),
+        **_compile_segments(transformation.segments),
+    )
+
+
+def build_mask(times: Int64Array, rules: Rules) -> BoolArray:
+    """
+    Flag the samples that are removed by `dropped_date_ranges` and `dropped_timestamps`.
+
+    Every rule is treated as an inclusive interval (a dropped timestamp being a
+    zero-length one). The intervals are located in the sorted `times` with
+    `searchsorted` and merged with a cumulative sum over their boundaries, so the
+    cost is `O((n + m) log n)` regardless of how many rules there are.
+
+    Parameters:
+        times: Sorted sample times as `int64` nanoseconds.
+        rules: Compiled rules.
+
+    Returns:
+        Boolean array, `True` where the sample must be dropped.
+    """
+    n = len(times)
+    starts = np.concatenate([rules.dropped_ranges[:, 0], rules.dropped_timestamps])
+    ends = np.concatenate([rules.dropped_ranges[:, 1], rules.dropped_timestamps])
+    if n == 0 or len(starts) == 0:
+        return np.zeros(n, dtype=bool)
+    first = np.searchsorted(times, starts, side="left")
+    last = np.searchsorted(times, ends, side="right")
+    valid = first < last
+    boundaries = np.bincount(first[valid], minlength=n + 1) - np.bincount(last[valid], minlength=n + 1)
+    return np.cumsum(boundaries[:n]) > 0
+
+
+def compact_timestamps(
+    timestamps: Int64Array,
+    interval: int,
+    *,
+    times: Int64Array | None = None,
+    min_run: int = COMPACT_MIN_RUN,
+) -> tuple[Int64Array, Int64Array]:
+    """
+    Fold the runs of consecutive dropped timestamps into inclusive ranges.
+
+    Two timestamps are consecutive if they are exactly `interval` apart and, when
+    the sample `times` are given, no sample lies between them. In that case the
+    ranges drop exactly the same samples of `times` as the timestamps did.
+
+    Parameters:
+        timestamps: Dropped timestamps as `int64` nanoseconds.
+        interval: Sampling interval in nanoseconds.
+        times: Sorted sample times as `int64` nanoseconds.
+        min_run: Minimum number of timestamps of a run to fold.
+
+    Returns:
+        The ranges, shape `(n, 2)`, and the timestamps that are not part of any of them.
+    """
+    timestamps = _sorted_unique(timestamps)
+    joined = np.diff(timestamps) == interval
+    if times is not None and len(timestamps):
+        # the samples strictly between two timestamps: a raw series that is not on the grid
+        between = np.searchsorted(times, timestamps[1:], side="left") - np.searchsorted(
+            times,
+            timestamps[:-1],
+            side="right",
+        )
+        joined &= between == 0
+    # runs are delimited by the steps that do not join two timestamps
+    edges = np.flatnonzero(~joined) + 1
+    starts = np.concatenate([[0], edges])
+    ends = np.concatenate([edges, [len(timestamps)]])
+    folded = ends - starts >= max(min_run, 2)
+    ranges = np.column_stack([timestamps[starts[folded]], timestamps[ends[folded] - 1]]).astype(np.int64)
+    in_range = np.repeat(folded, ends - starts)
+    return ranges, T.cast(Int64Array, timestamps[~in_range])
+
+
+def clip_rules(rules: Rules, start: np.int64, end: np.int64) -> Rules:
+    """
+    Restrict rules to the `[start, end]` window.
+
+    The valid window becomes the intersection of the two windows (it is empty
+    when `start > end` afterwards) and only the dropped ranges and timestamps that
+    overlap it are kept, so applying them to a short series does not pay for the
+    whole record. Breakpoints are kept as they are, since they delimit segments
+    that extend beyond the window.
+
+    Parameters:
+        rules: Compiled rules.
+        start: Window start as `int64` nanoseconds.
+        end: Window end as `int64` nanoseconds (inclusive).
+
+    Returns:
+        The clipped rules.
+    """
+    start = max(rules.start, start)
+    end = min(rules.end, end)
+    ranges = rules.dropped_ranges
+    ranges = ranges[(ranges[:, 1] >= start) & (ranges[:, 0] <= end)]
+    timestamps = rules.dropped_timestamps
+    timestamps = timestamps[np.searchsorted(timestamps, start) : np.searchsorted(timestamps, end, side="right")]
+    overlapping = (rules.segment_ranges[:, 1] >= start) & (rules.segment_ranges[:, 0] <= end)
+    return dataclasses.replace(
+        rules,
+        start=start,
+        end=end,
+        dropped_ranges=ranges,
+        dropped_timestamps=timestamps,
+        segment_ranges=rules.segment_ranges[overlapping],
+        segment_offsets=rules.segment_offsets[overlapping],
+        segment_scales=rules.segment_scales[overlapping],
+    )
+
+
+def without_segments(rules: Rules) -> Rules:
+    """
+    Return the rules without their segment corrections.
+    """
+    overlapping = np.zeros(len(rules.segment_ranges), dtype=bool)
+    return dataclasses.replace(
+        rules,
+        segment_ranges=rules.segment_ranges[overlapping],
+        segment_offsets=rules.segment_offsets[overlapping],
+        segment_scales=rules.segment_scales[overlapping],
+    )
+
+
+def segment_ids(times: Int64Array, breakpoints: Int64Array) -> Int64Array:
+    """
+    Assign every sample to the segment delimited by `breakpoints`.
+
+    Segment `i` is `[breakpoints[i - 1], breakpoints[i])`: a breakpoint is the
+    first sample of the segment that follows it.
+
+    Parameters:
+        times: Sample times as `int64` nanoseconds, in any order.
+        breakpoints: Sorted breakpoints as `int64` nanoseconds.
+
+    Returns:
+        The segment of every sample, between `0` and `len(breakpoints)`.
+    """
+    return np.searchsorted(breakpoints, times, side="right")
+
+
+def demean_segments(values: Float64Array, times: Int64Array, breakpoints: Int64Array) -> Float64Array:
+    """
+    Subtract from every sample the mean of its segment, in place.
+
+    All the segment means are computed with a single grouped reduction
+    (`np.bincount`); NaN samples are ignored and left untouched.
+
+    Parameters:
+        values: Sample values. Modified in place.
+        times: Sample times as `int64` nanoseconds.
+        breakpoints: Sorted breakpoints as `int64` nanoseconds.
+
+    Returns:
+        `values`.
+    """
+    ids = segment_ids(times, breakpoints)
+    valid = ~np.isnan(values)
+    n_segments = len(breakpoints) + 1
+    sums = np.bincount(ids[valid], weights=values[valid], minlength=n_segments)
+    counts = np.bincount(ids[valid], minlength=n_segments)
+    means = sums / np.maximum(counts, 1)
+    values -= means[ids]
+    return values
+
+
+def correct_segments(values: Float64Array, times: Int64Array, rules: Rules) -> Float64Array:
+    """
+    Apply the `offset`/`scale_factor` corrections of the segments, in place.
+
+    Every sample is corrected at most once: where segments overlap (e.g. when
+    one ends where the next one starts), the one that starts last applies.
+
+    Parameters:
+        values: Sample values. Modified in place.
+        times: Sorted sample times as `int64` nanoseconds.
+        rules: Compiled rules.
+
+    Returns:
+        `values`.
+    """
+    if len(rules.segment_ranges) == 0 or len(times) == 0:
+        return values
+    first = np.searchsorted(times, rules.segment_ranges[:, 0], side="left")
+    last = np.searchsorted(times, rules.segment_ranges[:, 1], side="right")
+    ids = np.full(len(times), -1, dtype=np.int64)
+    for segment, (lo, hi) in enumerate(zip(first, last, strict=True)):
+        ids[lo:hi] = segment
+    covered = ids >= 0
+    values[covered] = values[covered] * rules.segment_scales[ids[covered]] + rules.segment_offsets[ids[covered]]
+    return values
+
+
+def apply_rules(df: pd.DataFrame, rules: Rules) -> pd.DataFrame:
+    """
+    Apply compiled rules to a DataFrame in a single pass.
+
+    The DataFrame is clipped to the `[start, end]` window, the dropped samples are
+    set to NaN in every column, the `high`/`low` thresholds are enforced on the
+    sensor column and the segment corrections are applied to it.
+
+    Parameters:
+        df: Raw IOC data indexed by time.
+        rules: Compiled rules.
+
+    Returns:
+        A new DataFrame with the rules applied.
+    """
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    times = to_ns(df.index)
+    lo = np.searchsorted(times, rules.start, side="left")
+    hi = np.searchsorted(times, rules.end, side="right")
+    df = df.iloc[lo:hi].copy()
+    mask = build_mask(times[lo:hi], rules)
+    if mask.any():
+        df.iloc[np.flatnonzero(mask)] = np.nan
+    if rules.sensor in df.columns and (rules.high is not None or rules.low is not None):
+        values = df[rules.sensor].to_numpy()
+        out_of_bounds = np.zeros(len(df), dtype=bool)
+        if rules.high is not None:
+            out_of_bounds |= values > rules.high
+        if rules.low is not None:
+            out_of_bounds |= values < rules.low
+        if out_of_bounds.any():
+            df.loc[out_of_bounds, rules.sensor] = np.nan
+    if rules.sensor in df.columns and len(rules.segment_ranges):
+        values = df[rules.sensor].to_numpy(dtype=np.float64, copy=True)
+        df[rules.sensor] = correct_segments(values, times[lo:hi], rules)
+    return df
+
+
+def from_arrays(arrays: T.Mapping[str, npt.NDArray[T.Any]]) -> Rules:
+    """
+    Compile rules from the arrays stored in the cache (see `read_cache`).
+    """
+    meta = json.loads(str(arrays["meta"]))
+    dropped_ranges = arrays["dropped_date_ranges"]
+    dropped_ranges = dropped_ranges[np.argsort(dropped_ranges[:, 0], kind="stable")]
+    return Rules(
+        ioc_code=meta["ioc_code"],
+        sensor=meta["sensor"],
+        start=arrays["window"][0],
+        end=arrays["window"][1],
+        high=meta["high"],
+        low=meta["low"],
+        dropped_ranges=dropped_ranges,
+        dropped_timestamps=_sorted_unique(arrays["dropped_timestamps"]),
+        breakpoints=_sorted_unique(arrays["breakpoints"]),
+        **_compile_segments([_models.Segment.model_validate(segment) for segment in meta["segments"]]),
+    )
+
+
+def to_datetimes(values: Int64Array) -> list[T.Any]:
+    return T.cast(list[T.Any], values.view("datetime64[ns]").astype("datetime64[us]").tolist())
+
+
+def to_transformation(arrays: T.Mapping[str, npt.NDArray[T.Any]]) -> _models.Transformation:
+    """
+    Rebuild a `Transformation` from the arrays stored in the cache.
+
+    Only the small scalar fields go through pydantic validation; the large
+    datetime lists are converted straight from `int64` arrays.
+    """
+    model = _models.Transformation.model_validate_json(str(arrays["meta"]))
+    update: dict[str, T.Any] = {name: to_datetimes(arrays[name]) for name in _DATETIME_FIELDS}
+    for name in _RANGE_FIELDS:
+        update[name] = [tuple(pair) for pair in to_datetimes(arrays[name])]
+    return model.model_copy(update=update)
+
+
+def without_timestamps(transformation: _models.Transformation) -> _models.Transformation:
+    """
+    Return the transformation without its timestamp lists, like the `meta` array of the cache.
+    """
+    return transformation.model_copy(update={name: [] for name in _DATETIME_FIELDS + _RANGE_FIELDS})
+
+
+def cache_path(path: str | os.PathLike[str]) -> Path:
+    path = Path(path)
+    return path.parent / CACHE_DIRNAME / f"{path.stem}.npz"
+
+
+def _signature(path: str | os.PathLike[str]) -> Int64Array:
+    stat = os.stat(path)
+    return np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def read_cache(
+    path: str | os.PathLike[str],
+    names: T.Collection[str] | None = None,
+) -> dict[str, npt.NDArray[T.Any]] | None:
+    """
+    Return the cached arrays of a transformation JSON file.
+
+    Parameters:
+        path: Path to the transformation JSON file.
+        names: Only read these arrays, e.g. `["meta"]`. Defaults to all of them.
+
+    Returns:
+        The cached arrays, or `None` if there is no cache or if it is stale,
+        i.e. the JSON file has been modified since the cache was written.
+    """
+    try:
+        with np.load(cache_path(path), allow_pickle=False) as npz:
+            # the members of the archive are only read when accessed
+            arrays = {name: npz[name] for name in npz.files if names is None or name in {"signature", *names}}
+    except (OSError, ValueError, KeyError):
+        return None
+    signature = arrays.get("signature")
+    if signature is None or not np.array_equal(signature, _signature(path)):
+        return None
+    return arrays
+
+
+def write_cache(path: str | os.PathLike[str], transformation: _models.Transformation) -> None:
+    """
+    Compile a transformation to `int64` arrays and store them next to its JSON file.
+
+    The cache is written atomically, so concurrent readers (e.g. statistics
+    workers) never see a partial file. Failures are logged and ignored, since
+    the cache is only an optimization. Files smaller than `CACHE_MIN_BYTES`
+    are not cached.
+
+    Parameters:
+        path: Path to the transformation JSON file the model was loaded from.
+        transformation: The parsed transformation.
+    """
+    signature = _signature(path)
+    if signature[2] < CACHE_MIN_BYTES:
+        return
+    dest = cache_path(path)
+    arrays: dict[str, T.Any] = {
+        "signature": signature,
+        "meta": np.array(transformation.model_dump_json(exclude=set(_DATETIME_FIELDS + _RANGE_FIELDS))),
+        "window": to_ns([transformation.start, transformation.end]),
+    }
+    for name in _DATETIME_FIELDS:
+        arrays[name] = to_ns(getattr(transformation, name))
+    for name in _RANGE_FIELDS:
+        arrays[name] = _ranges_to_ns(getattr(transformation, name))
+    try:
+        dest.parent.mkdir(exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=dest.parent, suffix=".tmp", delete=False) as fd:
+            try:
+                np.savez(fd, **arrays)
+            except BaseException:
+                os.unlink(fd.name)
+                raise
+        os.replace(fd.name, dest)
+    except OSError as e:
+        logger.debug("Could not write transformation cache %s: %s", dest, e)
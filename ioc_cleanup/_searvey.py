@@ -1,36 +1,62 @@
 from __future__ import annotations
 
+import contextlib
+import fcntl
 import functools
+import json
 import logging
 import os
 import typing as T
+from collections import abc
 from pathlib import Path
 
 import geopandas as gpd
+import httpx
+import multifutures
 import pandas as pd
+import pyarrow.parquet as pq
 import searvey
 
+from . import _constants
+from . import _profiling
+from . import _store
+
 logger = logging.getLogger(__name__)
 
+MANIFEST = "manifest.json"
 
-@functools.cache
-def get_meta() -> gpd.GeoDataFrame:
+
+def ioc_base_url(base_url: str | None = None) -> str | None:
     """
-    Retrieve IOC station metadata with geographic coordinates.
+    Return the server to query instead of the IOC one: `base_url`, else `$IOC_CLEANUP_BASE_URL`, else `None`.
+    """
+    return base_url or os.environ.get("IOC_CLEANUP_BASE_URL") or None
+
+
+def fetch_meta(*, base_url: str | None = None) -> gpd.GeoDataFrame:
+    """
+    Retrieve IOC station metadata with geographic coordinates from the network.
 
     Metadata are collected from both the IOC web service and the IOC API
     and merged into a single GeoDataFrame.
 
+    Parameters:
+        base_url: Optional server to query instead of the IOC one, e.g. a
+            `StandInServer`. Defaults to `$IOC_CLEANUP_BASE_URL`. Such a server
+            only provides the IOC API station list, so the returned metadata
+            are limited to its columns.
+
     Returns:
         GeoDataFrame containing IOC station codes, longitude, latitude,
         and geometry in EPSG:4326.
     """
+    base_url = ioc_base_url(base_url)
+    api_url = f"{base_url or 'http://www.ioc-sealevelmonitoring.org'}/service.php?query=stationlist&showall=all"
+    meta_api = pd.read_json(api_url).drop_duplicates().rename(columns={"Code": "ioc_code"})
+    if base_url is not None:
+        meta = meta_api.rename(columns={"Lon": "lon", "Lat": "lat", "Location": "location"})
+        return gpd.GeoDataFrame(meta, geometry=gpd.points_from_xy(meta.lon, meta.lat, crs="EPSG:4326"))
     meta_web = searvey.get_ioc_stations()
-    meta_api = (
-        pd.read_json("http://www.ioc-sealevelmonitoring.org/service.php?query=stationlist&showall=all")
-        .drop_duplicates()
-        .rename(columns={"Code": "ioc_code"})
-    )
 
     merged = pd.merge(
         meta_web.drop(columns=["lon", "lat", "geometry"]),
@@ -44,7 +70,109 @@ def get_meta() -> gpd.GeoDataFrame:
     return merged
 
 
-def download_raw(ioc_codes: list[str], start: pd.Timestamp, end: pd.Timestamp) -> dict[str, pd.DataFrame]:
+def is_offline() -> bool:
+    return os.environ.get("IOC_CLEANUP_OFFLINE", "").lower() in {"1", "true", "yes"}
+
+
+def refresh_meta(path: str | os.PathLike[str] = _constants.META_PATH) -> gpd.GeoDataFrame:
+    """
+    Download the IOC station metadata and store them as a GeoParquet snapshot.
+
+    The snapshot is only ever written from the IOC server: the station list of a
+    stand-in (see `fetch_meta`) lacks most columns, so this raises while
+    `$IOC_CLEANUP_BASE_URL` is set.
+
+    Parameters:
+        path: Destination of the snapshot.
+
+    Returns:
+        The downloaded metadata.
+    """
+    if is_offline():
+        raise RuntimeError("Cannot refresh the IOC metadata while IOC_CLEANUP_OFFLINE is set")
+    if ioc_base_url() is not None:
+        raise RuntimeError("Cannot refresh the IOC metadata snapshot while IOC_CLEANUP_BASE_URL is set")
+    meta = fetch_meta()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    meta.to_parquet(tmp)
+    os.replace(tmp, path)
+    logger.info("Saved IOC metadata snapshot: %s", path)
+    get_meta.cache_clear()
+    return meta
+
+
+@functools.cache
+def get_meta(
+    path: str | os.PathLike[str] = _constants.META_PATH,
+    ttl: pd.Timedelta = _constants.META_TTL,
+) -> gpd.GeoDataFrame:
+    """
+    Retrieve IOC station metadata with geographic coordinates.
+
+    The metadata are read from a local GeoParquet snapshot. The snapshot is
+    (re)downloaded with `refresh_meta` when it is missing or older than `ttl`,
+    unless the `IOC_CLEANUP_OFFLINE` environment variable is set. If the
+    download fails, a stale snapshot is used instead. While `IOC_CLEANUP_BASE_URL`
+    is set, the snapshot is used as is, or the stand-in metadata are returned
+    without being stored if there is none. The result is cached in memory for
+    the lifetime of the process.
+
+    Parameters:
+        path: Location of the snapshot. Defaults to `$IOC_CLEANUP_META_PATH`
+            or `~/.cache/ioc_cleanup/ioc_meta.parquet`.
+        ttl: Maximum age of the snapshot before it gets refreshed.
+
+    Returns:
+        GeoDataFrame containing IOC station codes, longitude, latitude,
+        and geometry in EPSG:4326.
+    """
+    path = Path(path)
+    redirected = ioc_base_url() is not None
+    if path.exists():
+        age = pd.Timestamp.now() - pd.Timestamp.fromtimestamp(path.stat().st_mtime)
+        if age <= ttl or is_offline() or redirected:
+            return gpd.read_parquet(path)
+        try:
+            return refresh_meta(path)
+        except Exception as e:
+            logger.warning("Could not refresh the IOC metadata, using stale snapshot %s: %s", path, e)
+            return gpd.read_parquet(path)
+    if is_offline():
+        raise FileNotFoundError(
+            f"No IOC metadata snapshot at {path}. Run `python scripts/refresh_meta.py` while online.",
+        )
+    if redirected:
+        # the stand-in metadata must not end up in the snapshot of the real ones
+        return fetch_meta()
+    return refresh_meta(path)
+
+
+def _redirect_client(base_url: str) -> httpx.Client:
+    """
+    Return a client sending every request to `base_url` instead of the IOC server.
+    """
+    target = httpx.URL(base_url)
+
+    def redirect(request: httpx.Request) -> None:
+        request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+        request.headers["Host"] = target.netloc.decode()
+
+    return httpx.Client(timeout=httpx.Timeout(timeout=10, read=30), event_hooks={"request": [redirect]})
+
+
+def download_raw(
+    ioc_codes: list[str],
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    *,
+    base_url: str | None = None,
+    http_client: httpx.Client | None = None,
+    rate_limit: multifutures.RateLimit | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    parse_executor: multifutures.ExecutorProtocol | None = None,
+) -> dict[str, pd.DataFrame]:
     """
     Download raw IOC sea-level data for multiple stations.
 
@@ -52,81 +180,252 @@ def download_raw(ioc_codes: list[str], start: pd.Timestamp, end: pd.Timestamp) -
         ioc_codes: List of IOC station codes.
         start: Start timestamp.
         end: End timestamp.
+        base_url: Optional server to query instead of the IOC one, e.g. a
+            `StandInServer`. Defaults to `$IOC_CLEANUP_BASE_URL`.
+        http_client: Optional `httpx.Client`. It is closed once the download is over.
+        rate_limit: Maximum request rate. Defaults to the searvey one (5 requests/second).
+        executor: Thread pool of the requests. Defaults to the multifutures one.
+        parse_executor: Pool parsing the responses. Defaults to a new process pool,
+            whose startup dominates small downloads; a thread pool is faster then.
 
     Returns:
         Dictionary mapping station codes to raw dataframes.
     """
+    base_url = ioc_base_url(base_url)
+    if http_client is None and base_url is not None:
+        http_client = _redirect_client(base_url)
     no_codes = len(ioc_codes)
     start_dates = pd.DatetimeIndex([start] * no_codes)
     end_dates = pd.DatetimeIndex([end] * no_codes)
-    dataframes: dict[str, pd.DataFrame] = searvey._ioc_api._fetch_ioc(
-        station_ids=ioc_codes,
-        start_dates=start_dates,
-        end_dates=end_dates,
-        http_client=None,
-        rate_limit=None,
-        multiprocessing_executor=None,
-        multithreading_executor=None,
-        progress_bar=False,
-    )
+    with _profiling.profile_stage("download", station=ioc_codes[0] if no_codes == 1 else None) as stage:
+        dataframes: dict[str, pd.DataFrame] = searvey._ioc_api._fetch_ioc(
+            station_ids=ioc_codes,
+            start_dates=start_dates,
+            end_dates=end_dates,
+            http_client=http_client,
+            rate_limit=rate_limit,
+            multiprocessing_executor=parse_executor,
+            multithreading_executor=executor,
+            progress_bar=False,
+        )
+        stage.rows = sum(len(df) for df in dataframes.values())
     return dataframes
 
 
+def read_manifest(data_folder: str | os.PathLike[str] = "./data") -> dict[str, dict[str, T.Any]]:
+    """
+    Return the download manifest of a data tree.
+
+    The manifest maps `<station>/<year>` to the time range that has been
+    requested from the IOC server so far (`start`, `end`), the number of rows
+    stored (`rows`) and the time of the last update (`updated`).
+
+    Parameters:
+        data_folder: Base directory of the downloaded data.
+
+    Returns:
+        The manifest, empty if nothing has been downloaded yet.
+    """
+    path = Path(data_folder) / MANIFEST
+    try:
+        return T.cast(dict[str, dict[str, T.Any]], json.loads(path.read_text()))
+    except FileNotFoundError:
+        return {}
+
+
+@contextlib.contextmanager
+def _manifest_lock(data_folder: Path) -> abc.Iterator[None]:
+    # an advisory lock on a separate file, so that concurrent downloads (threads or processes)
+    # do not overwrite each other's read-modify-write of the manifest
+    data_folder.mkdir(parents=True, exist_ok=True)
+    with (data_folder / f".{MANIFEST}.lock").open("a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _update_manifest(
+    data_folder: Path,
+    station: str,
+    year: int,
+    *,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    rows: int,
+) -> None:
+    with _manifest_lock(data_folder):
+        manifest = read_manifest(data_folder)
+        entry = manifest.get(f"{station}/{year}", {})
+        if "start" in entry:
+            start = min(start, pd.Timestamp(entry["start"]))
+        manifest[f"{station}/{year}"] = {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "rows": rows,
+            "updated": pd.Timestamp.now("UTC").tz_localize(None).isoformat(timespec="seconds"),
+        }
+        path = data_folder / MANIFEST
+        tmp = path.with_name(f".{MANIFEST}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        os.replace(tmp, path)
+
+
 def download_year_station(
     station: str,
     year: int,
     data_folder: str = "./data",
+    *,
+    partitioned: bool = False,
+    incremental: bool = False,
+    base_url: str | None = None,
+    http_client: httpx.Client | None = None,
+    rate_limit: multifutures.RateLimit | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    parse_executor: multifutures.ExecutorProtocol | None = None,
 ) -> None:
     """
     Download and store one year of IOC data for a single station.
 
-    Data are saved as Parquet files under `<data_folder>/<year>/`.
+    Data are saved as Parquet files under `<data_folder>/<year>/`, or under
+    `<data_folder>/station=<station>/year=<year>/` if `partitioned` is set.
+    Files are replaced atomically, and the downloaded time range is recorded
+    in `<data_folder>/manifest.json` (see `read_manifest`).
 
     Parameters:
         station: IOC station code.
         year: Year to download.
         data_folder: Base directory for storing downloaded data.
+        partitioned: Whether to use the partitioned store layout.
+        incremental: Only download the data after the last stored timestamp
+            and merge them with the existing file. Meant for refreshing the
+            current year.
+        base_url: Optional server to query instead of the IOC one, see `download_raw`.
+        http_client: Optional `httpx.Client`, see `download_raw`.
+        rate_limit: Maximum request rate, see `download_raw`.
+        executor: Thread pool of the requests, see `download_raw`.
+        parse_executor: Pool parsing the responses, see `download_raw`.
     """
     data_folder = os.path.abspath(data_folder)
-    year_folder = os.path.join(data_folder, str(year))
-    os.makedirs(year_folder, exist_ok=True)
     try:
-        start = pd.Timestamp(f"{year}-01-01")
-        end = pd.Timestamp(f"{year}-12-31T23:59:59")
-        dict_df = download_raw([station], start, end)
-        df = dict_df[station]
-        if not df.empty:
-            df.to_parquet(f"{year_folder}/{station}.parquet")
-            logger.info(f"  Saved {station} for {year}")
+        start, end, existing = _requested_span(
+            station,
+            year,
+            Path(data_folder),
+            partitioned=partitioned,
+            incremental=incremental,
+        )
+        if start >= end:
+            logger.info(f"  {station} for {year} is up to date")
+            return
+        dict_df = download_raw(
+            [station],
+            start,
+            end,
+            base_url=base_url,
+            http_client=http_client,
+            rate_limit=rate_limit,
+            executor=executor,
+            parse_executor=parse_executor,
+        )
+        df = _store_year(dict_df[station], station, year, Path(data_folder), partitioned=partitioned, existing=existing)
+        _update_manifest(Path(data_folder), station, year, start=start, end=end, rows=len(df))
     except Exception as e:
         logger.error(f"Error for {station} in {year}: {e}")
 
 
-def load_station(
+def _requested_span(
     station: str,
-    data_dir: Path = Path("./data"),
-    start_year: int = 2011,
-    end_year: int = 2024,
-) -> pd.DataFrame:
+    year: int,
+    data_folder: Path,
+    *,
+    partitioned: bool,
+    incremental: bool,
+) -> tuple[pd.Timestamp, pd.Timestamp, pd.DataFrame]:
     """
-    Load multi-year IOC data for a station from local Parquet files.
+    Return the time range of `year` to request for `station`, and the data already stored if `incremental`.
+    """
+    start = pd.Timestamp(f"{year}-01-01")
+    end = pd.Timestamp(f"{year}-12-31T23:59:59")
+    existing = pd.DataFrame()
+    if incremental:
+        end = min(end, pd.Timestamp.now("UTC").tz_localize(None).floor("s"))
+        path = data_folder / str(year) / f"{station}.parquet"
+        if partitioned:
+            existing = _store.load_station(station, data_folder, year, year + 1)
+        elif path.exists():
+            existing = pd.read_parquet(path)
+        if not existing.empty:
+            # the last stored timestamp is requested again, so that a partially published minute is completed
+            start = existing.index.max()
+    return start, end, existing
 
-    Parameters:
-        station: IOC station code.
-        data_dir: Base directory containing yearly Parquet files.
-        start_year: First year to load (inclusive).
-        end_year: Last year to load (exclusive).
+
+def _store_year(
+    df: pd.DataFrame,
+    station: str,
+    year: int,
+    data_folder: Path,
+    *,
+    partitioned: bool,
+    existing: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Merge the downloaded `df` with the `existing` data and replace the stored year atomically.
 
     Returns:
-        Concatenated DataFrame containing the available station data.
-        Returns an empty DataFrame if no data are found.
+        The stored data.
     """
+    if not existing.empty:
+        df = pd.concat([existing, df])
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+    if not df.empty:
+        if partitioned:
+            _store.write_station_year(df, station, year, data_folder)
+        else:
+            path = data_folder / str(year) / f"{station}.parquet"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            df.to_parquet(tmp)
+            os.replace(tmp, path)
+        logger.info(f"  Saved {station} for {year}")
+    return df
+
+
+def _read_station(
+    station: str,
+    data_dir: Path,
+    start_year: int,
+    end_year: int,
+    *,
+    columns: list[str] | None,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+) -> pd.DataFrame:
+    if _store.is_store(station, data_dir):
+        df = _store.load_station(station, data_dir, start_year, end_year, columns=columns, start=start, end=end)
+        if df.empty:
+            logger.error(f"No data found for station {station}")
+        return df
+
     dfs = []
     for year in range(start_year, end_year):
         path = data_dir / str(year) / f"{station}.parquet"
         if not os.path.exists(path):
             continue
-        df = pd.read_parquet(path)
+        if columns is None:
+            df = pd.read_parquet(path)
+        else:
+            available = set(pq.read_schema(path).names)
+            year_columns = [column for column in columns if column in available]
+            if not year_columns:
+                continue
+            df = pd.read_parquet(path, columns=year_columns)
+        if start is not None:
+            df = df[df.index >= start]
+        if end is not None:
+            df = df[df.index <= end]
         if df.empty:
             continue
         dfs.append(df)
@@ -136,3 +435,40 @@ def load_station(
     else:
         logger.error(f"No data found for station {station}")
         return pd.DataFrame()
+
+
+def load_station(
+    station: str,
+    data_dir: Path = Path("./data"),
+    start_year: int = 2011,
+    end_year: int = 2024,
+    *,
+    columns: list[str] | None = None,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """
+    Load multi-year IOC data for a station from local Parquet files.
+
+    Both the `<data_dir>/<year>/<station>.parquet` layout and the partitioned
+    store created by `scripts/migrate_store.py` are supported. With the latter,
+    the year, column and time filters are pushed down to the Parquet row groups.
+
+    Parameters:
+        station: IOC station code.
+        data_dir: Base directory containing yearly Parquet files.
+        start_year: First year to load (inclusive).
+        end_year: Last year to load (exclusive).
+        columns: Sensor columns to read. Defaults to all of them. Years that
+            contain none of the requested sensors are skipped.
+        start: Optional first timestamp to load (inclusive).
+        end: Optional last timestamp to load (inclusive).
+
+    Returns:
+        Concatenated DataFrame containing the available station data.
+        Returns an empty DataFrame if no data are found.
+    """
+    with _profiling.profile_stage("load_station", station=station) as stage:
+        df = _read_station(station, data_dir, start_year, end_year, columns=columns, start=start, end=end)
+        stage.rows = len(df)
+    return df
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+from collections import abc
+from pathlib import Path
+
+import bottleneck as bn
+import multifutures
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from . import _profiling
+from . import _rules
+from . import _searvey
+from . import _tools
+
+logger = logging.getLogger(__name__)
+
+# The window must be much longer than a spike and much shorter than the tide
+SPIKE_WINDOW = pd.Timedelta("1h")
+# In robust standard deviations (1.4826 * MAD)
+SPIKE_THRESHOLD = 6.0
+# In the units of the data (metres), so that quantized or flat stretches with a
+# zero MAD do not turn every tiny step into a spike
+SPIKE_MIN_DEVIATION = 0.1
+# Consecutive spikes at least this long are proposed as a range
+SPIKE_MIN_RUN = 3
+MAD_SCALE = 1.4826
+SPIKE_COLUMNS = [
+    "station",
+    "sensor",
+    "status",
+    "samples",
+    "spikes",
+    "dropped_timestamps",
+    "dropped_date_ranges",
+    "path",
+    "error",
+]
+
+
+def _centered_median(
+    values: npt.NDArray[np.float64],
+    size: int,
+    breaks: npt.NDArray[np.intp],
+) -> npt.NDArray[np.float64]:
+    # `move_median` is a trailing window: pad the end and shift it back by half a window.
+    # Half a window of NaNs is also inserted at every break, so that no window spans one.
+    half = size // 2
+    padded = np.insert(values, np.repeat(breaks, half), np.nan)
+    padded = np.concatenate([padded, np.full(half, np.nan)])
+    positions = np.arange(len(values)) + half * np.searchsorted(breaks, np.arange(len(values)), side="right")
+    return T.cast(npt.NDArray[np.float64], bn.move_median(padded, size, min_count=1)[half:][positions])
+
+
+def window_samples(sr: pd.Series, window: pd.Timedelta = SPIKE_WINDOW) -> int:
+    """
+    Return the (odd) number of samples of `sr` covering `window` at its main sampling interval.
+    """
+    steps = np.diff(_rules.to_ns(sr.index))
+    steps = steps[steps > 0]
+    if len(steps) == 0:
+        return 3
+    values, counts = np.unique(steps, return_counts=True)
+    size = max(3, round(window.value / values[np.argmax(counts)]))
+    return int(size | 1)
+
+
+def spike_scores(sr: pd.Series, *, window: pd.Timedelta = SPIKE_WINDOW) -> pd.DataFrame:
+    """
+    Score every sample against its neighbours with a rolling median and MAD.
+
+    The deviation of a sample is its distance to the median of the `window`
+    centered on it, and its score that deviation in robust standard deviations
+    (`1.4826 * MAD` over the same window). Missing values are skipped, so the
+    window spans the same number of valid samples, except that it never
+    extends across a gap longer than half a window. Both filters are
+    `O(n log window)`, which takes well under a second for six years of
+    one-minute data.
+
+    Parameters:
+        sr: Time series, sorted by time, e.g. a cleaned or detided series.
+        window: Length of the rolling window.
+
+    Returns:
+        DataFrame indexed like the valid samples of `sr`, with `deviation` and `score` columns.
+    """
+    sr = sr.dropna()
+    values = sr.to_numpy(dtype=np.float64)
+    size = window_samples(sr, window)
+    # the level may have changed a lot across a long gap, e.g. with the tide
+    breaks = np.flatnonzero(np.diff(_rules.to_ns(sr.index)) > window.value // 2) + 1
+    deviation = np.abs(values - _centered_median(values, size, breaks))
+    scale = MAD_SCALE * _centered_median(deviation, size, breaks)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(deviation > 0, deviation / scale, 0.0)
+    return pd.DataFrame({"deviation": deviation, "score": score}, index=sr.index)
+
+
+def find_spikes(
+    sr: pd.Series,
+    *,
+    window: pd.Timedelta = SPIKE_WINDOW,
+    threshold: float = SPIKE_THRESHOLD,
+    min_deviation: float = SPIKE_MIN_DEVIATION,
+) -> pd.DatetimeIndex:
+    """
+    Return the timestamps of the spikes of `sr`.
+
+    A sample is a spike if its score (see `spike_scores`) exceeds `threshold` and
+    it deviates from the rolling median by more than `min_deviation`.
+
+    Parameters:
+        sr: Time series, sorted by time.
+        window: Length of the rolling window.
+        threshold: Minimum score, in robust standard deviations.
+        min_deviation: Minimum absolute deviation, in the units of `sr`.
+
+    Returns:
+        The timestamps of the spikes, sorted.
+    """
+    scores = spike_scores(sr, window=window)
+    spikes = (scores.score.to_numpy() > threshold) & (scores.deviation.to_numpy() > min_deviation)
+    return pd.DatetimeIndex(scores.index[spikes])
+
+
+def propose_spikes(
+    sr: pd.Series,
+    *,
+    window: pd.Timedelta = SPIKE_WINDOW,
+    threshold: float = SPIKE_THRESHOLD,
+    min_deviation: float = SPIKE_MIN_DEVIATION,
+    min_run: int = SPIKE_MIN_RUN,
+) -> dict[str, list[T.Any]]:
+    """
+    Detect the spikes of `sr` and express them as transformation rules.
+
+    Runs of at least `min_run` spikes that are consecutive valid samples become
+    a `dropped_date_ranges` entry, the other ones `dropped_timestamps`.
+
+    Parameters:
+        sr: Time series, sorted by time, e.g. the cleaned series of a station, so
+            that already dropped samples are not proposed again.
+        window: Length of the rolling window.
+        threshold: Minimum score, in robust standard deviations.
+        min_deviation: Minimum absolute deviation, in the units of `sr`.
+        min_run: Minimum number of consecutive spikes proposed as a range.
+
+    Returns:
+        The `dropped_timestamps` and `dropped_date_ranges` keyword arguments of `merge_selection`.
+    """
+    sr = sr.dropna()
+    spikes = find_spikes(sr, window=window, threshold=threshold, min_deviation=min_deviation)
+    # the runs are consecutive in position, i.e. no valid sample lies between them
+    positions = sr.index.get_indexer(spikes).astype(np.int64)
+    ranges, single = _rules.compact_timestamps(positions, 1, min_run=min_run)
+    return {
+        "dropped_timestamps": sr.index[single].to_list(),
+        "dropped_date_ranges": list(zip(sr.index[ranges[:, 0]], sr.index[ranges[:, 1]], strict=True)),
+    }
+
+
+def detect_station(
+    path: Path,
+    data_dir: Path,
+    *,
+    detide: bool,
+    lat: float | None,
+    out_dir: Path | None,
+    options: dict[str, T.Any],
+) -> dict[str, T.Any]:
+    """
+    Propose the spikes of one transformation that it does not drop yet.
+
+    Returns:
+        One row of the `detect_spikes` summary.
+    """
+    trans = _tools.load_transformation_from_path(path)
+    row: dict[str, T.Any] = {"station": trans.ioc_code, "sensor": trans.sensor, "samples": 0, "spikes": 0}
+    signal = _tools.load_transformed_ts(trans, data_dir, demean=True, detide=detide, lat=lat)
+    if signal.empty:
+        return {**row, "status": "no data"}
+    with _profiling.profile_stage("spikes", station=trans.ioc_code, rows=len(signal)):
+        proposal = propose_spikes(signal, **options)
+    row["samples"] = len(signal)
+    row.update(proposal)
+    ranges = pd.DataFrame(proposal["dropped_date_ranges"], columns=["start", "end"])
+    # every range spans consecutive valid samples
+    in_ranges = np.searchsorted(signal.index, ranges.end, side="right") - np.searchsorted(signal.index, ranges.start)
+    row["spikes"] = len(proposal["dropped_timestamps"]) + int(in_ranges.sum())
+    if row["spikes"] == 0:
+        return {**row, "status": "clean"}
+    if out_dir is not None:
+        row["path"] = out_dir / path.name
+        _tools.dump_transformation(_tools.merge_selection(trans, **proposal), out_dir)
+    return {**row, "status": "proposed"}
+
+
+def detect_spikes(
+    paths: abc.Iterable[Path] | None = None,
+    data_dir: Path = Path("./data"),
+    out_dir: Path | None = None,
+    *,
+    detide: bool = False,
+    window: pd.Timedelta = SPIKE_WINDOW,
+    threshold: float = SPIKE_THRESHOLD,
+    min_deviation: float = SPIKE_MIN_DEVIATION,
+    min_run: int = SPIKE_MIN_RUN,
+    meta: pd.DataFrame | None = None,
+    max_workers: int | None = None,
+    executor: multifutures.ExecutorProtocol | None = None,
+    progress_bar: bool = False,
+) -> pd.DataFrame:
+    """
+    Propose the spikes of the catalog as new `dropped_timestamps` and `dropped_date_ranges`.
+
+    Every station is cleaned with its current transformation and demeaned between
+    breakpoints (and optionally detided), then scored with `spike_scores`, one
+    process per station. Only the spikes that the transformation does not drop
+    yet are proposed, so the proposals are a diff against it.
+
+    Parameters:
+        paths: Transformation JSON files. Defaults to all of `transformations/`,
+            except those marked as `skip`.
+        data_dir: Base directory of the raw data.
+        out_dir: If given, write the transformations with the proposals merged in
+            (see `merge_selection`) as `<out_dir>/<ioc_code>_<sensor>.json`, e.g.
+            to review them with `git diff --no-index transformations <out_dir>`.
+        detide: Score the surge instead of the cleaned signal. This is slower, but
+            small spikes stand out better at stations with a large tidal range.
+        window: Length of the rolling window.
+        threshold: Minimum score, in robust standard deviations.
+        min_deviation: Minimum absolute deviation, in the units of the data.
+        min_run: Minimum number of consecutive spikes proposed as a range.
+        meta: Station metadata, used for the latitudes when detiding. Defaults to `get_meta()`.
+        max_workers: Size of the process pool.
+        executor: Custom executor, e.g. a pre-configured `ProcessPoolExecutor`.
+        progress_bar: Whether to display a progress bar.
+
+    Returns:
+        DataFrame with one row per transformation and its status: `proposed`,
+        `clean` (no new spike), `no data` or `failed`, the number of valid samples
+        and of spikes, and the proposed `dropped_timestamps` and `dropped_date_ranges`.
+    """
+    if paths is None:
+        paths = [path for path in _tools.get_transformation_paths() if not _tools.load_transformation_header(path).skip]
+    lats: dict[str, float] = {}
+    if detide:
+        if meta is None:
+            meta = _searvey.get_meta()
+        lats = dict(zip(meta.ioc_code, meta.lat, strict=True))
+    if out_dir is not None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+    options = {"window": window, "threshold": threshold, "min_deviation": min_deviation, "min_run": min_run}
+    func_kwargs = [
+        {
+            "path": path,
+            "data_dir": data_dir,
+            "detide": detide,
+            "lat": lats.get(path.stem.split("_")[0]),
+            "out_dir": out_dir,
+            "options": options,
+        }
+        for path in map(Path, paths)
+    ]
+    results = multifutures.multiprocess(
+        detect_station,
+        func_kwargs,
+        max_workers=max_workers,
+        executor=executor,
+        check=False,
+        progress_bar=progress_bar,
+    )
+    rows = []
+    for result in results:
+        path = T.cast(dict[str, T.Any], result.kwargs)["path"]
+        if result.exception is not None:
+            logger.error("Spike detection failed for %s: %s", path.stem, result.exception)
+            station, sensor = path.stem.split("_")
+            rows.append({"station": station, "sensor": sensor, "status": "failed", "error": str(result.exception)})
+        else:
+            rows.append({**result.result, "error": ""})
+    _profiling.log_summary()
+    summary = pd.DataFrame(rows, columns=SPIKE_COLUMNS)
+    return summary.sort_values(["station", "sensor"], ignore_index=True)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import collections
+import http.server
+import json
+import logging
+import random
+import threading
+import time
+import typing as T
+import urllib.parse
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from typing_extensions import override
+
+from . import _searvey
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_records(station: str, start: pd.Timestamp, stop: pd.Timestamp, freq: str = "1min") -> pd.DataFrame:
+    """
+    Return a deterministic one-minute `rad` tide for `station` within `[start, stop]`.
+    """
+    index = pd.date_range(pd.Timestamp(start).ceil(freq), stop, freq=freq, name="time")
+    # the phase only depends on the station, so that overlapping requests agree
+    phase = zlib.crc32(station.encode()) / 2**32 * 2 * np.pi
+    hours = index.to_numpy().view(np.int64) / 3.6e12
+    values = np.round(1.0 + 0.8 * np.sin(2 * np.pi * hours / 12.42 + phase), 4)
+    return pd.DataFrame({"rad": values}, index=index)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: _Server
+
+    def do_GET(self) -> None:
+        standin = self.server.standin
+        began = time.perf_counter()
+        query = {
+            key: values[0] for key, values in urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).items()
+        }
+        standin.wait()
+        if not standin.admit():
+            status, body = 429, b"Too many requests"
+        elif standin.roll(standin.disconnect_rate):
+            # no response at all: the client sees a transport error, like a reset connection
+            standin.record(query, 0, 0, began)
+            self.close_connection = True
+            return
+        elif standin.roll(standin.error_rate):
+            status, body = 500, b"Internal Server Error"
+        elif query.get("query") == "data":
+            status, body = 200, standin.data_response(query)
+        elif query.get("query") == "stationlist":
+            status, body = 200, standin.stationlist_response()
+        else:
+            status, body = 404, b"Not found"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json" if status == 200 else "text/plain")  # noqa: PLR2004
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        standin.record(query, status, len(body), began)
+
+    @override
+    def log_message(self, format: str, *args: T.Any) -> None:
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    standin: StandInServer
+
+
+class StandInServer:
+    """
+    Local stand-in for the IOC web service, for testing and load-testing the download path offline.
+
+    It answers the `service.php?query=data` and `service.php?query=stationlist`
+    requests made by `download_raw` and `fetch_meta`. The data of a station are
+    replayed from a local archive (either layout of `load_station`) or, for
+    stations that are not archived, synthesized. Latency, errors and rate limits
+    are configurable, and every request is recorded in `requests`.
+
+    Use it as a context manager and point the download functions to `base_url`
+    (or set `IOC_CLEANUP_BASE_URL`):
+
+        with StandInServer(Path("./data"), latency=0.2, rate_limit=5) as server:
+            download_raw(["abcd"], start, end, base_url=server.base_url)
+
+    Parameters:
+        data_dir: Archive to replay. If `None`, every station is synthetic.
+        meta: Station metadata served by `stationlist` (`ioc_code`, `lon`, `lat`
+            and optionally `location` and `country` columns).
+        host: Interface to bind.
+        port: Port to bind. `0` picks a free port.
+        synthetic: Whether to synthesize the stations that are not in `data_dir`.
+            Otherwise they have no data.
+        latency: Delay in seconds before every response.
+        jitter: Extra random delay in seconds, uniformly drawn in `[0, jitter]`.
+        error_rate: Probability of answering with an HTTP 500.
+        disconnect_rate: Probability of closing the connection without answering.
+        rate_limit: Maximum number of requests per second. Extra requests get an HTTP 429.
+        seed: Seed of the random errors and jitter.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path | None = None,
+        *,
+        meta: pd.DataFrame | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        synthetic: bool = True,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        disconnect_rate: float = 0.0,
+        rate_limit: float | None = None,
+        seed: int | None = None,
+    ) -> None:
+        self.data_dir = data_dir
+        self.meta = meta
+        self.synthetic = synthetic
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.rate_limit = rate_limit
+        self.requests: list[dict[str, T.Any]] = []
+        self._random = random.Random(seed)  # noqa: S311
+        self._lock = threading.Lock()
+        self._admitted: collections.deque[float] = collections.deque()
+        self._archive: dict[str, pd.DataFrame] = {}
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.standin = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self) -> StandInServer:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info("IOC stand-in listening on %s", self.base_url)
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> StandInServer:
+        return self.start()
+
+    def __exit__(self, *args: object) -> None:
+        self.stop()
+
+    def roll(self, probability: float) -> bool:
+        with self._lock:
+            return probability > 0 and self._random.random() < probability
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def admit(self) -> bool:
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self._admitted and now - self._admitted[0] >= 1:
+                self._admitted.popleft()
+            if len(self._admitted) >= self.rate_limit:
+                return False
+            self._admitted.append(now)
+            return True
+
+    def record(self, query: dict[str, str], status: int, size: int, began: float) -> None:
+        entry = {
+            "query": query.get("query"),
+            "code": query.get("code"),
+            "timestart": query.get("timestart"),
+            "status": status,
+            "bytes": size,
+            "duration": time.perf_counter() - began,
+        }
+        with self._lock:
+            self.requests.append(entry)
+
+    def _station(self, station: str) -> pd.DataFrame:
+        with self._lock:
+            if station not in self._archive:
+                if self.data_dir is None:
+                    self._archive[station] = pd.DataFrame()
+                else:
+                    self._archive[station] = _searvey.load_station(station, self.data_dir, 1900, 2200)
+            return self._archive[station]
+
+    def data_response(self, query: dict[str, str]) -> bytes:
+        station = query.get("code", "")
+        start, stop = pd.Timestamp(query["timestart"]), pd.Timestamp(query["timestop"])
+        archived = self._station(station)
+        if not archived.empty:
+            df = archived[(archived.index >= start) & (archived.index <= stop)]
+        elif self.synthetic:
+            df = synthetic_records(station, start, stop)
+        else:
+            df = pd.DataFrame()
+        if df.empty:
+            return b"[]"
+        # strftime is the bottleneck of large responses; numpy formats the timestamps much faster
+        stime = np.char.replace(np.datetime_as_string(df.index.to_numpy(dtype="datetime64[s]"), unit="s"), "T", " ")
+        frames = []
+        for sensor in df.columns:
+            values = df[sensor].to_numpy()
+            valid = ~np.isnan(values)
+            frames.append(pd.DataFrame({"slevel": values[valid], "stime": stime[valid], "sensor": sensor}))
+        return pd.concat(frames).to_json(orient="records").encode()
+
+    def stationlist_response(self) -> bytes:
+        if self.meta is None:
+            return b"[]"
+        columns = {"ioc_code": "Code", "lon": "Lon", "lat": "Lat", "location": "Location", "country": "country"}
+        meta = pd.DataFrame(self.meta).rename(columns=columns)
+        return json.dumps(meta[[c for c in columns.values() if c in meta]].to_dict("records")).encode()
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import concurrent.futures
+import math
+import multiprocessing
+import os
 import pathlib
 import typing as T
 from pathlib import Path
 
 import multifutures
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
+from . import _build
+from . import _profiling
+from . import _rules
 from . import _searvey
 from . import _tools
 from ._constants import DETIDE_END
@@ -15,37 +24,113 @@ from ._constants import SIMULATION_END
 from ._constants import SIMULATION_START
 
 
-def calc_ratio(sr: pd.Series[float], period: pd.DatetimeIndex) -> float:
-    sr = sr[(period[0] <= sr.index) & (sr.index <= period[-1])]
-    return len(sr) / len(period)
+# Quantiles reported by `calc_raw_statistics`, computed with a single `np.quantile` call
+QUANTILES = {
+    "q001": 0.001,
+    "q01": 0.01,
+    "q25": 0.25,
+    "median": 0.5,
+    "q75": 0.75,
+    "q99": 0.99,
+    "q999": 0.999,
+}
+# Below this, the central moments of `_moments` are round-off errors
+MOMENT_TOLERANCE = 1e-14
+# Minimum number of values of the bias corrected skewness and kurtosis
+SKEW_MIN_COUNT = 3
+KURTOSIS_MIN_COUNT = 4
+
+
+def calc_ratio(times: npt.NDArray[np.int64], start: pd.Timestamp, end: pd.Timestamp, interval: pd.Timedelta) -> float:
+    """
+    Return the number of samples in `[start, end)` divided by the number of expected samples.
+
+    Equivalent to comparing against `pd.date_range(start, end, freq=interval, inclusive="left")`,
+    without materializing it.
+    """
+    span = end.value - start.value
+    step = interval.value
+    expected = span // step + (span % step != 0)
+    last = start.value + (expected - 1) * step
+    return int(np.count_nonzero((times >= start.value) & (times <= last))) / expected
+
+
+def _moments(values: npt.NDArray[np.floating[T.Any]]) -> tuple[float, float, float, float]:
+    # Same (bias corrected) estimators as `pd.Series.mean/std/skew/kurtosis`
+    count = len(values)
+    if count == 0:
+        return np.nan, np.nan, np.nan, np.nan
+    mean = values.mean()
+    adjusted = values - mean
+    adjusted2 = adjusted**2
+    m2 = adjusted2.sum()
+    m3 = (adjusted2 * adjusted).sum()
+    m4 = (adjusted2**2).sum()
+    # as in pandas, round-off errors must not turn a constant series into a skewed one
+    if abs(m2) < MOMENT_TOLERANCE:
+        m2 = 0.0
+    if abs(m3) < MOMENT_TOLERANCE:
+        m3 = 0.0
+    std = np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+    if count < SKEW_MIN_COUNT:
+        skew = np.nan
+    elif m2 == 0:
+        skew = 0.0
+    else:
+        skew = (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2**1.5)
+    if count < KURTOSIS_MIN_COUNT:
+        kurtosis = np.nan
+    else:
+        denominator = (count - 2) * (count - 3) * m2**2
+        if denominator == 0:
+            kurtosis = 0.0
+        else:
+            adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+            kurtosis = count * (count + 1) * (count - 1) * m4 / denominator - adj
+    return float(mean), float(std), float(skew), float(kurtosis)
 
 
 def calc_raw_statistics(sr: pd.Series[float]) -> dict[str, T.Any]:
-    interval_value_counts = sr.index.to_series().diff().value_counts()
-    main_interval_occurences = interval_value_counts.iloc[0]
-    main_interval = T.cast(pd.Timedelta, interval_value_counts.index[0])
-    detide_period = pd.date_range(DETIDE_START, DETIDE_END, freq=main_interval, inclusive="left")
-    simulation_period = pd.date_range(SIMULATION_START, SIMULATION_END, freq=main_interval, inclusive="left")
+    with _profiling.profile_stage("statistics", station=sr.attrs.get("ioc_code"), rows=len(sr)):
+        return _raw_statistics(sr)
+
+
+def _raw_statistics(sr: pd.Series[float]) -> dict[str, T.Any]:
+    # the index may be in any unit, e.g. microseconds when read from Parquet
+    times = _rules.to_ns(sr.index)
+    intervals = pd.Series(np.diff(times)).value_counts()
+    main_interval_occurences = intervals.iloc[0]
+    main_interval = pd.Timedelta(int(intervals.index[0]))
+    values = sr.to_numpy(dtype=np.float64)
+    values = values[~np.isnan(values)]
+    ordered = np.sort(values)
+    if len(ordered):
+        quantiles = dict(zip(QUANTILES, np.quantile(ordered, list(QUANTILES.values())), strict=True))
+        min_, max_ = ordered[0], ordered[-1]
+    else:
+        quantiles = dict.fromkeys(QUANTILES, np.nan)
+        min_ = max_ = np.nan
+    mean, std, skew, kurtosis = _moments(values)
     data = {
         "count": len(sr),
         "main_interval": main_interval,
         "main_interval_ratio": main_interval_occurences / len(sr),
-        "detide_ratio": calc_ratio(sr, detide_period),
-        "simulation_ratio": calc_ratio(sr, simulation_period),
-        "min": sr.min(),
-        "q001": sr.quantile(0.001),
-        "q01": sr.quantile(0.01),
-        "q25": sr.quantile(0.25),
-        "mean": sr.mean(),
-        "median": sr.median(),
-        "q75": sr.quantile(0.75),
-        "q99": sr.quantile(0.99),
-        "q999": sr.quantile(0.999),
-        "max": sr.max(),
-        "range": abs(sr.max() - sr.min()),
-        "std": sr.std(),
-        "skew": sr.skew(),
-        "kurtosis": sr.kurtosis(),
+        "detide_ratio": calc_ratio(times, DETIDE_START, DETIDE_END, main_interval),
+        "simulation_ratio": calc_ratio(times, SIMULATION_START, SIMULATION_END, main_interval),
+        "min": min_,
+        "q001": quantiles["q001"],
+        "q01": quantiles["q01"],
+        "q25": quantiles["q25"],
+        "mean": mean,
+        "median": quantiles["median"],
+        "q75": quantiles["q75"],
+        "q99": quantiles["q99"],
+        "q999": quantiles["q999"],
+        "max": max_,
+        "range": abs(max_ - min_),
+        "std": std,
+        "skew": skew,
+        "kurtosis": kurtosis,
     }
     data.update(**sr.attrs)  # type: ignore[misc] # Keywords must be string
     return data
@@ -65,33 +150,166 @@ def calc_station_statistics(meta_row: T.Any, sensor: str, sr: pd.Series[float])
     return data
 
 
-def calc_station_statistics_from_path(meta: pd.DataFrame, path: pathlib.Path) -> dict[str, T.Any]:
+class StationMeta(T.NamedTuple):
+    ioc_code: str
+    lon: float
+    lat: float
+    country: str
+    location: str
+
+
+# Station metadata of the worker processes, set once per worker by `_init_worker`
+_META: dict[str, StationMeta] = {}
+
+
+def slim_meta(meta: pd.DataFrame) -> dict[str, StationMeta]:
+    """
+    Return the metadata needed by `calc_station_statistics`, indexed by IOC code.
+
+    This is much cheaper to pickle than the full (Geo)DataFrame, and the lookup is O(1).
+    """
+    columns = meta[list(StationMeta._fields)].drop_duplicates(subset="ioc_code")
+    rows = [StationMeta(*row) for row in columns.itertuples(index=False)]
+    return {row.ioc_code: row for row in rows}
+
+
+def _init_worker(meta: dict[str, StationMeta]) -> None:
+    _META.clear()
+    _META.update(meta)
+
+
+def _statistics_from_path(meta_row: T.Any, path: pathlib.Path) -> dict[str, T.Any]:
+    sensor = path.stem.split("_")[1]
+    df = pd.read_parquet(path, columns=[sensor])
+    return calc_station_statistics(meta_row=meta_row, sensor=sensor, sr=df[sensor])
+
+
+def _statistics_from_json(
+    meta_row: T.Any,
+    path: pathlib.Path,
+    data_dir: Path,
+    clean_dir: Path | None = None,
+) -> dict[str, T.Any]:
     ioc_code, sensor = path.stem.split("_")
+    if clean_dir is not None:
+        sr = _build.load_clean(ioc_code, sensor, clean_dir)
+    else:
+        raw = _searvey.load_station(ioc_code, data_dir, 2020, 2026, columns=[sensor]).sort_index()
+        sr = _tools.clean(raw, ioc_code, sensor)
+    return calc_station_statistics(meta_row=meta_row, sensor=sensor, sr=sr)
+
+
+def calc_station_statistics_from_path(meta: pd.DataFrame, path: pathlib.Path) -> dict[str, T.Any]:
+    ioc_code, _ = path.stem.split("_")
     meta_row = meta[meta.ioc_code == ioc_code].iloc[0]
-    df = pd.read_parquet(path)
-    sr = df[sensor]
-    stats = calc_station_statistics(meta_row=meta_row, sensor=sensor, sr=sr)
-    return stats
+    return _statistics_from_path(meta_row, path)
 
 
-def calc_station_statistics_from_json(meta: pd.DataFrame, path: pathlib.Path) -> dict[str, T.Any]:
-    ioc_code, sensor = path.stem.split("_")
-    raw = _searvey.load_station(ioc_code, Path("./data"), 2020, 2026).sort_index()
-    sr = _tools.clean(raw, ioc_code, sensor)
+def calc_station_statistics_from_json(
+    meta: pd.DataFrame,
+    path: pathlib.Path,
+    data_dir: Path = Path("./data"),
+) -> dict[str, T.Any]:
+    ioc_code, _ = path.stem.split("_")
     meta_row = meta[meta.ioc_code == ioc_code].iloc[0]
-    stats = calc_station_statistics(meta_row=meta_row, sensor=sensor, sr=sr)
-    return stats
+    return _statistics_from_json(meta_row, path, data_dir)
 
 
-def calc_statistics(meta: pd.DataFrame, stations_dir: pathlib.Path, pattern: str = "*.parquet") -> pd.DataFrame:
-    func_kwargs = [{"meta": meta, "path": path} for path in stations_dir.glob(pattern)]
-    results = multifutures.multiprocess(calc_station_statistics_from_path, func_kwargs, check=True)
-    stats = pd.DataFrame([r.result for r in results])
+def _calc_batch(
+    paths: list[pathlib.Path],
+    data_dir: Path | None,
+    clean_dir: Path | None = None,
+) -> list[dict[str, T.Any]]:
+    stats = []
+    for path in paths:
+        meta_row = _META[path.stem.split("_")[0]]
+        if data_dir is None:
+            stats.append(_statistics_from_path(meta_row, path))
+        else:
+            stats.append(_statistics_from_json(meta_row, path, data_dir, clean_dir))
     return stats
 
 
-def calc_statistics_json(meta: pd.DataFrame, stations_dir: pathlib.Path, pattern: str = "*.json") -> pd.DataFrame:
-    func_kwargs = [{"meta": meta, "path": path} for path in stations_dir.glob(pattern)]
-    results = multifutures.multiprocess(calc_station_statistics_from_json, func_kwargs, check=True)
-    stats = pd.DataFrame([r.result for r in results])
+def _calc_batches(
+    meta: pd.DataFrame,
+    paths: list[pathlib.Path],
+    data_dir: Path | None,
+    *,
+    batch_size: int | None,
+    max_workers: int | None,
+    clean_dir: Path | None = None,
+) -> pd.DataFrame:
+    paths = sorted(paths)
+    max_workers = max_workers or os.cpu_count() or 1
+    if batch_size is None:
+        # a few batches per worker, so that the load stays balanced when some stations are much larger
+        batch_size = max(1, math.ceil(len(paths) / (4 * max_workers)))
+    batches = [paths[i : i + batch_size] for i in range(0, len(paths), batch_size)]
+    # The metadata are sent once per worker instead of once per file
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(slim_meta(meta),),
+    )
+    func_kwargs = [{"paths": batch, "data_dir": data_dir, "clean_dir": clean_dir} for batch in batches]
+    results = multifutures.multiprocess(_calc_batch, func_kwargs, executor=executor, check=True)
+    results = sorted(results, key=lambda r: T.cast(dict[str, T.Any], r.kwargs)["paths"][0])
+    stats = pd.DataFrame([row for r in results for row in r.result])
+    _profiling.log_summary()
     return stats
+
+
+def calc_statistics(
+    meta: pd.DataFrame,
+    stations_dir: pathlib.Path,
+    pattern: str = "*.parquet",
+    *,
+    batch_size: int | None = None,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    Calculate the statistics of the `<ioc_code>_<sensor>.parquet` files of a directory.
+
+    Parameters:
+        meta: Station metadata, e.g. `get_meta()`.
+        stations_dir: Directory of the Parquet files.
+        pattern: Glob pattern of the files.
+        batch_size: Number of files per task. Defaults to a few tasks per worker.
+        max_workers: Size of the process pool. Defaults to the number of CPUs.
+
+    Returns:
+        DataFrame with one row per file, sorted by file name.
+    """
+    paths = list(stations_dir.glob(pattern))
+    return _calc_batches(meta, paths, None, batch_size=batch_size, max_workers=max_workers)
+
+
+def calc_statistics_json(
+    meta: pd.DataFrame,
+    stations_dir: pathlib.Path,
+    pattern: str = "*.json",
+    data_dir: Path = Path("./data"),
+    *,
+    batch_size: int | None = None,
+    max_workers: int | None = None,
+    clean_dir: Path | None = None,
+) -> pd.DataFrame:
+    """
+    Calculate the statistics of the cleaned series of every transformation of a directory.
+
+    Parameters:
+        meta: Station metadata, e.g. `get_meta()`.
+        stations_dir: Directory of the transformation JSON files.
+        pattern: Glob pattern of the files.
+        data_dir: Base directory of the raw data.
+        batch_size: Number of files per task. Defaults to a few tasks per worker.
+        max_workers: Size of the process pool. Defaults to the number of CPUs.
+        clean_dir: If given, read the cleaned series materialized by `build_clean`
+            instead of cleaning the raw data again.
+
+    Returns:
+        DataFrame with one row per transformation, sorted by file name.
+    """
+    paths = list(stations_dir.glob(pattern))
+    return _calc_batches(meta, paths, data_dir, batch_size=batch_size, max_workers=max_workers, clean_dir=clean_dir)
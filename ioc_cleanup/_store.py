@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import logging
+import os
+import typing as T
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Layout: <store_dir>/station=<ioc_code>/year=<year>/data.parquet
+FILENAME = "data.parquet"
+COMPRESSION = "zstd"
+TIME = "time"
+
+
+def station_dir(station: str, store_dir: Path) -> Path:
+    return store_dir / f"station={station}"
+
+
+def is_store(station: str, store_dir: Path) -> bool:
+    """
+    Return `True` if `store_dir` holds `station` in the partitioned store layout.
+    """
+    return station_dir(station, store_dir).is_dir()
+
+
+def write_station_year(df: pd.DataFrame, station: str, year: int, store_dir: Path) -> Path:
+    """
+    Write one year of raw station data to the partitioned store.
+
+    The data are sorted by time and written with zstd compression, one row
+    group per month. Parquet column statistics allow `pyarrow.dataset` to skip
+    the row groups that fall outside a time filter.
+
+    Parameters:
+        df: Raw IOC data of a single year, indexed by time.
+        station: IOC station code.
+        year: Year of the data.
+        store_dir: Root of the partitioned store.
+
+    Returns:
+        The path of the written file.
+    """
+    df = df.sort_index().rename_axis(TIME).reset_index()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    months = df[TIME].to_numpy().astype("datetime64[M]")
+    boundaries = np.flatnonzero(months[1:] != months[:-1]) + 1
+    dest = station_dir(station, store_dir) / f"year={year}" / FILENAME
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".tmp")
+    with pq.ParquetWriter(tmp, table.schema, compression=COMPRESSION, write_statistics=True) as writer:
+        for start, stop in zip([0, *boundaries], [*boundaries, len(df)], strict=True):
+            writer.write_table(table.slice(start, stop - start), row_group_size=stop - start)
+    os.replace(tmp, dest)
+    return dest
+
+
+def _year_files(station: str, store_dir: Path, start_year: int, end_year: int) -> list[str]:
+    files = []
+    for path in sorted(station_dir(station, store_dir).glob(f"year=*/{FILENAME}")):
+        if start_year <= int(path.parent.name.removeprefix("year=")) < end_year:
+            files.append(str(path))
+    return files
+
+
+def _dataset(files: list[str], station: str, store_dir: Path) -> ds.Dataset:
+    # The sensors may differ between years, so the schema is the union of all the file schemas
+    partitioning = pa.schema([("year", pa.int32())])
+    schema = pa.unify_schemas([*(pq.read_schema(path) for path in files), partitioning]).remove_metadata()
+    return ds.dataset(
+        files,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(partitioning, flavor="hive"),
+        partition_base_dir=str(station_dir(station, store_dir)),
+    )
+
+
+def load_station(
+    station: str,
+    store_dir: Path,
+    start_year: int,
+    end_year: int,
+    *,
+    columns: list[str] | None = None,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """
+    Load station data from the partitioned store.
+
+    Year partitions outside `[start_year, end_year)` are never opened, and the
+    `start`/`end` filter is pushed down to the Parquet row groups, so only the
+    months that overlap it are decoded.
+
+    Parameters:
+        station: IOC station code.
+        store_dir: Root of the partitioned store.
+        start_year: First year to load (inclusive).
+        end_year: Last year to load (exclusive).
+        columns: Sensor columns to read. Defaults to all of them.
+        start: Optional first timestamp to load (inclusive).
+        end: Optional last timestamp to load (inclusive).
+
+    Returns:
+        DataFrame indexed by time, sorted. Empty if no data are found.
+    """
+    files = _year_files(station, store_dir, start_year, end_year)
+    if not files:
+        return pd.DataFrame()
+    dataset = _dataset(files, station, store_dir)
+    names = [name for name in dataset.schema.names if name not in (TIME, "year")]
+    if columns is not None:
+        names = [name for name in names if name in columns]
+    expression = ds.scalar(value=True)
+    if start is not None:
+        expression &= ds.field(TIME) >= pa.scalar(start, type=dataset.schema.field(TIME).type)
+    if end is not None:
+        expression &= ds.field(TIME) <= pa.scalar(end, type=dataset.schema.field(TIME).type)
+    table = dataset.to_table(columns=[TIME, *names], filter=expression)
+    df = table.to_pandas().set_index(TIME).sort_index()
+    return T.cast(pd.DataFrame, df)
+
+
+def migrate(data_dir: Path, store_dir: Path) -> list[Path]:
+    """
+    Convert a `<data_dir>/<year>/<station>.parquet` tree to the partitioned store.
+
+    Parameters:
+        data_dir: Base directory containing yearly Parquet files.
+        store_dir: Root of the partitioned store.
+
+    Returns:
+        The paths of the written files.
+    """
+    written = []
+    for path in sorted(data_dir.glob("*/*.parquet")):
+        if not path.parent.name.isdigit():
+            continue
+        df = pd.read_parquet(path)
+        if df.empty:
+            continue
+        written.append(write_station_year(df, path.stem, int(path.parent.name), store_dir))
+        logger.info("Migrated %s", path)
+    return written
@@ -10,12 +10,15 @@ import pandas as pd
 import utide
 
 from . import _constants
+from . import _harmonics
+from . import _hashing
 from . import _models
+from . import _profiling
+from . import _rules
 from . import _searvey
 
 # PATH
 JSON_DIR = Path("transformations")
-IOC = _searvey.get_meta()
 OPTS = {
     "constit": "auto",
     "method": "ols",  # ols is faster and good for missing data (Ponchaut et al., 2001)
@@ -24,6 +27,16 @@ OPTS = {
     "verbose": True,
 }
 RESAMPLE = 10
+# data fitted around an event window: long enough to separate the main constituents
+WINDOW_FIT_SPAN = pd.Timedelta(days=30)
+
+
+def __getattr__(name: str) -> T.Any:
+    # `IOC` used to be computed at import time, which required network access.
+    # It is now resolved on first access instead.
+    if name == "IOC":
+        return _searvey.get_meta()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_transformation_paths() -> list[Path]:
@@ -49,6 +62,53 @@ def dump_transformation(
         fd.write("\n")
 
 
+def merge_selection(
+    trans: _models.Transformation,
+    *,
+    dropped_timestamps: T.Iterable[T.Any] = (),
+    dropped_date_ranges: T.Iterable[tuple[T.Any, T.Any]] = (),
+    breakpoints: T.Iterable[T.Any] = (),
+    segments: T.Iterable[_models.Segment] = (),
+) -> _models.Transformation:
+    """
+    Add new rules, e.g. a dashboard selection, to a transformation.
+
+    The lists of the transformation stay sorted and free of duplicates, so that
+    the same selection can be added twice without changing the file.
+
+    Parameters:
+        trans: Transformation to extend.
+        dropped_timestamps: Timestamps to drop.
+        dropped_date_ranges: `(start, end)` ranges to drop, inclusive.
+        breakpoints: Sensor breakpoints.
+        segments: Segment corrections.
+
+    Returns:
+        A copy of `trans` with the new rules.
+    """
+    new_timestamps = _rules.to_ns(list(dropped_timestamps))
+    timestamps = np.unique(np.concatenate([_rules.to_ns(trans.dropped_timestamps), new_timestamps]))
+    bps = np.unique(np.concatenate([_rules.to_ns(trans.breakpoints), _rules.to_ns(list(breakpoints))]))
+    ranges = [*trans.dropped_date_ranges, *dropped_date_ranges]
+    starts = _rules.to_ns([start for start, _ in ranges])
+    ends = _rules.to_ns([end for _, end in ranges])
+    # rows are sorted by start, then end
+    pairs = np.unique(np.column_stack([starts, ends]).reshape(-1, 2), axis=0)
+    bounds = [_rules.to_datetimes(column) for column in pairs.T]
+    by_bounds: dict[tuple[T.Any, ...], _models.Segment] = {}
+    for segment in [*trans.segments, *segments]:
+        key = (*_rules.to_ns([segment.start, segment.end]), segment.offset, segment.scale_factor)
+        by_bounds.setdefault(key, segment)
+    return trans.model_copy(
+        update={
+            "dropped_timestamps": _rules.to_datetimes(timestamps),
+            "dropped_date_ranges": list(zip(*bounds, strict=True)),
+            "breakpoints": _rules.to_datetimes(bps),
+            "segments": [by_bounds[key] for key in sorted(by_bounds)],
+        },
+    )
+
+
 def load_transformation(
     ioc_code: str,
     sensor: str,
@@ -73,71 +133,159 @@ def load_transformation(
     return load_transformation_from_path(path)
 
 
-def load_transformation_from_path(path: str | os.PathLike[str]) -> _models.Transformation:
+def load_transformation_from_path(
+    path: str | os.PathLike[str],
+    *,
+    use_cache: bool = True,
+) -> _models.Transformation:
     """
     Load a transformation definition from a JSON file.
 
+    Parsing the JSON is slow for files with many dropped timestamps, so the
+    parsed model is also stored as `int64` arrays in a sidecar cache
+    (`<dir>/.cache/<name>.npz`) that is used on subsequent loads and rebuilt
+    automatically whenever the JSON file changes.
+
     Parameters:
         path: Path to a transformation JSON file describing cleaning rules.
+        use_cache: If `False`, always parse the JSON file and leave the cache untouched.
 
     Returns:
         Parsed transformation model.
     """
-    with open(path) as fd:
-        contents = fd.read()
-    model = _models.Transformation.model_validate_json(contents)
+    if use_cache and (arrays := _rules.read_cache(path)) is not None:
+        with _profiling.profile_stage("transformation.cache"):
+            return _rules.to_transformation(arrays)
+    with _profiling.profile_stage("transformation.json"):
+        with open(path) as fd:
+            contents = fd.read()
+        model = _models.Transformation.model_validate_json(contents)
+    if use_cache:
+        _rules.write_cache(path, model)
     return model
 
 
-def transform(df: pd.DataFrame, transformation: _models.Transformation | None = None) -> pd.DataFrame:
+def load_transformation_header(path: str | os.PathLike[str]) -> _models.Transformation:
+    """
+    Load a transformation without its dropped timestamps, dropped date ranges,
+    breakpoints and tsunami windows.
+
+    This is enough for the notes, the `skip`/`wip` flags, the window, the
+    thresholds and the segments. When the sidecar cache is fresh, only its small
+    `meta` array is read, which takes a fraction of a millisecond whatever the
+    size of the file.
+
+    Parameters:
+        path: Path to a transformation JSON file describing cleaning rules.
+
+    Returns:
+        Parsed transformation model, with empty timestamp lists.
+    """
+    if (arrays := _rules.read_cache(path, names=["meta"])) is None:
+        # parsing the JSON file (re)builds the cache for the next call
+        return _rules.without_timestamps(load_transformation_from_path(path))
+    return _models.Transformation.model_validate_json(str(arrays["meta"]))
+
+
+def load_rules(
+    ioc_code: str,
+    sensor: str,
+    src_dir: str | os.PathLike[str] = _constants.TRANSFORMATIONS_DIR,
+) -> _rules.Rules:
+    """
+    Load the compiled cleaning rules for a station and sensor.
+
+    Args:
+        ioc_code: IOC station code.
+        sensor: Sensor identifier.
+        src_dir: Directory containing transformation JSON files.
+
+    Returns:
+        Compiled rules, ready to be passed to `transform`.
+    """
+    path = f"{src_dir}/{ioc_code}_{sensor}.json"
+    return load_rules_from_path(path)
+
+
+def load_rules_from_path(path: str | os.PathLike[str]) -> _rules.Rules:
+    """
+    Load the compiled cleaning rules of a transformation JSON file.
+
+    When the sidecar cache is fresh, this only reads a handful of `int64`
+    arrays and never builds Python `datetime` objects.
+
+    Parameters:
+        path: Path to a transformation JSON file describing cleaning rules.
+
+    Returns:
+        Compiled rules, ready to be passed to `transform`.
+    """
+    if (arrays := _rules.read_cache(path)) is None:
+        # parsing the JSON file (re)builds the cache for the next call
+        return _rules.compile_rules(load_transformation_from_path(path))
+    return _rules.from_arrays(arrays)
+
+
+def transform(
+    df: pd.DataFrame,
+    transformation: _models.Transformation | _rules.Rules | None = None,
+) -> pd.DataFrame:
     """
     Apply a cleaning transformation to an IOC sea-level time series.
 
     The transformation defines the valid time window, dropped timestamps,
-    dropped date ranges, and sensor breakpoints. Bad data is ropped data from the DatFrame;
-    no offset correction is applied.
+    dropped date ranges, `high`/`low` thresholds, sensor breakpoints and per-segment
+    `offset`/`scale_factor` corrections. Bad data is set to NaN in a single
+    vectorized pass (see `_rules.build_mask`) and the segment corrections are
+    applied to the sensor column (see `_rules.correct_segments`).
 
     Parameters:
         df: Raw IOC sea-level time series. The DataFrame must have
             `ioc_code` and `sensor` entries in its attributes if
             `transformation` is not provided.
-        transformation: Cleaning transformation to apply. If not provided,
-            it is loaded automatically using DataFrame attributes.
+        transformation: Cleaning transformation to apply, either as a model or
+            as compiled rules. If not provided, it is loaded automatically using
+            DataFrame attributes.
 
     Returns:
         Cleaned time series with metadata stored in `DataFrame.attrs`.
     """
-    df = df.copy()
     if transformation is None:
-        transformation = load_transformation(ioc_code=df.attrs["ioc_code"], sensor=df.attrs["sensor"])
-    df = df[transformation.start : transformation.end]  # type: ignore[misc]  # https://stackoverflow.com/questions/70763542/pandas-dataframe-mypy-error-slice-index-must-be-an-integer-or-none
-    for start, end in transformation.dropped_date_ranges:
-        df[start:end] = np.nan  # type: ignore[misc]  # https://stackoverflow.com/questions/70763542/pandas-dataframe-mypy-error-slice-index-must-be-an-integer-or-none
-    if transformation.dropped_timestamps:
-        t_ = pd.DatetimeIndex(transformation.dropped_timestamps)
-        t0 = df.index[0]
-        t1 = df.index[-1]
-        drop_index = np.where(np.logical_and(t_ > t0, t_ < t1))[
-            0
-        ]  # this step is needed to select only timestamps within the DataFrame time window
-        df.loc[t_[drop_index], :] = np.nan
-    df.attrs["breakpoints"] = sorted(transformation.breakpoints)
+        rules = load_rules(ioc_code=df.attrs["ioc_code"], sensor=df.attrs["sensor"])
+    elif isinstance(transformation, _rules.Rules):
+        rules = transformation
+    else:
+        rules = _rules.compile_rules(transformation)
+    with _profiling.profile_stage("transform", station=df.attrs.get("ioc_code"), rows=len(df)):
+        df = _rules.apply_rules(df, rules)
+    df.attrs["breakpoints"] = pd.DatetimeIndex(rules.breakpoints).to_list()
     df.attrs["status"] = "transformed"
     return df
 
 
 def demean_signal(df: pd.Series) -> pd.Series:
-    if len(df.attrs["breakpoints"]) > 0:
-        chunks = []
-        prev = df.index.min()
-        for bp in df.attrs["breakpoints"]:
-            mean = df.loc[prev:bp].mean()
-            chunks.append(df.loc[prev:bp] - mean)
-            prev = bp
-        mean = df.loc[prev:].mean()
-        chunks.append(df.loc[prev:] - mean)
-        df = pd.concat(chunks)
-    return df
+    """
+    Remove the mean of every segment delimited by `attrs["breakpoints"]`.
+
+    Each sample belongs to exactly one segment (a breakpoint starts a new one),
+    so the index is left untouched. The series is returned unchanged if it has
+    no breakpoints.
+
+    Parameters:
+        df: Time series with `breakpoints` in its attributes, see `transform`.
+
+    Returns:
+        The demeaned time series, with the attributes of `df`.
+    """
+    breakpoints = df.attrs.get("breakpoints", [])
+    if len(breakpoints) == 0:
+        return df
+    with _profiling.profile_stage("demean", rows=len(df)):
+        values = df.to_numpy(dtype=np.float64, copy=True)
+        _rules.demean_segments(values, _rules.to_ns(df.index), np.sort(_rules.to_ns(breakpoints)))
+    demeaned = pd.Series(values, index=df.index, name=df.name)
+    demeaned.attrs = dict(df.attrs)
+    return demeaned
 
 
 def clean(df: pd.DataFrame, station: str, sensor: str) -> pd.Series:
@@ -155,11 +303,70 @@ def clean(df: pd.DataFrame, station: str, sensor: str) -> pd.Series:
     Returns:
         Cleaned sea-level time series for the selected sensor.
     """
-    trans = load_transformation_from_path("./transformations/" + station + "_" + sensor + ".json")
-    return transform(df, trans)[sensor]
+    rules = load_rules_from_path("./transformations/" + station + "_" + sensor + ".json")
+    return transform(df, rules)[sensor]
+
+
+def fit_tide(ts: pd.Series, opts: T.Mapping[str, T.Any], rsmp: int | None) -> T.Any:
+    """
+    Estimate the tidal constituents of a sea-level time series with UTide.
+
+    Parameters:
+        ts: Sea-level time series.
+        opts: UTide solver options.
+        rsmp: Optional resampling interval in minutes. If provided, the
+            series is resampled before tidal analysis.
+
+    Returns:
+        The `utide.solve` coefficients.
+    """
+    with _profiling.profile_stage("utide.solve", rows=len(ts)):
+        if rsmp is not None:
+            ts = ts.resample(f"{rsmp}min").mean()
+            ts = ts.shift(freq=f"{rsmp / 2}min")
+        return utide.solve(ts.index, ts, **opts)
 
 
-def surge(ts: pd.Series, opts: T.Mapping[str, T.Any], rsmp: int | None) -> pd.Series:
+def fit_tide_cached(
+    ts: pd.Series,
+    station: str,
+    sensor: str,
+    opts: T.Mapping[str, T.Any],
+    rsmp: int | None,
+) -> T.Any:
+    """
+    Same as `fit_tide`, but the coefficients are persisted on disk.
+
+    The cache key covers the station, sensor, analysis window, resampling,
+    UTide options, the transformation file and the series itself, so a fit is
+    reused only when it would give the same result. See `list_harmonics`.
+    """
+    key = _harmonics.harmonics_key(
+        station=station,
+        sensor=sensor,
+        start=ts.index[0],
+        end=ts.index[-1],
+        rsmp=rsmp,
+        # verbosity does not change the fit
+        opts={key: value for key, value in opts.items() if key != "verbose"},
+        transformation_digest=_hashing.digest_file(_transformation_path(station, sensor)),
+        data_digest=_hashing.digest_series(ts),
+    )
+    coef = _harmonics.load_harmonics(key)
+    if coef is None:
+        coef = fit_tide(ts, opts, rsmp)
+        info = {"station": station, "sensor": sensor, "start": ts.index[0], "end": ts.index[-1], "rsmp": rsmp}
+        _harmonics.save_harmonics(key, coef, info)
+    return coef
+
+
+def surge(
+    ts: pd.Series,
+    opts: T.Mapping[str, T.Any],
+    rsmp: int | None,
+    *,
+    coef: T.Any | None = None,
+) -> pd.Series:
     """
     Compute the non-tidal (surge) component of a sea-level time series.
 
@@ -172,36 +379,158 @@ def surge(ts: pd.Series, opts: T.Mapping[str, T.Any], rsmp: int | None) -> pd.Se
         opts: UTide solver options.
         rsmp: Optional resampling interval in minutes. If provided, the
             series is resampled before tidal analysis.
+        coef: Previously fitted UTide coefficients (see `fit_tide`). If
+            provided, the tidal analysis is skipped.
 
     Returns:
         Surge (non-tidal residual) time series.
     """
-    ts0 = ts.copy()
-    if rsmp is not None:
-        ts = ts.resample(f"{rsmp}min").mean()
-        ts = ts.shift(freq=f"{rsmp / 2}min")
-    coef = utide.solve(ts.index, ts, **opts)
-    tidal = utide.reconstruct(ts0.index, coef, verbose=OPTS["verbose"])
-    data = T.cast(np.ndarray, ts0.values - tidal.h)
-    return pd.Series(data=data, index=ts0.index)
+    if coef is None:
+        coef = fit_tide(ts, opts, rsmp)
+    with _profiling.profile_stage("utide.reconstruct", rows=len(ts)):
+        tidal = utide.reconstruct(ts.index, coef, verbose=opts.get("verbose", OPTS["verbose"]))
+    data = T.cast(np.ndarray, ts.values - tidal.h)
+    return pd.Series(data=data, index=ts.index)
 
 
-def load_clean_ts_for_year(
+def _transformation_path(station: str, sensor: str) -> Path:
+    return _constants.TRANSFORMATIONS_DIR / f"{station}_{sensor}.json"
+
+
+def _window_rules(
     station: str,
     sensor: str,
-    year: int,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    path: str | os.PathLike[str] | None = None,
+) -> _rules.Rules:
+    rules = load_rules_from_path(_transformation_path(station, sensor) if path is None else path)
+    window = _rules.to_ns([start, end])
+    return _rules.clip_rules(rules, window[0], window[1])
+
+
+def _load_clean_ts(
+    station: str,
+    sensor: str,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
     folder: Path,
     *,
     demean: bool,
+    path: str | os.PathLike[str] | None = None,
 ) -> pd.Series:
-    r_ = _searvey.load_station(station, folder, 2020, 2026).sort_index()
-    c_ = clean(r_, station, sensor)
-    c_ = c_.loc[f"{year}-01-01" : f"{year}-12-31"].dropna()  # type: ignore[misc]
+    rules = _window_rules(station, sensor, start, end, path)
+    if rules.start > rules.end:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="time"), name=sensor)
+    bounds = pd.DatetimeIndex([rules.start, rules.end])
+    first, last = bounds.year
+    r_ = _searvey.load_station(station, folder, first, last + 1, columns=[sensor], start=bounds[0], end=bounds[1])
+    if r_.empty:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="time"), name=sensor)
+    c_ = transform(r_, rules)[sensor].dropna()
     if demean:
         c_ = demean_signal(c_)
     return c_
 
 
+def load_clean_ts(
+    station: str,
+    sensor: str,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    folder: Path,
+    *,
+    demean: bool,
+    path: str | os.PathLike[str] | None = None,
+) -> pd.Series:
+    """
+    Load the cleaned time series of a station sensor within a time window.
+
+    Only the `sensor` column of the yearly Parquet files that overlap both the
+    requested window and the transformation window is read, and the cleaning
+    rules are clipped to the window before being applied. The cost is therefore
+    proportional to the window length, not to the length of the record.
+
+    Parameters:
+        station: IOC station code.
+        sensor: Sensor identifier.
+        start: Window start (inclusive).
+        end: Window end (inclusive).
+        folder: Base directory containing yearly Parquet files.
+        demean: Whether to demean the signal between breakpoints.
+        path: Transformation JSON file. Defaults to the one of the station
+            sensor in `TRANSFORMATIONS_DIR`.
+
+    Returns:
+        Cleaned time series without missing values. Empty if there is no data
+        in the window.
+    """
+    with _profiling.profile_stage("clean", station=station) as stage:
+        c_ = _load_clean_ts(station, sensor, start, end, folder, demean=demean, path=path)
+        stage.rows = len(c_)
+    return c_
+
+
+def load_transformed_ts(
+    trans: _models.Transformation,
+    folder: Path,
+    *,
+    demean: bool,
+    detide: bool = False,
+    lat: float | None = None,
+) -> pd.Series:
+    """
+    Load the cleaned time series of a transformation over its whole window.
+
+    Parameters:
+        trans: Transformation to apply.
+        folder: Base directory containing yearly Parquet files.
+        demean: Whether to demean the signal between breakpoints.
+        detide: Whether to return the surge instead, with one tidal fit per year.
+        lat: Latitude of the station, required to detide.
+
+    Returns:
+        Cleaned (or detided) time series without missing values.
+    """
+    station, sensor = trans.ioc_code, trans.sensor
+    bounds = pd.DatetimeIndex([trans.start, trans.end])
+    df = _searvey.load_station(
+        station,
+        folder,
+        bounds.year[0],
+        bounds.year[1] + 1,
+        columns=[sensor],
+        start=bounds[0],
+        end=bounds[1],
+    )
+    if df.empty or sensor not in df.columns:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="time"), name=sensor)
+    clean = transform(df, trans)[sensor].dropna()
+    if demean:
+        clean = demean_signal(clean)
+    if not detide or clean.empty:
+        return clean
+    opts = {**OPTS, "lat": lat, "verbose": False}
+    # one tidal fit per year, like `detide_catalog`
+    years = pd.DatetimeIndex(clean.index).year
+    surges = pd.concat([surge(chunk, opts, RESAMPLE) for _, chunk in clean.groupby(years)])
+    return T.cast(pd.Series, surges.rename(sensor))
+
+
+def load_clean_ts_for_year(
+    station: str,
+    sensor: str,
+    year: int,
+    folder: Path,
+    *,
+    demean: bool,
+    path: str | os.PathLike[str] | None = None,
+) -> pd.Series:
+    start = pd.Timestamp(f"{year}-01-01")
+    end = pd.Timestamp(f"{year + 1}-01-01") - pd.Timedelta(1, "ns")
+    return load_clean_ts(station, sensor, start, end, folder, demean=demean, path=path)
+
+
 def load_surge_ts_for_year(
     station: str,
     sensor: str,
@@ -210,9 +539,62 @@ def load_surge_ts_for_year(
     *,
     demean: bool,
 ) -> pd.Series:
-    c_ = load_clean_ts_for_year(station, sensor, year, folder, demean=demean)
-    lat = IOC[IOC.ioc_code == station].lat.values[0]
+    return _detide_year(load_clean_ts_for_year(station, sensor, year, folder, demean=demean), station, sensor)
+
+
+def _detide_year(c_: pd.Series, station: str, sensor: str) -> pd.Series:
+    meta = _searvey.get_meta()
+    lat = meta[meta.ioc_code == station].lat.values[0]
     OPTS["lat"] = lat
-    s_ = surge(c_, OPTS, RESAMPLE)
+    with _profiling.profile_stage("detide", station=station, rows=len(c_)):
+        coef = fit_tide_cached(c_, station, sensor, OPTS, RESAMPLE)
+        s_ = surge(c_, OPTS, RESAMPLE, coef=coef)
     s_.columns = [sensor]  # type: ignore[attr-defined]
     return s_
+
+
+def load_surge_ts_for_window(
+    station: str,
+    sensor: str,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    folder: Path,
+    *,
+    demean: bool,
+    lat: float | None = None,
+    fit_span: pd.Timedelta = WINDOW_FIT_SPAN,
+) -> pd.Series:
+    """
+    Compute the surge of a station sensor within a short event window.
+
+    Instead of detiding a whole year, the tide is fitted on `fit_span` of data
+    centred on the window (enough to resolve the main constituents) and is only
+    reconstructed within the window. The fit is cached like in `fit_tide_cached`,
+    so looking at the same event again does not refit it.
+
+    Parameters:
+        station: IOC station code.
+        sensor: Sensor identifier.
+        start: Window start (inclusive).
+        end: Window end (inclusive).
+        folder: Base directory containing yearly Parquet files.
+        demean: Whether to demean the signal between breakpoints.
+        lat: Station latitude. Defaults to the one of `get_meta()`.
+        fit_span: Length of the data used for the tidal fit.
+
+    Returns:
+        Surge time series within the window. Empty if there is no data.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    pad = max(fit_span - (end - start), pd.Timedelta(0)) / 2
+    c_ = load_clean_ts(station, sensor, start - pad, end + pad, folder, demean=demean)
+    window = c_.loc[start:end]
+    if window.empty:
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([], name="time"), name=sensor)
+    if lat is None:
+        meta = _searvey.get_meta()
+        lat = meta[meta.ioc_code == station].lat.values[0]
+    opts = {**OPTS, "lat": lat, "verbose": False}
+    with _profiling.profile_stage("detide", station=station, rows=len(window)):
+        coef = fit_tide_cached(c_, station, sensor, opts, RESAMPLE)
+        return surge(window, opts, RESAMPLE, coef=coef).rename(sensor)
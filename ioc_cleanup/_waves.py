@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import typing as T
+import warnings
+from collections import abc
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+# Shorter zero-crossing segments are noise, not waves
+MIN_WAVE_SAMPLES = 2
+WAVE_COLUMNS = ["wave", "H", "T", "t_crest", "t_trough"]
+# A `(stations, times)` array of records
+BATCH_NDIM = 2
+
+
+def _crossings(fluc: npt.NDArray[np.float64], crossing: str) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.intp]]:
+    sgn = np.sign(fluc)
+    if crossing == "up":
+        mask = (sgn[:, :-1] < 0) & (sgn[:, 1:] > 0)
+    elif crossing == "down":
+        mask = (sgn[:, :-1] > 0) & (sgn[:, 1:] < 0)
+    else:
+        raise ValueError(f"crossing must be 'up' or 'down', not {crossing!r}")
+    rows, cols = np.nonzero(mask)
+    return rows, cols
+
+
+def extract_waves(
+    time: npt.ArrayLike,
+    eta: npt.ArrayLike,
+    *,
+    crossing: str = "up",
+    min_samples: int = MIN_WAVE_SAMPLES,
+    stations: abc.Sequence[T.Any] | None = None,
+) -> pd.DataFrame:
+    """
+    Extract individual waves from surface elevations with the zero-crossing method.
+
+    A wave spans two consecutive zero up- (or down-) crossings of the demeaned
+    elevation. Its height `H` is the crest plus the trough depth, and its period
+    `T` the time between the crossings. Waves containing missing values are
+    dropped, since they span a gap.
+
+    Parameters:
+        time: Time vector, shape `(time,)`.
+        eta: Elevations, shape `(time,)` or `(station, time)`, e.g. one variable of
+            `open_cube()`. Each station is demeaned and analysed independently.
+        crossing: `"up"` or `"down"`.
+        min_samples: Minimum number of samples strictly between two crossings.
+        stations: Labels of the stations of a 2D `eta`. Defaults to their position.
+
+    Returns:
+        DataFrame with one row per wave and `wave` (crossing number within the
+        station), `H`, `T`, `t_crest` and `t_trough` columns, plus a leading
+        `station` column for a 2D `eta`.
+    """
+    time = np.asarray(time)
+    values = np.asarray(eta, dtype=float)
+    batch = values.ndim == BATCH_NDIM
+    values = np.atleast_2d(values)
+    n_stations, n_times = values.shape
+    with warnings.catch_warnings():
+        # stations without any data have a NaN mean, hence no crossings
+        warnings.simplefilter("ignore", RuntimeWarning)
+        means = np.nanmean(values, axis=1, keepdims=True) if n_times else np.zeros((n_stations, 1))
+    fluc = (values - means).ravel()
+
+    rows, cols = _crossings(fluc.reshape(n_stations, n_times), crossing)
+    # Each wave lies between a crossing and the next one of the same station
+    same_station = rows[:-1] == rows[1:]
+    station = rows[:-1][same_station]
+    # crossings are numbered within their station, like the index of a per-station loop
+    first_of_station = np.searchsorted(rows, rows)
+    wave = (np.arange(len(rows)) - first_of_station)[:-1][same_station] + 1
+    starts = (rows * n_times + cols)[:-1][same_station] + 1
+    ends = (rows * n_times + cols)[1:][same_station]
+    keep = ends - starts >= max(min_samples, 1)
+    station, wave, starts, ends = station[keep], wave[keep], starts[keep], ends[keep]
+
+    # Gather the samples of all the waves back to back, so that each wave is a contiguous
+    # run and the per-wave extrema are plain segment reductions
+    lengths = ends - starts
+    offsets = np.zeros(len(lengths), dtype=np.intp)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    positions = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+    samples = fluc[positions]
+    if len(samples):
+        crest = np.maximum.reduceat(samples, offsets)
+        trough = np.minimum.reduceat(samples, offsets)
+        gaps = np.add.reduceat(np.isnan(samples), offsets)
+    else:
+        crest = trough = np.array([], dtype=float)
+        gaps = np.array([], dtype=np.intp)
+    seg = np.repeat(np.arange(len(lengths)), lengths)
+    # first sample reaching the extremum, like `argmax`/`argmin`
+    is_crest = np.flatnonzero(samples == crest[seg])
+    is_trough = np.flatnonzero(samples == trough[seg])
+    crest_pos = positions[is_crest[np.unique(seg[is_crest], return_index=True)[1]]] if len(is_crest) else positions[:0]
+    trough_pos = (
+        positions[is_trough[np.unique(seg[is_trough], return_index=True)[1]]] if len(is_trough) else positions[:0]
+    )
+
+    valid = gaps == 0
+    flat_time = np.broadcast_to(time, (n_stations, n_times)).ravel()
+    columns: dict[str, T.Any] = {
+        "wave": wave[valid],
+        "H": (crest + np.abs(trough))[valid],
+        "T": flat_time[ends[valid]] - flat_time[starts[valid]],
+        # waves with gaps have no crest/trough positions, so the positions only cover the valid ones
+        "t_crest": flat_time[crest_pos],
+        "t_trough": flat_time[trough_pos],
+    }
+    if batch:
+        labels = np.arange(n_stations) if stations is None else np.asarray(stations)
+        columns = {"station": labels[station[valid]], **columns}
+    return pd.DataFrame(columns)
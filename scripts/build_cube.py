@@ -0,0 +1,10 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import ioc_cleanup as C
+
+logging.basicConfig(level=logging.INFO)
+
+C.build_cube(clean_dir=Path("./clean"), surge_dir=Path("./surge"), dest=Path("./cube.zarr"))
@@ -0,0 +1,59 @@
+"""
+Fold the runs of consecutive `dropped_timestamps` into `dropped_date_ranges`.
+
+Every transformation is checked against the raw data of its station: it is only
+rewritten if the cleaned series stays identical. Without `--write`, only report
+what would change.
+
+    python scripts/compact_transformations.py --data-dir ./data
+    python scripts/compact_transformations.py --data-dir ./data --write transformations/AN15_rad.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+import ioc_cleanup as C
+from ioc_cleanup import _rules
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", type=Path, nargs="*", help="transformation files (default: all of them)")
+    parser.add_argument("--data-dir", type=Path, default=Path("./data"))
+    parser.add_argument("--write", action="store_true", help="rewrite the compacted files")
+    parser.add_argument(
+        "--min-run",
+        type=int,
+        default=_rules.COMPACT_MIN_RUN,
+        help="minimum number of timestamps of a run to fold",
+    )
+    args = parser.parse_args()
+
+    summary = C.compact_transformations(
+        args.paths or None,
+        args.data_dir,
+        write=args.write,
+        min_run=args.min_run,
+        progress_bar=True,
+    )
+    print(summary.status.value_counts().to_string())  # noqa: T201
+    compacted = summary[summary.status == "compacted"]
+    if not compacted.empty:
+        columns = ["station", "sensor", "interval", "timestamps_before", "timestamps_after", "ranges_added"]
+        print(compacted[columns].to_string(index=False))  # noqa: T201
+        print(  # noqa: T201
+            f"{compacted.bytes_before.sum() / 2**20:.1f} MB -> {compacted.bytes_after.sum() / 2**20:.1f} MB"
+            + ("" if args.write else " (dry run, use --write to rewrite the files)"),
+        )
+    failed = summary[summary.status.isin(["failed", "mismatch"])]
+    if not failed.empty:
+        print(failed[["station", "sensor", "status", "error"]].to_string(index=False))  # noqa: T201
+
+
+# the workers are spawned and import this module again
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Detect the datum steps of the catalog and compare them with the stored breakpoints.
+
+Breakpoints are `new` when no stored breakpoint is close to them and `missing`
+when the detector does not find a stored one; review them in the dashboard:
+
+    python scripts/detect_breakpoints.py --data-dir ./data
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+import ioc_cleanup as C
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", type=Path, nargs="*", help="transformation files (default: all of them)")
+    parser.add_argument("--data-dir", type=Path, default=Path("./data"))
+    parser.add_argument("--detide", action="store_true", help="detect the steps of the surge")
+    parser.add_argument("--threshold", type=float, default=8.0, help="in robust standard deviations")
+    parser.add_argument("--min-size", type=float, default=0.05, help="in metres")
+    parser.add_argument("--tolerance", default="1D", help="maximum distance to a stored breakpoint")
+    parser.add_argument("--output", type=Path, help="also write the summary to this CSV file")
+    args = parser.parse_args()
+
+    summary = C.detect_breakpoints(
+        args.paths or None,
+        args.data_dir,
+        detide=args.detide,
+        threshold=args.threshold,
+        min_size=args.min_size,
+        tolerance=pd.Timedelta(args.tolerance),
+        progress_bar=True,
+    )
+    if args.output:
+        summary.to_csv(args.output, index=False)
+    print(summary.status.value_counts().to_string())  # noqa: T201
+    review = summary[summary.status.isin(["new", "missing"])]
+    if not review.empty:
+        print(review[["station", "sensor", "status", "time", "stored", "score", "step"]].to_string(index=False))  # noqa: T201
+    failed = summary[summary.status == "failed"]
+    if not failed.empty:
+        print(failed[["station", "sensor", "error"]].to_string(index=False))  # noqa: T201
+
+
+# the workers are spawned and import this module again
+if __name__ == "__main__":
+    main()
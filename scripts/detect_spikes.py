@@ -0,0 +1,55 @@
+"""
+Propose the spikes of the catalog as new `dropped_timestamps` and `dropped_date_ranges`.
+
+The transformations with the proposals merged in are written to `--out-dir`;
+review them against the current ones before copying them over:
+
+    python scripts/detect_spikes.py --data-dir ./data --out-dir ./spikes
+    git diff --no-index transformations spikes
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+import ioc_cleanup as C
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", type=Path, nargs="*", help="transformation files (default: all of them)")
+    parser.add_argument("--data-dir", type=Path, default=Path("./data"))
+    parser.add_argument("--out-dir", type=Path, default=Path("./spikes"))
+    parser.add_argument("--detide", action="store_true", help="score the surge instead of the cleaned signal")
+    parser.add_argument("--window", default="1h", help="rolling window")
+    parser.add_argument("--threshold", type=float, default=6.0, help="in robust standard deviations")
+    parser.add_argument("--min-deviation", type=float, default=0.1, help="in metres")
+    args = parser.parse_args()
+
+    summary = C.detect_spikes(
+        args.paths or None,
+        args.data_dir,
+        args.out_dir,
+        detide=args.detide,
+        window=pd.Timedelta(args.window),
+        threshold=args.threshold,
+        min_deviation=args.min_deviation,
+        progress_bar=True,
+    )
+    print(summary.status.value_counts().to_string())  # noqa: T201
+    proposed = summary[summary.status == "proposed"].sort_values("spikes", ascending=False)
+    if not proposed.empty:
+        print(proposed[["station", "sensor", "samples", "spikes"]].to_string(index=False))  # noqa: T201
+    failed = summary[summary.status == "failed"]
+    if not failed.empty:
+        print(failed[["station", "sensor", "error"]].to_string(index=False))  # noqa: T201
+
+
+# the workers are spawned and import this module again
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+import ioc_cleanup as C
+
+logging.basicConfig(level=logging.INFO)
+
+DATA_DIR = Path("./data")
+OUT_DIR = Path("./surge")
+
+summary = C.detide_catalog(data_dir=DATA_DIR, out_dir=OUT_DIR, progress_bar=True)
+print(summary.status.value_counts().to_string())  # noqa: T201
+failed = summary[summary.status == "failed"]
+if not failed.empty:
+    print(failed[["station", "sensor", "year", "error"]].to_string(index=False))  # noqa: T201
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import logging
+
 import ioc_cleanup as C
 
+logging.basicConfig(level=logging.INFO)
+
 YEARS = [2020, 2021, 2022, 2023, 2024, 2025]
-station = "nuku"
+STATIONS = ["nuku"]
 
-for year in YEARS[::-1]:
-    C.download_year_station(station, year, data_folder="./data")
+summary = C.download_station_years(STATIONS, YEARS, data_folder="./data")
+print(summary.status.value_counts().to_string())  # noqa: T201
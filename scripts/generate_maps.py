@@ -4,79 +4,15 @@ import glob
 from pathlib import Path
 
 import hvplot.pandas  # noqa: F401
-import numpy as np
 import pandas as pd
 import panel as pn
 
 import ioc_cleanup as C
 
 IOC = C.get_meta()
-MAX = 2
 YEAR = 2020
 
 
-def extract_waves(time, eta, crossing="up"):
-    """
-    Extract wave properties using zero-crossing method.
-
-    Parameters
-    ----------
-    time : pd.Series or np.ndarray
-        Time vector
-    eta : pd.Series or np.ndarray
-        Surface elevation
-    crossing : str
-        'up' or 'down'
-
-    Returns
-    -------
-    pd.DataFrame
-        Columns: ['wave', 'H', 'T', 't_crest', 't_trough']
-    """
-
-    eta = np.asarray(eta)
-    time = np.asarray(time)
-
-    fluc = eta - eta.mean()
-    sgn = np.sign(fluc)
-
-    # Zero-crossing indices
-    if crossing == "up":
-        zc = np.where((sgn[:-1] < 0) & (sgn[1:] > 0))[0]
-    else:  # down-crossing
-        zc = np.where((sgn[:-1] > 0) & (sgn[1:] < 0))[0]
-
-    waves = []
-
-    for i in range(len(zc) - 1):
-        i0 = zc[i] + 1
-        i1 = zc[i + 1]
-
-        if i1 - i0 < MAX:
-            continue
-
-        segment = fluc[i0:i1]
-        seg_time = time[i0:i1]
-
-        crest_idx = np.argmax(segment)
-        trough_idx = np.argmin(segment)
-
-        a_crest = segment[crest_idx]
-        a_trough = segment[trough_idx]
-
-        waves.append(
-            {
-                "wave": i + 1,
-                "H": a_crest + abs(a_trough),
-                "T": time[i1] - time[i0],
-                "t_crest": seg_time[crest_idx],
-                "t_trough": seg_time[trough_idx],
-            },
-        )
-
-    return pd.DataFrame(waves)
-
-
 # cleaned stations
 clean_stations_list = []
 not_yet_clean_stations_list = []
@@ -85,31 +21,29 @@ not_yet_clean_stations_list = []
 start = pd.Timestamp("2025-07-01")
 end = pd.Timestamp("2025-10-01")
 folder = Path("./data")
-recorded_tsunamis = {}
 for station in IOC.ioc_code.tolist():
     candidates = sorted(glob.glob(f"./transformations/{station}*.json"))
-    if len(candidates) == 0:
-        pass
-    else:
-        for path in candidates:
-            t = C.load_transformation_from_path(path)
-            # cleaned station test
-            if not t.skip:
-                clean_stations_list.append(station)
-                if t.start.year > YEAR:
-                    not_yet_clean_stations_list.append(station)
-
-            # tsunami test
-            for ts in t.tsunami:
-                if ts[0] > start and ts[1] < end:
-                    surge = C.load_surge_ts_for_year(t.ioc_code, t.sensor, 2025, folder, demean=True)
-                    s_ = surge.loc[ts[0] : ts[1]] - surge.loc[ts[0] : ts[1]].mean()
-                    tsunami_waves = extract_waves(s_.index, s_).sort_values(by="H", ascending=False, ignore_index=True)
-                    recorded_tsunamis[station] = {
-                        "wave number": tsunami_waves.loc[0, "wave"],
-                        "tsunami wave height": tsunami_waves.loc[0, "H"],
-                        "tsunami wave period": tsunami_waves.loc[0, "T"],
-                    }
+    for path in candidates:
+        t = C.load_transformation_header(path)
+        # cleaned station test
+        if not t.skip:
+            clean_stations_list.append(station)
+            if t.start.year > YEAR:
+                not_yet_clean_stations_list.append(station)
+
+# only detide the tsunami windows, all of them in parallel
+events = C.surge_events(C.tsunami_events(start=start, end=end), folder, demean=True, meta=IOC)
+recorded_tsunamis = {}
+for event in events.itertuples():
+    if event.surge.empty:
+        continue
+    s_ = event.surge - event.surge.mean()
+    tsunami_waves = C.extract_waves(s_.index, s_).sort_values(by="H", ascending=False, ignore_index=True)
+    recorded_tsunamis[event.station] = {
+        "wave number": tsunami_waves.loc[0, "wave"],
+        "tsunami wave height": tsunami_waves.loc[0, "H"],
+        "tsunami wave period": tsunami_waves.loc[0, "T"],
+    }
 
 # Kamchatka tsunami
 kamchatka = pd.DataFrame(recorded_tsunamis).T.join(
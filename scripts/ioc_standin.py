@@ -0,0 +1,50 @@
+"""
+Serve a local stand-in of the IOC web service.
+
+    python scripts/ioc_standin.py --data-dir ./data --port 8000 --latency 0.2 --rate-limit 5
+
+Then point the downloads to it:
+
+    IOC_CLEANUP_BASE_URL=http://127.0.0.1:8000 python scripts/download_ioc.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from pathlib import Path
+
+import ioc_cleanup as C
+
+logging.basicConfig(level=logging.INFO)
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--data-dir", type=Path, default=None, help="archive to replay (default: synthetic data only)")
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8000)
+parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+parser.add_argument("--error-rate", type=float, default=0.0)
+parser.add_argument("--disconnect-rate", type=float, default=0.0)
+parser.add_argument("--rate-limit", type=float, default=None, help="requests per second")
+parser.add_argument("--with-meta", action="store_true", help="serve the station list of the local metadata snapshot")
+args = parser.parse_args()
+
+server = C.StandInServer(
+    args.data_dir,
+    meta=C.get_meta() if args.with_meta else None,
+    host=args.host,
+    port=args.port,
+    latency=args.latency,
+    jitter=args.jitter,
+    error_rate=args.error_rate,
+    disconnect_rate=args.disconnect_rate,
+    rate_limit=args.rate_limit,
+)
+with server:
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+from ioc_cleanup import _store
+
+logging.basicConfig(level=logging.INFO)
+
+DATA_DIR = Path("./data")
+STORE_DIR = Path("./store")
+
+_store.migrate(DATA_DIR, STORE_DIR)
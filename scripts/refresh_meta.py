@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+import logging
+
+import ioc_cleanup as C
+
+logging.basicConfig(level=logging.INFO)
+
+C.refresh_meta()
@@ -29,7 +29,7 @@ def save_interactive_plot(
     if clean:
         C._plots.load_surge_tide(station, sensor, start.year, surge=surge, demean=True)
     else:
-        ts = C._searvey.load_station(station, folder, 2020, 2026).sort_index()
+        ts = C._searvey.load_station(station, folder, start.year, start.year + 2, columns=[sensor]).sort_index()
         ts = ts[sensor]
         if surge:
             ts = ts.loc[f"{start.year}" : f"{start.year+1}"]
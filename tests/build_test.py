@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = pd.date_range("2021-06-01", "2022-06-30T23:59:00", freq="5min", name="time")
+    rng = np.random.default_rng(0)
+    (tmp_path / "transformations").mkdir()
+    for station in ("abcd", "efgh"):
+        df = pd.DataFrame({"rad": rng.normal(size=len(index)), "prs": rng.normal(size=len(index))}, index=index)
+        for year in (2021, 2022):
+            (tmp_path / "data" / str(year)).mkdir(parents=True, exist_ok=True)
+            df.loc[str(year)].to_parquet(tmp_path / "data" / str(year) / f"{station}.parquet")
+        trans = C.Transformation(
+            ioc_code=station,
+            sensor="rad",
+            start="2021-07-01",
+            end="2022-06-01",
+            dropped_date_ranges=[("2021-12-31T12:00:00", "2022-01-02T00:00:00")],
+            breakpoints=["2022-03-01T00:00:00"],
+            high=2.0,
+        )
+        C.dump_transformation(trans, tmp_path / "transformations")
+    return tmp_path
+
+
+def _build(tmp_path, **kwargs):
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        summary = C.build_clean(data_dir=tmp_path / "data", out_dir=tmp_path / "clean", executor=executor, **kwargs)
+    return summary.set_index("station").status.to_dict()
+
+
+def test_build_clean_is_incremental(catalog):
+    assert _build(catalog) == {"abcd": "built", "efgh": "built"}
+    for station in ("abcd", "efgh"):
+        raw = C.load_station(station, catalog / "data", 2021, 2023).sort_index()
+        expected = C.clean(raw, station, "rad")
+        result = C.load_clean(station, "rad", catalog / "clean")
+        pd.testing.assert_series_equal(result, expected, check_freq=False)
+        assert result.attrs["breakpoints"] == [pd.Timestamp("2022-03-01")]
+
+    assert _build(catalog) == {"abcd": "skipped", "efgh": "skipped"}
+    trans = C.load_transformation("efgh", "rad")
+    high = 1.5
+    C.dump_transformation(trans.model_copy(update={"high": high}), catalog / "transformations")
+    assert _build(catalog) == {"abcd": "skipped", "efgh": "built"}
+    assert C.load_clean("efgh", "rad", catalog / "clean").max() <= high
+    assert _build(catalog, force=True) == {"abcd": "built", "efgh": "built"}
+
+
+def test_calc_statistics_json_reads_built_series(catalog):
+    _build(catalog)
+    meta = pd.DataFrame(
+        {"ioc_code": ["abcd", "efgh"], "lon": [0.0, 1.0], "lat": [0.0, 1.0], "country": "X", "location": "Y"},
+    )
+    kwargs = {"stations_dir": catalog / "transformations", "data_dir": catalog / "data", "max_workers": 1}
+    expected = C.calc_statistics_json(meta, **kwargs)
+    result = C.calc_statistics_json(meta, clean_dir=catalog / "clean", **kwargs)
+    pd.testing.assert_frame_equal(result, expected)
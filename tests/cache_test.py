@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup import _cache
+
+
+def _series(n: int) -> pd.Series:
+    return pd.Series(np.zeros(n), index=pd.date_range("2021-01-01", periods=n, freq="min"))
+
+
+def test_evicts_least_recently_used_by_bytes():
+    size = _cache.nbytes(_series(1000))
+    cache = C.SeriesCache(max_bytes=2 * size)
+    a = cache.get("a", lambda: _series(1000))
+    cache.get("b", lambda: _series(1000))
+    assert cache.get("a", lambda: _series(1)) is a
+    cache.get("c", lambda: _series(1000))
+    assert cache.stats() == {
+        "entries": 2,
+        "bytes": 2 * size,
+        "max_bytes": 2 * size,
+        "hits": 1,
+        "misses": 3,
+        "evictions": 1,
+    }
+    # "b" was the least recently used one
+    assert len(cache.get("b", lambda: _series(1))) == 1
+    assert cache.get("a", lambda: _series(1)) is not a
+    # too large to be cached at all
+    large = _series(10_000)
+    assert cache.get("d", lambda: large) is large
+    assert cache.stats()["bytes"] <= 2 * size
+
+
+def test_concurrent_misses_load_once():
+    cache = C.SeriesCache(max_bytes=10**6)
+    calls = []
+    started = threading.Barrier(4)
+
+    def load() -> pd.Series:
+        calls.append(1)
+        return _series(10)
+
+    def get(_: int) -> pd.Series:
+        started.wait()
+        return cache.get("key", load)
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(get, range(4)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache.stats()["misses"] == 1
+
+
+def test_waiting_threads_keep_the_loading_lock():
+    # too large to be cached: every thread loads, but never two at once
+    cache = C.SeriesCache(max_bytes=1)
+    loading = []
+    overlaps = []
+
+    def load() -> pd.Series:
+        overlaps.append(len(loading))
+        loading.append(1)
+        time.sleep(0.005)
+        loading.pop()
+        return _series(10)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: cache.get("key", load), range(32)))
+    assert set(overlaps) == {0}
+    assert not cache._loading
+    assert not cache._waiting
+
+
+def test_cleaned_series_follow_the_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = C.get_series_cache()
+    cache.clear()
+    index = pd.date_range("2021-01-01", "2021-01-10", freq="min", name="time")
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    pd.DataFrame({"rad": np.ones(len(index))}, index=index).to_parquet(tmp_path / "data" / "2021" / "abcd.parquet")
+    trans = C.Transformation(ioc_code="abcd", sensor="rad", start=index[0], end=index[-1], breakpoints=[index[100]])
+    (tmp_path / "transformations").mkdir()
+    C.dump_transformation(trans, tmp_path / "transformations")
+    path = tmp_path / "transformations" / "abcd_rad.json"
+
+    clean = _cache.load_clean_year("abcd", "rad", 2021, tmp_path / "data", demean=False)
+    assert len(clean) == len(index)
+    # demeaning reuses the cleaned series, and loading it again is a hit
+    demeaned = _cache.load_clean_year("abcd", "rad", 2021, tmp_path / "data", demean=True)
+    assert (demeaned == 0).all()
+    assert _cache.load_clean_year("abcd", "rad", 2021, tmp_path / "data", demean=False) is clean
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    # editing the transformation invalidates the cleaned series, but not the raw data
+    C.dump_transformation(trans.model_copy(update={"dropped_timestamps": [index[5]]}), tmp_path / "transformations")
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+    assert len(_cache.load_clean_year("abcd", "rad", 2021, tmp_path / "data", demean=False)) == len(index) - 1
+    assert (cache.hits, cache.misses) == (3, 4)
+    cache.clear()
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _rules
+
+
+def _transformation(timestamps, **kwargs) -> C.Transformation:
+    return C.Transformation(
+        ioc_code="abcd",
+        sensor="rad",
+        start="2021-01-01",
+        end="2021-01-02",
+        dropped_timestamps=list(timestamps),
+        **kwargs,
+    )
+
+
+def test_compact_timestamps():
+    ts = np.array([0, 1, 2, 3, 5, 7, 8, 9, 20], dtype=np.int64)
+    ranges, remaining = _rules.compact_timestamps(ts, 1)
+    assert ranges.tolist() == [[0, 3], [7, 9]]
+    assert remaining.tolist() == [5, 20]
+    ranges, remaining = _rules.compact_timestamps(ts, 1, min_run=5)
+    assert ranges.tolist() == []
+    assert remaining.tolist() == ts.tolist()
+    # a sample at 1.5 splits the first run
+    ranges, remaining = _rules.compact_timestamps(ts * 2, 2, times=np.array([0, 2, 3, 4, 6]))
+    assert ranges.tolist() == [[14, 18]]
+    assert remaining.tolist() == [0, 2, 4, 6, 10, 40]
+
+
+def test_compact_transformation_keeps_the_cleaned_series():
+    index = pd.date_range("2021-01-01", "2021-01-02", freq="1min", name="time")
+    df = pd.DataFrame({"rad": np.arange(len(index), dtype=float)}, index=index)
+    dropped = [*index[10:500], index[600], *index[700:710]]
+    trans = _transformation(dropped, dropped_date_ranges=[("2021-01-01T20:00", "2021-01-01T21:00")])
+    compacted = C.compact_transformation(trans, "1min")
+    assert [pd.Timestamp(ts) for ts in compacted.dropped_timestamps] == [index[600]]
+    assert [tuple(map(pd.Timestamp, pair)) for pair in compacted.dropped_date_ranges] == [
+        (index[10], index[499]),
+        (index[700], index[709]),
+        (pd.Timestamp("2021-01-01T20:00"), pd.Timestamp("2021-01-01T21:00")),
+    ]
+    pd.testing.assert_frame_equal(C.transform(df, compacted), C.transform(df, trans))
+
+
+def test_compact_transformation_with_off_grid_samples():
+    index = pd.date_range("2021-01-01", "2021-01-02", freq="1min", name="time")
+    # a sample in the middle of a run of dropped timestamps must survive the compaction
+    index = index.append(pd.DatetimeIndex(["2021-01-01T00:30:30"], name="time")).sort_values()
+    df = pd.DataFrame({"rad": np.ones(len(index))}, index=index)
+    trans = _transformation(pd.date_range("2021-01-01T00:10", "2021-01-01T00:50", freq="1min"))
+    assert not C.transform(df, C.compact_transformation(trans, "1min")).equals(C.transform(df, trans))
+    compacted = C.compact_transformation(trans, "1min", times=df.index)
+    # the run is split around the off-grid sample
+    assert compacted.dropped_date_ranges == [
+        (pd.Timestamp("2021-01-01T00:10"), pd.Timestamp("2021-01-01T00:30")),
+        (pd.Timestamp("2021-01-01T00:31"), pd.Timestamp("2021-01-01T00:50")),
+    ]
+    pd.testing.assert_frame_equal(C.transform(df, compacted), C.transform(df, trans))
+
+
+@pytest.mark.parametrize("write", [False, True])
+def test_compact_transformations(tmp_path, write):
+    index = pd.date_range("2021-01-01", "2021-12-31T23:55", freq="5min", name="time")
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    pd.DataFrame({"rad": np.sin(np.arange(len(index)) / 100)}, index=index).to_parquet(
+        tmp_path / "data" / "2021" / "abcd.parquet",
+    )
+    trans = _transformation(index[1000:3000]).model_copy(update={"start": index[0], "end": index[-1]})
+    C.dump_transformation(trans, tmp_path)
+    C.dump_transformation(trans.model_copy(update={"ioc_code": "efgh"}), tmp_path)
+    path = tmp_path / "abcd_rad.json"
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        summary = C.compact_transformations(
+            sorted(tmp_path.glob("*.json")),
+            tmp_path / "data",
+            write=write,
+            executor=executor,
+        )
+    assert summary.status.tolist() == ["compacted", "no data"]
+    row = summary.iloc[0]
+    assert row.interval == pd.Timedelta("5min")
+    assert (row.timestamps_before, row.timestamps_after, row.ranges_added) == (2000, 0, 1)
+    assert row.bytes_after < row.bytes_before / 100
+    compacted = C.load_transformation_from_path(path)
+    if write:
+        assert compacted.dropped_date_ranges == [(index[1000], index[2999])]
+        assert path.stat().st_size == row.bytes_after
+    else:
+        assert compacted == trans
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _artifacts
+from ioc_cleanup import _cube
+from ioc_cleanup import _detide
+
+
+@pytest.fixture
+def products(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = pd.date_range("2021-12-30", "2022-01-02T23:59:00", freq="min", name="time")
+    rng = np.random.default_rng(0)
+    (tmp_path / "transformations").mkdir()
+    for station, sensor in (("abcd", "rad"), ("efgh", "prs"), ("ijkl", "rad")):
+        df = pd.DataFrame({sensor: rng.normal(size=len(index))}, index=index)
+        for year in (2021, 2022):
+            (tmp_path / "data" / str(year)).mkdir(parents=True, exist_ok=True)
+            df.loc[str(year)].to_parquet(tmp_path / "data" / str(year) / f"{station}.parquet")
+            surge = (df.loc[str(year), sensor] / 10).rename(sensor)
+            _artifacts.write_series(_detide.surge_path(station, sensor, year, tmp_path / "surge"), surge, "")
+        trans = C.Transformation(ioc_code=station, sensor=sensor, start="2021-12-31", end="2022-01-02")
+        C.dump_transformation(trans, tmp_path / "transformations")
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        C.build_clean(data_dir=tmp_path / "data", out_dir=tmp_path / "clean", executor=executor)
+    return tmp_path
+
+
+def test_to_grid_averages_per_step():
+    index = pd.DatetimeIndex(["2022-01-01T00:00", "2022-01-01T00:05", "2022-01-01T00:25", "2022-01-01T00:31"])
+    sr = pd.Series([1.0, 3.0, np.nan, 4.0], index=index)
+    grid = _cube.to_grid(sr, pd.Timestamp("2022-01-01"), pd.Timedelta("10min"), 3)
+    np.testing.assert_array_equal(grid, [2.0, np.nan, np.nan])
+
+
+def test_build_cube(products):
+    meta = pd.DataFrame(
+        {"ioc_code": ["ijkl", "abcd"], "lon": [1.0, 2.0], "lat": [3.0, 4.0], "country": "X", "location": ["i", "a"]},
+    )
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        dest = C.build_cube(
+            clean_dir=products / "clean",
+            surge_dir=products / "surge",
+            dest=products / "cube.zarr",
+            start=pd.Timestamp("2021-12-30"),
+            end=pd.Timestamp("2022-01-03"),
+            freq="10min",
+            meta=meta,
+            station_chunk=2,
+            executor=executor,
+        )
+    cube = C.open_cube(dest)
+    assert cube.clean.dims == ("station", "time")
+    assert cube.station.values.tolist() == ["abcd_rad", "efgh_prs", "ijkl_rad"]
+    assert cube.lon.values.tolist()[::2] == [2.0, 1.0]
+    assert np.isnan(cube.lon.values[1])
+    assert cube.sensor.values.tolist() == ["rad", "prs", "rad"]
+
+    window = cube.sel(time=slice("2021-12-31T23:00", "2022-01-01T01:00"))
+    clean = C.load_clean("efgh", "prs", products / "clean")
+    expected = clean.resample("10min").mean().loc["2021-12-31T23:00":"2022-01-01T01:00"]
+    np.testing.assert_allclose(window.clean.sel(station="efgh_prs").values, expected.to_numpy(), rtol=1e-6)
+    np.testing.assert_allclose(window.surge.values, window.clean.values / 10, rtol=1e-5)
+    # outside of the transformation window there is no clean data, but there is surge
+    outside = cube.sel(time="2021-12-30T12:00")
+    assert np.isnan(outside.clean.values).all()
+    assert not np.isnan(outside.surge.values).any()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _artifacts
+
+# The synthetic records are pure tide
+MAX_SURGE = 0.1
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = pd.date_range("2021-01-01", "2021-03-31T23:50:00", freq="10min", name="time")
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    tide = np.sin(2 * np.pi * hours / 12.42) + 0.3 * np.sin(2 * np.pi * hours / 12.0)
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    (tmp_path / "transformations").mkdir()
+    for station in ("abcd", "efgh"):
+        pd.DataFrame({"rad": tide}, index=index).to_parquet(tmp_path / "data" / "2021" / f"{station}.parquet")
+        trans = C.Transformation(ioc_code=station, sensor="rad", start="2021-01-01", end="2021-03-31")
+        C.dump_transformation(trans, tmp_path / "transformations")
+    meta = pd.DataFrame({"ioc_code": ["abcd", "efgh"], "lat": [40.0, 50.0]})
+    return tmp_path, meta
+
+
+def _run(tmp_path, meta, **kwargs):
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        return C.detide_catalog(
+            data_dir=tmp_path / "data",
+            out_dir=tmp_path / "surge",
+            years=[2020, 2021],
+            meta=meta,
+            executor=executor,
+            **kwargs,
+        )
+
+
+def test_detide_catalog_writes_and_resumes(catalog):
+    tmp_path, meta = catalog
+    summary = _run(tmp_path, meta)
+    assert summary.set_index(["station", "year"]).status.to_dict() == {
+        ("abcd", 2020): "no data",
+        ("abcd", 2021): "computed",
+        ("efgh", 2020): "no data",
+        ("efgh", 2021): "computed",
+    }
+    surge = pd.read_parquet(tmp_path / "surge" / "2021" / "abcd_rad.parquet").rad
+    assert len(surge) == 90 * 144 - 143
+    assert surge.abs().max() < MAX_SURGE
+
+    # Nothing changed: every output is up to date
+    assert set(_run(tmp_path, meta).status) == {"no data", "skipped"}
+
+    # Editing one transformation only recomputes that station
+    trans = C.load_transformation("efgh", "rad")
+    C.dump_transformation(trans.model_copy(update={"end": pd.Timestamp("2021-02-28")}), tmp_path / "transformations")
+    summary = _run(tmp_path, meta).set_index(["station", "year"]).status
+    assert (summary["abcd", 2021], summary["efgh", 2021]) == ("skipped", "computed")
+    assert _run(tmp_path, meta, force=True).status.tolist().count("computed") == len(meta)
+
+
+def test_detide_catalog_ignores_partial_outputs(catalog):
+    tmp_path, meta = catalog
+    path = tmp_path / "surge" / "2021" / "abcd_rad.parquet"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"truncated")
+    assert _artifacts.read_fingerprint(path) is None
+    summary = _run(tmp_path, meta).set_index(["station", "year"]).status
+    assert summary["abcd", 2021] == "computed"
+    assert _artifacts.read_fingerprint(path) is not None
+
+
+def test_detide_catalog_reports_stations_without_meta(catalog):
+    tmp_path, meta = catalog
+    summary = _run(tmp_path, meta[meta.ioc_code == "abcd"]).set_index(["station", "year"]).status
+    assert (summary["abcd", 2021], summary["efgh", 2020], summary["efgh", 2021]) == ("computed", "no data", "no meta")
+    assert not (tmp_path / "surge" / "2021" / "efgh_rad.parquet").exists()
+
+
+def test_detide_catalog_applies_the_given_transformations(catalog):
+    tmp_path, meta = catalog
+    (tmp_path / "other").mkdir()
+    trans = C.load_transformation("efgh", "rad").model_copy(update={"end": pd.Timestamp("2021-02-28")})
+    C.dump_transformation(trans, tmp_path / "other")
+    summary = _run(tmp_path, meta, paths=[tmp_path / "other" / "efgh_rad.json"])
+    assert summary.set_index(["station", "year"]).status["efgh", 2021] == "computed"
+    surge = pd.read_parquet(tmp_path / "surge" / "2021" / "efgh_rad.parquet").rad
+    assert surge.index[-1] <= trans.end
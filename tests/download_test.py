@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import http
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _searvey
+
+RETRIES = 2
+
+
+def _archive(data_dir, df):
+    (data_dir / "2021").mkdir(parents=True)
+    df.to_parquet(data_dir / "2021" / "abcd.parquet")
+    return data_dir
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_incremental_download_only_fetches_the_tail(tmp_path, partitioned):
+    index = pd.date_range("2021-01-01", "2021-01-20T23:59:00", freq="min", name="time")
+    full = pd.DataFrame({"rad": np.round(np.sin(np.arange(len(index)) / 100), 4)}, index=index)
+    head = full[:"2021-01-10"]
+    out = tmp_path / "out"
+    with C.StandInServer(_archive(tmp_path / "head", head), synthetic=False) as server:
+        C.download_year_station("abcd", 2021, str(out), partitioned=partitioned, base_url=server.base_url)
+    manifest = C.read_manifest(out)["abcd/2021"]
+    assert manifest["rows"] == len(head)
+    assert pd.Timestamp(manifest["start"]) == pd.Timestamp("2021-01-01")
+
+    with C.StandInServer(_archive(tmp_path / "full", full), synthetic=False) as server:
+        C.download_year_station(
+            "abcd",
+            2021,
+            str(out),
+            partitioned=partitioned,
+            incremental=True,
+            base_url=server.base_url,
+        )
+    assert min(pd.Timestamp(request["timestart"]) for request in server.requests) == head.index[-1]
+    df = C.load_station("abcd", out, 2021, 2022)
+    assert df.index.is_unique and df.index.is_monotonic_increasing
+    pd.testing.assert_series_equal(df.rad, full.rad, check_names=False, check_freq=False, check_index_type=False)
+    manifest = C.read_manifest(out)["abcd/2021"]
+    assert manifest["rows"] == len(full)
+    assert pd.Timestamp(manifest["start"]) == pd.Timestamp("2021-01-01")
+    assert pd.Timestamp(manifest["end"]) == pd.Timestamp("2021-12-31T23:59:59")
+    assert not list(out.rglob("*.tmp"))
+
+
+def test_concurrent_manifest_updates_are_not_lost(tmp_path):
+    start, end = pd.Timestamp("2021-01-01"), pd.Timestamp("2022-01-01")
+    stations = [f"s{i:03d}" for i in range(64)]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        updates = [
+            executor.submit(_searvey._update_manifest, tmp_path, station, 2021, start=start, end=end, rows=1)
+            for station in stations
+        ]
+    for update in updates:
+        update.result()
+    assert sorted(C.read_manifest(tmp_path)) == [f"{station}/2021" for station in stations]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.fixture
+def archive(tmp_path_factory):
+    index = pd.date_range("2021-01-01", "2021-01-03T23:59:00", freq="min", name="time")
+    df = pd.DataFrame({"rad": np.round(np.sin(np.arange(len(index)) / 100), 4)}, index=index)
+    return _archive(tmp_path_factory.mktemp("archive"), df), df
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+def test_download_station_years_retries(archive, tmp_path, partitioned):
+    data_dir, df = archive
+    with C.StandInServer(data_dir, synthetic=False, error_rate=0.2, disconnect_rate=0.05, seed=2) as server:
+        summary = C.download_station_years(
+            ["efgh", "abcd"],
+            [2020, 2021],
+            tmp_path,
+            partitioned=partitioned,
+            base_url=server.base_url,
+            rate=None,
+            retries=8,
+            backoff=0.01,
+        )
+    assert summary.station.tolist() == ["abcd", "abcd", "efgh", "efgh"]
+    assert summary.status.tolist() == ["no data", "downloaded", "no data", "no data"]
+    assert summary.rows.tolist() == [0, len(df), 0, 0]
+    failed = sum(request["status"] != http.HTTPStatus.OK for request in server.requests)
+    assert summary.retries.sum() == failed > 0
+    assert summary.requests.sum() == len(server.requests)
+    stored = C.load_station("abcd", tmp_path, 2020, 2022)
+    pd.testing.assert_series_equal(stored.rad, df.rad, check_names=False, check_freq=False, check_index_type=False)
+    assert sorted(C.read_manifest(tmp_path)) == ["abcd/2020", "abcd/2021", "efgh/2020", "efgh/2021"]
+
+
+def test_download_station_years_limits(archive, tmp_path):
+    data_dir, _ = archive
+    with C.StandInServer(data_dir, synthetic=False, error_rate=1.0) as server:
+        summary = C.download_station_years(
+            ["abcd"],
+            [2021],
+            tmp_path,
+            base_url=server.base_url,
+            rate=None,
+            retries=RETRIES,
+            backoff=0.01,
+        )
+    assert summary.status.tolist() == ["failed"]
+    assert "500 Internal Server Error" in summary.error.iloc[0]
+    # the first request to fail for good cancels the others
+    attempts = collections.Counter(request["timestart"] for request in server.requests)
+    assert max(attempts.values()) == RETRIES + 1
+    assert not C.read_manifest(tmp_path)
+
+    # the client-side rate limit keeps the server from refusing requests
+    with C.StandInServer(data_dir, synthetic=False, rate_limit=5) as server:
+        summary = C.download_station_years(["abcd"], [2021], tmp_path, base_url=server.base_url, rate=4)
+    assert summary.status.tolist() == ["downloaded"]
+    assert {request["status"] for request in server.requests} == {200}
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _constants
+
+# The synthetic records are pure tide
+MAX_SURGE = 0.1
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(_constants, "HARMONICS_DIR", tmp_path / "harmonics")
+    index = pd.date_range("2021-01-01", "2021-03-31T23:50:00", freq="10min", name="time")
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    tide = np.sin(2 * np.pi * hours / 12.42) + 0.3 * np.sin(2 * np.pi * hours / 12.0)
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    (tmp_path / "transformations").mkdir()
+    for station in ("abcd", "efgh"):
+        pd.DataFrame({"rad": tide}, index=index).to_parquet(tmp_path / "data" / "2021" / f"{station}.parquet")
+        trans = C.Transformation(
+            ioc_code=station,
+            sensor="rad",
+            start="2021-01-01",
+            end="2021-03-31",
+            tsunami=[("2021-02-10T00:00", "2021-02-10T06:00"), ("2021-03-20T00:00", "2021-03-20T12:00")],
+        )
+        C.dump_transformation(trans, tmp_path / "transformations")
+    meta = pd.DataFrame({"ioc_code": ["abcd", "efgh"], "lat": [40.0, 50.0]})
+    return tmp_path, meta
+
+
+def test_load_surge_ts_for_window(catalog):
+    tmp_path, _ = catalog
+    start, end = pd.Timestamp("2021-02-10T00:00"), pd.Timestamp("2021-02-10T06:00")
+    surge = C.load_surge_ts_for_window("abcd", "rad", start, end, tmp_path / "data", demean=False, lat=40.0)
+    assert surge.name == "rad"
+    assert surge.index[0] == start
+    assert surge.index[-1] == end
+    assert surge.abs().max() < MAX_SURGE
+    # the fit is cached and reused for the same window
+    assert len(C.list_harmonics()) == 1
+    C.load_surge_ts_for_window("abcd", "rad", start, end, tmp_path / "data", demean=False, lat=40.0)
+    assert len(C.list_harmonics()) == 1
+    # no data
+    empty = C.load_surge_ts_for_window(
+        "abcd",
+        "rad",
+        "2022-01-01",
+        "2022-01-02",
+        tmp_path / "data",
+        demean=False,
+        lat=40.0,
+    )
+    assert empty.empty
+
+
+def test_surge_events(catalog):
+    tmp_path, meta = catalog
+    events = C.tsunami_events(end=pd.Timestamp("2021-03-01"))
+    assert events.station.tolist() == ["abcd", "efgh"]
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        result = C.surge_events(events, tmp_path / "data", meta=meta, executor=executor)
+    assert result[["station", "sensor", "start", "end"]].equals(events)
+    assert (result.error == "").all()
+    for surge in result.surge:
+        assert surge.index[0] == pd.Timestamp("2021-02-10T00:00")
+        assert surge.index[-1] == pd.Timestamp("2021-02-10T06:00")
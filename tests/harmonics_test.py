@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _constants
+from ioc_cleanup import _harmonics
+from ioc_cleanup import _tools
+
+OPTS = _tools.OPTS | {"lat": 40.0, "verbose": False}
+
+
+@pytest.fixture
+def tide(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(_constants, "HARMONICS_DIR", tmp_path / "harmonics")
+    (tmp_path / "transformations").mkdir()
+    C.dump_transformation(
+        C.Transformation(ioc_code="abcd", sensor="rad", start="2020-01-01", end="2021-01-01"),
+        tmp_path / "transformations",
+    )
+    index = pd.date_range("2020-01-01", periods=30 * 144, freq="10min")
+    hours = np.arange(len(index)) / 6
+    values = np.cos(2 * np.pi * hours / 12.42) + 0.3 * np.cos(2 * np.pi * hours / 12.0)
+    return pd.Series(values + np.random.default_rng(0).normal(scale=0.05, size=len(index)), index=index)
+
+
+@pytest.fixture
+def solve_calls(monkeypatch):
+    calls = []
+    solve = _tools.utide.solve
+
+    def spy(*args, **kwargs):
+        calls.append(1)
+        return solve(*args, **kwargs)
+
+    monkeypatch.setattr(_tools.utide, "solve", spy)
+    return calls
+
+
+def test_fit_tide_cached_reuses_coefficients(tide, solve_calls):
+    expected = C.surge(tide, OPTS, _tools.RESAMPLE)
+    coef = _tools.fit_tide_cached(tide, "abcd", "rad", OPTS, _tools.RESAMPLE)
+    cached = _tools.fit_tide_cached(tide, "abcd", "rad", OPTS, _tools.RESAMPLE)
+    assert solve_calls == [1, 1]  # `surge()` + the first cached fit
+    pd.testing.assert_series_equal(C.surge(tide, OPTS, _tools.RESAMPLE, coef=cached), expected)
+    np.testing.assert_array_equal(coef.A, cached.A)
+    listing = C.list_harmonics()
+    assert listing[["station", "sensor", "rsmp"]].to_dict("records") == [
+        {"station": "abcd", "sensor": "rad", "rsmp": _tools.RESAMPLE},
+    ]
+
+
+def test_fit_tide_cached_key_covers_inputs(tide, solve_calls):
+    variants = [
+        (tide, OPTS, _tools.RESAMPLE),
+        (tide, OPTS, None),
+        (tide, OPTS | {"method": "robust"}, _tools.RESAMPLE),
+        (tide.iloc[:-1], OPTS, _tools.RESAMPLE),
+    ]
+    for ts, opts, rsmp in variants:
+        _tools.fit_tide_cached(ts, "abcd", "rad", opts, rsmp)
+    assert len(solve_calls) == len(variants)
+    assert len(C.list_harmonics()) == len(variants)
+
+
+def test_evict_harmonics(tmp_path):
+    keys = ("a", "b", "c")
+    for used, key in enumerate(keys, start=1):
+        _harmonics.save_harmonics(key, np.zeros(1000), {"station": key}, cache_dir=tmp_path)
+        # explicit mtimes: `a` is the oldest, then `b`, then `c`
+        os.utime(tmp_path / f"{key}.pkl", (used * 1000, used * 1000))
+    _harmonics.load_harmonics("a", cache_dir=tmp_path)  # mark as recently used
+    size = sum(path.stat().st_size for path in tmp_path.glob("*.pkl")) // len(keys)
+    # only room for the two most recently used fits: `b` goes
+    assert _harmonics.evict_harmonics(max_bytes=2 * size, cache_dir=tmp_path) == 1
+    assert set(_harmonics.list_harmonics(tmp_path).key) == {"a", "c"}
+    assert _harmonics.clear_harmonics(tmp_path) == len(keys) - 1
+    assert _harmonics.list_harmonics(tmp_path).empty
+
+
+def test_save_harmonics_removes_the_partial_file(tmp_path):
+    with pytest.raises(AttributeError):
+        _harmonics.save_harmonics("a", lambda: None, {"station": "a"}, cache_dir=tmp_path)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _searvey
+from ioc_cleanup import _tools
+
+
+@pytest.fixture
+def station_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = pd.date_range("2020-01-01", "2022-12-31T23:59:00", freq="10min", name="time")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"rad": rng.normal(size=len(index)), "prs": rng.normal(size=len(index))}, index=index)
+    for year in (2020, 2021, 2022):
+        (tmp_path / "data" / str(year)).mkdir(parents=True)
+        df.loc[str(year)].to_parquet(tmp_path / "data" / str(year) / "abcd.parquet")
+    (tmp_path / "transformations").mkdir()
+    trans = C.Transformation(
+        ioc_code="abcd",
+        sensor="rad",
+        start="2020-03-01T00:00:00",
+        end="2022-06-01T00:00:00",
+        dropped_date_ranges=[("2020-12-31T12:00:00", "2021-01-02T00:00:00"), ("2022-01-01", "2022-02-01")],
+        dropped_timestamps=["2020-06-01T00:00:00", "2021-06-01T00:00:00", "2021-06-01T00:10:00"],
+        breakpoints=["2020-09-01T00:00:00", "2021-09-01T00:00:00"],
+        high=2.5,
+    )
+    C.dump_transformation(trans, tmp_path / "transformations")
+    return tmp_path / "data"
+
+
+@pytest.mark.parametrize("year", [2020, 2021, 2022])
+def test_load_clean_ts_for_year_matches_full_cleaning(station_dir, year):
+    raw = C.load_station("abcd", station_dir, 2020, 2026).sort_index()
+    expected = C.clean(raw, "abcd", "rad").loc[f"{year}-01-01" : f"{year}-12-31"].dropna()
+    expected = _tools.demean_signal(expected)
+    result = C.load_clean_ts_for_year("abcd", "rad", year, station_dir, demean=True)
+    pd.testing.assert_series_equal(result, expected, check_freq=False)
+
+
+def test_load_clean_ts_for_year_reads_one_year_and_one_column(station_dir, monkeypatch):
+    calls = []
+    read_parquet = pd.read_parquet
+
+    def spy(path, **kwargs):
+        calls.append((path, kwargs.get("columns")))
+        return read_parquet(path, **kwargs)
+
+    monkeypatch.setattr(_searvey.pd, "read_parquet", spy)
+    C.load_clean_ts_for_year("abcd", "rad", 2021, station_dir, demean=False)
+    assert calls == [(station_dir / "2021" / "abcd.parquet", ["rad"])]
+    calls.clear()
+    assert C.load_clean_ts_for_year("abcd", "rad", 2023, station_dir, demean=False).empty
+    assert not calls
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+
+from ioc_cleanup import _searvey
+from ioc_cleanup import _tools
+
+
+def _meta():
+    return gpd.GeoDataFrame(
+        {"ioc_code": ["abur", "bres"], "lon": [0.0, 1.0], "lat": [40.0, 41.0]},
+        geometry=gpd.points_from_xy([0.0, 1.0], [40.0, 41.0], crs="EPSG:4326"),
+    )
+
+
+@pytest.fixture
+def fetch_calls(monkeypatch):
+    calls = []
+
+    def fake_fetch():
+        calls.append(1)
+        return _meta()
+
+    monkeypatch.setattr(_searvey, "fetch_meta", fake_fetch)
+    monkeypatch.delenv("IOC_CLEANUP_OFFLINE", raising=False)
+    monkeypatch.delenv("IOC_CLEANUP_BASE_URL", raising=False)
+    _searvey.get_meta.cache_clear()
+    yield calls
+    _searvey.get_meta.cache_clear()
+
+
+def test_get_meta_uses_snapshot_within_ttl(tmp_path, fetch_calls):
+    path = tmp_path / "meta.parquet"
+    meta = _searvey.get_meta(path)
+    assert path.exists()
+    assert len(fetch_calls) == 1
+    _searvey.get_meta.cache_clear()
+    pd.testing.assert_frame_equal(_searvey.get_meta(path), meta)
+    assert len(fetch_calls) == 1
+
+
+def test_get_meta_refreshes_stale_snapshot(tmp_path, fetch_calls):
+    path = tmp_path / "meta.parquet"
+    _searvey.refresh_meta(path)
+    old = pd.Timestamp("2020-01-01").timestamp()
+    os.utime(path, (old, old))
+    _searvey.get_meta(path, ttl=pd.Timedelta(days=1))
+    assert fetch_calls == [1, 1]
+
+
+def test_get_meta_never_stores_redirected_metadata(tmp_path, fetch_calls, monkeypatch):
+    monkeypatch.setenv("IOC_CLEANUP_BASE_URL", "http://127.0.0.1:8000")
+    path = tmp_path / "meta.parquet"
+    _searvey.get_meta(path)
+    assert len(fetch_calls) == 1
+    assert not path.exists()
+    with pytest.raises(RuntimeError):
+        _searvey.refresh_meta(path)
+    assert not path.exists()
+
+
+def test_get_meta_offline(tmp_path, fetch_calls, monkeypatch):
+    monkeypatch.setenv("IOC_CLEANUP_OFFLINE", "1")
+    with pytest.raises(FileNotFoundError):
+        _searvey.get_meta(tmp_path / "missing.parquet")
+    with pytest.raises(RuntimeError):
+        _searvey.refresh_meta(tmp_path / "meta.parquet")
+    assert not fetch_calls
+
+
+def test_ioc_is_resolved_lazily(monkeypatch):
+    monkeypatch.setattr(_searvey, "get_meta", _meta)
+    assert list(_tools.IOC.ioc_code) == ["abur", "bres"]
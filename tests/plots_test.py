@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import holoviews as hv
+import numpy as np
+import pandas as pd
+import panel as pn
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _plots
+
+
+# The box of a selection, in values
+BOTTOM, TOP = -0.2, 0.5
+MAX_SELECTED = 20_000
+
+
+def _series():
+    index = pd.date_range("2020-01-01", "2021-12-31T23:59:00", freq="min")
+    return pd.Series(np.sin(np.arange(len(index)) / 500), index=index)
+
+
+def test_indices_in_bounds_maps_box_to_exact_samples():
+    df = _series()
+    x0, x1 = pd.Timestamp("2020-03-01T12:00:30"), pd.Timestamp("2020-03-05T00:00:00")
+    expected = np.flatnonzero((df.index >= x0) & (df.index <= x1) & (df.to_numpy() >= BOTTOM) & (df.to_numpy() <= TOP))
+    # bokeh may report the corners in any order, and datetime axes as epoch milliseconds
+    bounds = (x1.to_datetime64(), TOP, x0.to_datetime64(), BOTTOM)
+    assert _plots.indices_in_bounds(df, bounds) == expected.tolist()
+    bounds_ms = (x0.value / 1e6, BOTTOM, x1.value / 1e6, TOP)
+    assert _plots.indices_in_bounds(df, bounds_ms) == expected.tolist()
+    assert _plots.indices_in_bounds(df, None) == []
+
+    text_box = pn.widgets.TextAreaInput()
+    _plots.print_range(df, _plots.indices_in_bounds(df, bounds), text_box)
+    first, last = df.index[expected[0]], df.index[expected[-1]]
+    assert text_box.value == f'["{first:%Y-%m-%dT%H:%M:%S}", "{last:%Y-%m-%dT%H:%M:%S}"],'
+
+
+def test_rasterized_line_renders_multi_year_series():
+    hv.extension("bokeh")
+    plot = _plots.plot_line(_series(), rasterize=True)
+    assert isinstance(plot, hv.DynamicMap)
+    hv.render(plot)
+    selected = _plots.plot_selected(_series(), list(range(100_000)))
+    assert len(selected) <= MAX_SELECTED
+
+
+def test_selection_is_formatted_like_strftime():
+    df = _series()
+    indices = [5000, 10, 11, 5000, 700_000]
+    text_box = pn.widgets.TextAreaInput()
+    _plots.print_all_points(df, indices, text_box)
+    expected = [f'    "{df.index[i].strftime("%Y-%m-%dT%H:%M:%S")}"' for i in sorted(set(indices))]
+    assert text_box.value == ",\n".join(expected)
+    _plots.print_all_points(df, [], text_box)
+    assert text_box.value == "No selection!"
+
+    _plots.print_segment(df, indices, text_box)
+    segment = C.Segment.model_validate_json(text_box.value)
+    assert segment.start == df.index[10]
+    assert segment.end == df.index[700_000]
+    assert segment.offset == -df.iloc[10:700_000].mean()
+
+
+def test_save_selection_merges_into_the_transformation(tmp_path):
+    df = _series()
+    trans = C.Transformation(
+        ioc_code="abcd",
+        sensor="rad",
+        start=df.index[0],
+        end=df.index[-1],
+        dropped_timestamps=[df.index[50], df.index[3]],
+    )
+    C.dump_transformation(trans, tmp_path)
+    kwargs = {"station": "abcd", "sensor": "rad", "trans_dir": tmp_path}
+
+    _plots.save_selection(df, np.arange(10, 100), "points", **kwargs)
+    # saving the same selection twice does not change the file
+    saved = _plots.save_selection(df, np.arange(10, 100), "points", **kwargs)
+    assert saved.dropped_timestamps == [df.index[3], *df.index[10:100]]
+    _plots.save_selection(df, [2000, 1000], "range", **kwargs)
+    _plots.save_selection(df, [200, 300], "segment", **kwargs)
+    _plots.save_selection(df, [200, 300], "segment", **kwargs)
+
+    result = C.load_transformation_from_path(tmp_path / "abcd_rad.json")
+    assert result.dropped_timestamps == saved.dropped_timestamps
+    assert result.dropped_date_ranges == [(df.index[1000], df.index[2000])]
+    assert len(result.segments) == 1
+    assert result.segments[0].offset == -df.iloc[200:300].mean()
+    with pytest.raises(ValueError, match="No selection"):
+        _plots.save_selection(df, [], "points", **kwargs)
+
+
+def test_segment_offset_applies_to_the_cleaned_series(tmp_path):
+    clean = _series() + 1.5
+    demeaned = clean - clean.mean()
+    trans = C.Transformation(ioc_code="abcd", sensor="rad", start=clean.index[0], end=clean.index[-1])
+    C.dump_transformation(trans, tmp_path)
+    kwargs = {"station": "abcd", "sensor": "rad", "trans_dir": tmp_path}
+    saved = _plots.save_selection(demeaned, [200, 300], "segment", clean=clean, **kwargs)
+    assert saved.segments[0].offset == -clean.iloc[200:300].mean()
+
+    status = pn.pane.Markdown()
+    selection = {"positions": np.arange(10)}
+    buttons = _plots.save_buttons(demeaned, selection, station="abcd", sensor="rad", status=status, disabled=True)
+    assert all(button.disabled for button in buttons)
+
+
+def test_resaving_a_corrected_segment_keeps_its_offset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    C.get_series_cache().clear()
+    index = pd.date_range("2021-01-01", "2021-01-10", freq="min", name="time")
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    pd.DataFrame({"rad": np.full(len(index), 5777.0)}, index=index).to_parquet(
+        tmp_path / "data" / "2021" / "abcd.parquet",
+    )
+    segment = C.Segment(start=index[0], end=index[-1], offset=-5777.0)
+    trans = C.Transformation(ioc_code="abcd", sensor="rad", start=index[0], end=index[-1], segments=[segment])
+    trans_dir = tmp_path / "transformations"
+    trans_dir.mkdir()
+    C.dump_transformation(trans, trans_dir)
+
+    df = _plots.load_surge_tide("abcd", "rad", 2021, surge=False, demean=False, folder=tmp_path / "data")
+    assert (df == 0).all()
+    clean = _plots.load_uncorrected("abcd", "rad", 2021, folder=tmp_path / "data")
+    kwargs = {"station": "abcd", "sensor": "rad", "trans_dir": trans_dir}
+    # the latest starting segment replaces the correction of the older one
+    saved = _plots.save_selection(df, [100, 200], "segment", clean=clean, **kwargs)
+    assert saved.segments[-1].offset == segment.offset
+    C.get_series_cache().clear()
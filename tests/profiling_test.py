@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _profiling
+from ioc_cleanup import _tools
+
+
+@pytest.fixture(autouse=True)
+def _reset_profiling():
+    C.clear_profiling()
+    yield
+    C.disable_profiling()
+    C.clear_profiling()
+
+
+def _transformation() -> C.Transformation:
+    return C.Transformation(
+        ioc_code="abcd",
+        sensor="rad",
+        notes="",
+        start=pd.Timestamp("2020-01-01"),
+        end=pd.Timestamp("2020-01-02"),
+        breakpoints=[pd.Timestamp("2020-01-01 12:00")],
+    )
+
+
+def _raw() -> pd.DataFrame:
+    index = pd.date_range("2020-01-01", "2020-01-02", freq="1min", name="time")
+    df = pd.DataFrame({"rad": np.arange(len(index), dtype=float)}, index=index)
+    df.attrs = {"ioc_code": "abcd", "sensor": "rad"}
+    return df
+
+
+def test_disabled_records_nothing():
+    assert not C.is_profiling()
+    stage = C.profile_stage("transform", station="abcd")
+    assert stage is C.profile_stage("other")
+    with stage as s:
+        s.rows = 10
+    assert C.profiling_records().empty
+    assert C.profiling_summary().empty
+
+
+def test_stages_are_recorded_per_station():
+    C.enable_profiling()
+    df = C.transform(_raw(), _transformation())
+    sr = df.rad
+    sr.attrs = dict(df.attrs)
+    _tools.demean_signal(sr)
+    records = C.profiling_records()
+    assert set(records.stage) == {"transform", "demean"}
+    assert records.set_index("stage").station["transform"] == "abcd"
+    assert records.set_index("stage").rows.to_dict() == {"transform": len(df), "demean": len(df)}
+    summary = C.profiling_summary()
+    assert summary.loc["transform", "calls"] == 1
+    assert summary.loc["transform", "rows_per_s"] > 0
+
+
+def test_nested_stages_inherit_the_station():
+    C.enable_profiling()
+    with C.profile_stage("outer", station="abcd"):
+        with C.profile_stage("inner") as inner:
+            inner.rows = rows = 3
+    records = C.profiling_records().set_index("stage")
+    assert records.station.to_dict() == {"inner": "abcd", "outer": "abcd"}
+    assert records.rows["inner"] == rows
+    # the inner stage completes first, and the outer one includes its time
+    assert records.wall["outer"] >= records.wall["inner"]
+
+
+def test_memory_peak():
+    C.enable_profiling(memory=True)
+    with C.profile_stage("outer"):
+        with C.profile_stage("alloc"):
+            mb = 4
+            data = np.ones(mb * 2**20 // 8)
+            del data
+        with C.profile_stage("small"):
+            pass
+    peaks = C.profiling_records().set_index("stage").peak_mb
+    assert peaks["alloc"] >= 0.95 * mb
+    assert peaks["small"] < 1
+    # the peak of a nested stage counts for its parent too
+    assert peaks["outer"] >= peaks["alloc"]
+
+
+def test_log_and_report(tmp_path):
+    log = tmp_path / "stages.jsonl"
+    C.enable_profiling(log_path=log)
+    # spawned workers pick the configuration up from the environment
+    assert os.environ[_profiling.PROFILE_ENV] == str(log)
+    with C.profile_stage("download", station="abcd", rows=5):
+        pass
+    lines = log.read_text().splitlines()
+    assert json.loads(lines[0])["stage"] == "download"
+    assert C.profiling_records().rows.tolist() == [5]
+
+    report = tmp_path / "report.json"
+    C.write_profiling_report(report)
+    content = json.loads(report.read_text())
+    assert content["records"][0]["station"] == "abcd"
+    assert content["summary"][0]["stage"] == "download"
+
+    C.disable_profiling()
+    assert _profiling.PROFILE_ENV not in os.environ
+
+
+def _work(station: str) -> None:
+    with C.profile_stage("work", station=station):
+        pass
+
+
+def test_records_of_the_workers_reach_the_parent():
+    C.enable_profiling()
+    log = _profiling._State.temporary
+    with concurrent.futures.ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as executor:
+        list(executor.map(_work, ["abcd", "efgh"]))
+    records = C.profiling_records()
+    assert sorted(records.station) == ["abcd", "efgh"]
+    assert os.getpid() not in set(records.pid)
+    C.clear_profiling()
+    assert C.profiling_records().empty
+    C.disable_profiling()
+    assert not log.exists()
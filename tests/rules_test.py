@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup import _rules
+from ioc_cleanup import _tools
+
+
+def _frame():
+    index = pd.date_range("2020-01-01", periods=60, freq="min")
+    return pd.DataFrame(
+        {"rad": np.arange(60, dtype=float), "prs": np.arange(60, dtype=float)},
+        index=index,
+    )
+
+
+def _transformation(**kwargs):
+    defaults = {
+        "ioc_code": "abur",
+        "sensor": "rad",
+        "start": "2020-01-01T00:05:00",
+        "end": "2020-01-01T00:50:00",
+    }
+    return C.Transformation(**(defaults | kwargs))
+
+
+def test_transform_clips_window_and_drops():
+    trans = _transformation(
+        dropped_date_ranges=[("2020-01-01T00:10:00", "2020-01-01T00:12:00")],
+        dropped_timestamps=["2020-01-01T00:05:00", "2020-01-01T00:20:00", "2019-12-31T00:00:00"],
+    )
+    out = C.transform(_frame(), trans)
+    assert out.index[0] == pd.Timestamp("2020-01-01T00:05:00")
+    assert out.index[-1] == pd.Timestamp("2020-01-01T00:50:00")
+    dropped = out.index[out.rad.isna()].strftime("%H:%M").tolist()
+    assert dropped == ["00:05", "00:10", "00:11", "00:12", "00:20"]
+    # dropped samples are removed from every sensor
+    pd.testing.assert_index_equal(out.index[out.prs.isna()], out.index[out.rad.isna()])
+
+
+def test_transform_enforces_thresholds_on_sensor_only():
+    out = C.transform(_frame(), _transformation(high=40.0, low=8.0))
+    assert out.rad.dropna().between(8.0, 40.0).all()
+    assert out.rad.isna().sum() == 3 + 10
+    assert not out.prs.isna().any()
+
+
+def test_build_mask_overlapping_ranges_and_unsorted_input():
+    trans = _transformation(
+        dropped_date_ranges=[
+            ("2020-01-01T00:30:00", "2020-01-01T00:35:00"),
+            ("2020-01-01T00:33:00", "2020-01-01T00:40:00"),
+            ("2020-01-01T00:45:00", "2020-01-01T00:44:00"),  # inverted, ignored
+        ],
+    )
+    frame = _frame().sample(frac=1.0, random_state=1)
+    out = C.transform(frame, trans)
+    assert out.index.is_monotonic_increasing
+    dropped = pd.date_range("2020-01-01T00:30:00", "2020-01-01T00:40:00", freq="min")
+    assert out.rad.isna().sum() == len(dropped)
+    mask = _rules.build_mask(_rules.to_ns(out.index), _rules.compile_rules(trans))
+    np.testing.assert_array_equal(mask, out.rad.isna().to_numpy())
+
+
+def _dump_large_transformation(dest_dir):
+    timestamps = pd.date_range("2020-01-01", periods=5000, freq="min").to_pydatetime().tolist()
+    trans = _transformation(
+        dropped_timestamps=timestamps[::-1],
+        dropped_date_ranges=[("2020-02-01T00:00:00", "2020-02-02T00:00:00")],
+        breakpoints=["2020-01-15T00:00:00"],
+        notes="large",
+    )
+    C.dump_transformation(trans, dest_dir)
+    return trans, dest_dir / "abur_rad.json"
+
+
+def test_load_transformation_uses_compiled_cache(tmp_path):
+    trans, path = _dump_large_transformation(tmp_path)
+    assert C.load_transformation_from_path(path) == trans
+    assert _rules.cache_path(path).exists()
+    assert C.load_transformation_from_path(path) == trans
+    rules = C.load_rules("abur", "rad", tmp_path)
+    expected = C.compile_rules(trans)
+    np.testing.assert_array_equal(rules.dropped_timestamps, expected.dropped_timestamps)
+    np.testing.assert_array_equal(rules.dropped_ranges, expected.dropped_ranges)
+    np.testing.assert_array_equal(rules.breakpoints, expected.breakpoints)
+    assert (rules.start, rules.end, rules.high, rules.low) == (expected.start, expected.end, None, None)
+
+
+def test_compiled_cache_is_rebuilt_when_stale(tmp_path):
+    trans, path = _dump_large_transformation(tmp_path)
+    C.load_transformation_from_path(path)
+    kept = trans.dropped_timestamps[:10]
+    updated = trans.model_copy(update={"dropped_timestamps": kept, "notes": "updated"})
+    C.dump_transformation(updated, tmp_path)
+    assert C.load_transformation_from_path(path) == updated
+    assert len(C.load_rules("abur", "rad", tmp_path).dropped_timestamps) == len(kept)
+
+
+def test_demean_signal_assigns_each_sample_to_one_segment():
+    index = pd.date_range("2020-01-01", periods=10, freq="h")
+    sr = pd.Series([1.0, 1.0, 3.0, np.nan, 10.0, 12.0, 11.0, 20.0, 20.0, 20.0], index=index, name="rad")
+    sr.attrs = {"breakpoints": [index[7], index[4]], "status": "transformed"}
+    original = sr.copy()
+    out = _tools.demean_signal(sr)
+    pd.testing.assert_index_equal(out.index, sr.index)
+    assert out.attrs == sr.attrs
+    expected = [-2 / 3, -2 / 3, 4 / 3, np.nan, -1.0, 1.0, 0.0, 0.0, 0.0, 0.0]
+    np.testing.assert_allclose(out.to_numpy(), expected)
+    pd.testing.assert_series_equal(sr, original)  # the input is not modified
+
+
+def test_transform_applies_segment_corrections():
+    trans = _transformation(
+        segments=[
+            {"start": "2020-01-01T00:10:00", "end": "2020-01-01T00:20:00", "offset": -10.0},
+            {"start": "2020-01-01T00:20:00", "end": "2020-01-01T00:30:00", "offset": 1.0, "scale_factor": 2.0},
+        ],
+    )
+    out = C.transform(_frame(), trans)
+    rad = out.rad.to_numpy()
+    minutes = out.index.minute.to_numpy()
+    # the segments span minutes [10, 20) and [20, 30]
+    first, second, end = 10, 20, 30
+    before, after = minutes < first, minutes > end
+    np.testing.assert_array_equal(rad[before], minutes[before])
+    np.testing.assert_array_equal(rad[(minutes >= first) & (minutes < second)], np.arange(first, second) - 10.0)
+    np.testing.assert_array_equal(rad[(minutes >= second) & (minutes <= end)], np.arange(second, end + 1) * 2.0 + 1.0)
+    np.testing.assert_array_equal(rad[after], minutes[after])
+    # other sensors are left untouched
+    np.testing.assert_array_equal(out.prs.to_numpy(), minutes)
+
+
+def test_compiled_cache_keeps_segments(tmp_path):
+    trans, path = _dump_large_transformation(tmp_path)
+    trans = trans.model_copy(
+        update={"segments": [C.Segment(start="2020-01-02", end="2020-01-03", offset=-1.5, scale_factor=0.5)]},
+    )
+    C.dump_transformation(trans, tmp_path)
+    assert C.load_transformation_from_path(path) == trans
+    assert C.load_transformation_from_path(path) == trans
+    rules = C.load_rules("abur", "rad", tmp_path)
+    np.testing.assert_array_equal(rules.segment_ranges, C.compile_rules(trans).segment_ranges)
+    assert (rules.segment_offsets.tolist(), rules.segment_scales.tolist()) == ([-1.5], [0.5])
+
+
+def test_load_transformation_header(tmp_path):
+    trans, path = _dump_large_transformation(tmp_path)
+    trans = trans.model_copy(update={"notes": "checked", "skip": True})
+    C.dump_transformation(trans, tmp_path)
+    expected = trans.model_copy(update={"dropped_timestamps": [], "dropped_date_ranges": [], "breakpoints": []})
+    # the first load parses the JSON file, the second one only reads the cached header
+    assert C.load_transformation_header(path) == expected
+    assert _rules.cache_path(path).exists()
+    assert C.load_transformation_header(path) == expected
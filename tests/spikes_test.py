@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup import _spikes
+
+
+def _tide(start="2021-01-01", end="2021-03-01", freq="1min", seed=0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, end, freq=freq, inclusive="left", name="time")
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    values = np.sin(2 * np.pi * hours / 12.42) + rng.normal(scale=0.01, size=len(index))
+    return pd.Series(values, index=index, name="rad")
+
+
+def test_find_spikes():
+    sr = _tide()
+    positions = np.array([100, 5000, 5001, 20_000, 40_000])
+    sr.iloc[positions] += [3.0, -2.0, -2.0, 0.5, 4.0]
+    # a gap does not hide the spikes next to it
+    sr.iloc[39_000:39_999] = np.nan
+    spikes = C.find_spikes(sr)
+    assert spikes.equals(pd.DatetimeIndex(sr.index[positions], name="time"))
+    large = pd.DatetimeIndex(sr.index[[100, 5000, 5001, 40_000]], name="time")
+    assert C.find_spikes(sr, min_deviation=1.0).equals(large)
+    scores = C.spike_scores(sr)
+    assert len(scores) == sr.notna().sum()
+    assert scores.score.iloc[:50].max() < _spikes.SPIKE_THRESHOLD
+
+
+def test_find_spikes_any_index_unit():
+    sr = _tide()
+    sr.iloc[[100, 5000]] += 3.0
+    # e.g. the `timestamp[us]` columns of Parquet files
+    spikes = C.find_spikes(sr.set_axis(sr.index.as_unit("us")))
+    assert spikes.as_unit("ns").equals(pd.DatetimeIndex(sr.index[[100, 5000]], name="time"))
+
+
+def test_propose_spikes_as_ranges():
+    sr = _tide()
+    sr.iloc[1000:1010] = 5.0
+    singles = [3000, 3002]
+    sr.iloc[singles] = -5.0
+    proposal = C.propose_spikes(sr)
+    assert proposal["dropped_date_ranges"] == [(sr.index[1000], sr.index[1009])]
+    assert proposal["dropped_timestamps"] == sr.index[singles].to_list()
+    # the proposals clean the series
+    trans = C.Transformation(ioc_code="abcd", sensor="rad", start=sr.index[0], end=sr.index[-1])
+    cleaned = C.transform(sr.to_frame(), C.merge_selection(trans, **proposal)).rad
+    assert cleaned.isna().sum() == len(range(1000, 1010)) + len(singles)
+    assert C.find_spikes(cleaned).empty
+
+
+def test_detect_spikes_is_a_diff(tmp_path):
+    sr = _tide("2021-01-01", "2021-12-31T23:55", freq="5min")
+    sr.iloc[[500, 7000, 9000]] += 5.0
+    (tmp_path / "data" / "2021").mkdir(parents=True)
+    sr.to_frame().to_parquet(tmp_path / "data" / "2021" / "abcd.parquet")
+    # the first spike is already dropped
+    trans = C.Transformation(
+        ioc_code="abcd",
+        sensor="rad",
+        start=sr.index[0],
+        end=sr.index[-1],
+        dropped_timestamps=[sr.index[500]],
+    )
+    C.dump_transformation(trans, tmp_path)
+    C.dump_transformation(trans.model_copy(update={"ioc_code": "efgh"}), tmp_path)
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        summary = C.detect_spikes(
+            sorted(tmp_path.glob("*.json")),
+            tmp_path / "data",
+            tmp_path / "spikes",
+            executor=executor,
+        )
+    assert summary.status.tolist() == ["proposed", "no data"]
+    row = summary.iloc[0]
+    assert row.spikes == len(row.dropped_timestamps)
+    assert row.dropped_timestamps == [sr.index[7000], sr.index[9000]]
+    proposed = C.load_transformation_from_path(tmp_path / "spikes" / "abcd_rad.json")
+    assert proposed.dropped_timestamps == [sr.index[500], sr.index[7000], sr.index[9000]]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import limits
+import multifutures
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+
+START = pd.Timestamp("2021-01-01")
+END = pd.Timestamp("2021-01-03T23:59:00")
+
+
+@pytest.fixture
+def archive(tmp_path):
+    index = pd.date_range(START, END, freq="min", name="time")
+    df = pd.DataFrame({"rad": np.round(np.sin(np.arange(len(index)) / 100), 4)}, index=index)
+    (tmp_path / "2021").mkdir()
+    df.to_parquet(tmp_path / "2021" / "abcd.parquet")
+    return tmp_path, df
+
+
+def test_replays_archive_and_synthesizes_the_rest(archive):
+    data_dir, df = archive
+    with C.StandInServer(data_dir) as server:
+        dataframes = C.download_raw(["abcd", "efgh"], START, END, base_url=server.base_url)
+    pd.testing.assert_series_equal(
+        dataframes["abcd"].rad,
+        df.rad,
+        check_names=False,
+        check_freq=False,
+        check_index_type=False,
+    )
+    assert len(dataframes["efgh"]) == len(df)
+    assert {request["code"] for request in server.requests} == {"abcd", "efgh"}
+    assert {request["status"] for request in server.requests} == {200}
+
+
+def test_errors_and_rate_limits(archive, tmp_path_factory):
+    data_dir, _ = archive
+    out = tmp_path_factory.mktemp("out")
+    with C.StandInServer(data_dir, error_rate=1.0) as server:
+        C.download_year_station("abcd", 2021, str(out), base_url=server.base_url)
+    assert {request["status"] for request in server.requests} == {500}
+    assert not C.read_manifest(out)
+
+    codes = [f"st{i:02d}" for i in range(6)]
+    # no client-side limit, so that the requests burst within a second
+    unlimited = multifutures.RateLimit(rate_limit=limits.parse("1000/second"))
+    rate = 2
+    with C.StandInServer(rate_limit=rate) as server, concurrent.futures.ThreadPoolExecutor(6) as executor:
+        with pytest.raises(Exception):  # noqa: B017
+            C.download_raw(
+                codes,
+                START,
+                START + pd.Timedelta(hours=1),
+                base_url=server.base_url,
+                rate_limit=unlimited,
+                executor=executor,
+            )
+    statuses = [request["status"] for request in server.requests]
+    # within the first second, only `rate` requests are served
+    assert statuses.count(200) == rate
+    assert statuses.count(429) == len(codes) - rate
+
+
+def test_fetch_meta(monkeypatch):
+    meta = pd.DataFrame({"ioc_code": ["abcd", "efgh"], "lon": [1.0, 2.0], "lat": [40.0, 50.0]})
+    with C.StandInServer(meta=meta) as server:
+        monkeypatch.setenv("IOC_CLEANUP_BASE_URL", server.base_url)
+        fetched = C._searvey.fetch_meta()
+    assert fetched.ioc_code.tolist() == ["abcd", "efgh"]
+    assert fetched.crs == "EPSG:4326"
+    assert fetched.geometry.x.tolist() == [1.0, 2.0]
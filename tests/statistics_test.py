@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import typing as T
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _legacy
+from ioc_cleanup import _statistics
+
+# Fractions of the samples that are missing and NaN in the random series
+MISSING = 0.1
+NANS = 0.05
+
+
+def _reference(sr: pd.Series) -> dict[str, T.Any]:
+    # The pandas implementation that `calc_raw_statistics` replaces
+    return {**_legacy.legacy_statistics(sr), **sr.attrs}
+
+
+@pytest.mark.parametrize("freq", ["1min", "2min", "7min", "15min"])
+def test_calc_raw_statistics_matches_pandas(freq):
+    rng = np.random.default_rng(42)
+    index = pd.date_range("2022-06-01", "2024-02-01", freq=freq)
+    index = index[rng.random(len(index)) > MISSING]
+    values = rng.gamma(2.0, size=len(index))
+    values[rng.random(len(index)) < NANS] = np.nan
+    sr = pd.Series(values, index=index)
+    sr.attrs["status"] = "ok"
+    result = _statistics.calc_raw_statistics(sr)
+    expected = _reference(sr)
+    assert list(result) == list(expected)
+    for key, value in expected.items():
+        if isinstance(value, float):
+            assert result[key] == pytest.approx(value, rel=1e-9), key
+        else:
+            assert result[key] == value, key
+
+
+def test_calc_raw_statistics_constant_series():
+    sr = pd.Series(1.5, index=pd.date_range("2023-08-01", periods=10, freq="min"))
+    result = _statistics.calc_raw_statistics(sr)
+    assert (result["std"], result["skew"], result["kurtosis"]) == (0.0, 0.0, 0.0)
+    assert result["simulation_ratio"] == pytest.approx(_reference(sr)["simulation_ratio"])
+
+
+def test_calc_raw_statistics_any_index_unit():
+    index = pd.date_range("2023-07-01", "2023-11-01", freq="min")
+    sr = pd.Series(np.sin(np.arange(len(index)) / 100), index=index)
+    # e.g. the `timestamp[us]` columns of Parquet files
+    result = _statistics.calc_raw_statistics(sr.set_axis(index.as_unit("us")))
+    assert result["main_interval"] == pd.Timedelta("1min")
+    assert result["detide_ratio"] == pytest.approx(_reference(sr)["detide_ratio"])
+    assert result == _statistics.calc_raw_statistics(sr)
+
+
+def test_calc_statistics_batches_match_per_file(tmp_path):
+    rng = np.random.default_rng(0)
+    codes = ["abcd", "efgh", "ijkl", "mnop", "qrst"]
+    index = pd.date_range("2023-07-01", periods=5000, freq="min")
+    for code in codes:
+        pd.DataFrame({"rad": rng.normal(size=len(index))}, index=index).to_parquet(tmp_path / f"{code}_rad.parquet")
+    meta = pd.DataFrame(
+        {
+            "ioc_code": codes[::-1],
+            "lon": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "lat": [10.0, 20.0, 30.0, 40.0, 50.0],
+            "country": ["A", "B", "C", "D", "E"],
+            "location": ["a", "b", "c", "d", "e"],
+            "geometry": [None] * 5,
+        },
+    )
+    stats = C.calc_statistics(meta, tmp_path, batch_size=2, max_workers=2)
+    expected = pd.DataFrame(
+        [C.calc_station_statistics_from_path(meta, tmp_path / f"{code}_rad.parquet") for code in codes],
+    )
+    pd.testing.assert_frame_equal(stats, expected)
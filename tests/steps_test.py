@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+import ioc_cleanup as C
+from ioc_cleanup import _steps
+
+
+def _record(steps, start="2020-01-01", end="2021-07-01", freq="2min", seed=0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, end, freq=freq, inclusive="left", name="time")
+    hours = (index - index[0]).total_seconds().to_numpy() / 3600
+    values = 0.8 * np.sin(2 * np.pi * hours / 12.42) + 0.3 * np.sin(2 * np.pi * hours / 23.93)
+    values += rng.normal(scale=0.02, size=len(index))
+    for when, size in steps:
+        values[index >= when] += size
+    return pd.Series(values, index=index, name="rad")
+
+
+def test_find_breakpoints():
+    steps = [(pd.Timestamp("2020-03-10T07:32"), 0.3), (pd.Timestamp("2020-11-02T18:04"), -0.12)]
+    sr = _record(steps)
+    breakpoints = C.find_breakpoints(sr)
+    assert breakpoints.time.tolist() == [when for when, _ in steps]
+    np.testing.assert_allclose(breakpoints.step, [size for _, size in steps], atol=0.02)
+    assert (breakpoints.score > _steps.STEP_THRESHOLD).all()
+    assert C.find_breakpoints(_record([])).empty
+
+
+def test_breakpoint_during_a_gap():
+    sr = _record([(pd.Timestamp("2020-06-01T12:00"), 0.5)])
+    sr = sr.drop(sr.loc["2020-05-31":"2020-06-02T03:00"].index)
+    breakpoints = C.find_breakpoints(sr)
+    # the first sample after the gap
+    assert breakpoints.time.tolist() == [pd.Timestamp("2020-06-02T03:02")]
+    compared = C.compare_breakpoints(breakpoints, [pd.Timestamp("2020-06-01T12:00")], times=sr.index)
+    assert compared.status.tolist() == ["matched"]
+    compared = C.compare_breakpoints(breakpoints, [pd.Timestamp("2020-06-01T12:00")], pd.Timedelta("6h"))
+    assert compared.status.tolist() == ["new", "missing"]
+
+
+def test_find_breakpoints_any_index_unit():
+    sr = _record([(pd.Timestamp("2020-06-01T12:00"), 0.5)])
+    sr = sr.drop(sr.loc["2020-05-31":"2020-06-02T03:00"].index)
+    breakpoints = C.find_breakpoints(sr.set_axis(sr.index.as_unit("us")))
+    assert breakpoints.time.tolist() == [pd.Timestamp("2020-06-02T03:02")]
+
+
+def test_detect_breakpoints_compares_with_the_stored_ones(tmp_path):
+    step = pd.Timestamp("2020-09-15T10:00")
+    sr = _record([(step, 0.4)], end="2021-01-01")
+    (tmp_path / "data" / "2020").mkdir(parents=True)
+    sr.to_frame().to_parquet(tmp_path / "data" / "2020" / "abcd.parquet")
+    stored = [step + pd.Timedelta("2h"), pd.Timestamp("2020-04-01")]
+    trans = C.Transformation(ioc_code="abcd", sensor="rad", start=sr.index[0], end=sr.index[-1], breakpoints=stored)
+    C.dump_transformation(trans, tmp_path)
+    C.dump_transformation(trans.model_copy(update={"ioc_code": "efgh"}), tmp_path)
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        summary = C.detect_breakpoints(sorted(tmp_path.glob("*.json")), tmp_path / "data", executor=executor)
+    abcd = summary[summary.station == "abcd"]
+    assert abcd.status.tolist() == ["matched", "missing"]
+    assert abcd.time.iloc[0] == step
+    assert abcd.stored.tolist() == stored
+    assert summary[summary.station == "efgh"].status.tolist() == ["no data"]
+
+
+def test_detect_breakpoints_without_transformations(tmp_path):
+    summary = C.detect_breakpoints([], tmp_path / "data")
+    assert summary.empty
+    assert summary.columns.tolist() == _steps.BREAKPOINT_COLUMNS
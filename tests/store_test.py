@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import ioc_cleanup as C
+from ioc_cleanup import _store
+
+# One row group per month
+ROW_GROUPS = 12
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    index = pd.date_range("2020-01-01", "2021-12-31T23:50:00", freq="10min", name="time")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"rad": rng.normal(size=len(index)), "prs": rng.normal(size=len(index))}, index=index)
+    for year in ("2020", "2021"):
+        (tmp_path / "data" / year).mkdir(parents=True)
+        yearly = df.loc[year].sample(frac=1.0, random_state=0)  # downloads are not sorted
+        if year == "2021":
+            yearly = yearly.drop(columns="prs")
+        yearly.to_parquet(tmp_path / "data" / year / "abcd.parquet")
+    return tmp_path / "data"
+
+
+def test_migrate_writes_sorted_monthly_row_groups(data_dir, tmp_path):
+    store = tmp_path / "store"
+    written = _store.migrate(data_dir, store)
+    assert written == [
+        store / "station=abcd" / "year=2020" / "data.parquet",
+        store / "station=abcd" / "year=2021" / "data.parquet",
+    ]
+    metadata = pq.ParquetFile(written[0]).metadata
+    assert metadata.num_row_groups == ROW_GROUPS
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    assert metadata.row_group(0).column(0).statistics.has_min_max
+
+
+def test_load_station_from_store_matches_yearly_files(data_dir, tmp_path):
+    store = tmp_path / "store"
+    _store.migrate(data_dir, store)
+    expected = C.load_station("abcd", data_dir, 2020, 2022).sort_index()
+    result = C.load_station("abcd", store, 2020, 2022)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_freq=False)
+
+
+def test_load_station_from_store_with_filters(data_dir, tmp_path):
+    store = tmp_path / "store"
+    _store.migrate(data_dir, store)
+    start, end = pd.Timestamp("2020-12-31T12:00:00"), pd.Timestamp("2021-01-01T12:00:00")
+    result = C.load_station("abcd", store, 2020, 2022, columns=["rad"], start=start, end=end)
+    assert list(result.columns) == ["rad"]
+    assert result.index[0] == start
+    assert result.index[-1] == end
+    assert C.load_station("abcd", store, 2022, 2023).empty
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ioc_cleanup as C
+
+# The record spans 10 periods: 8 full waves between up-crossings and 9 between down-crossings
+UP_WAVES = 8
+DOWN_WAVES = 9
+
+
+@pytest.fixture
+def record():
+    time = pd.date_range("2025-07-30", periods=200, freq="1min")
+    # 20 minute waves of 1 m height, shifted so that no sample is exactly on zero
+    eta = 0.5 * np.sin(2 * np.pi * (np.arange(200) + 0.5) / 20)
+    return time, eta
+
+
+def test_extract_waves(record):
+    time, eta = record
+    waves = C.extract_waves(time, eta)
+    assert waves.columns.tolist() == ["wave", "H", "T", "t_crest", "t_trough"]
+    assert len(waves) == UP_WAVES
+    assert waves.wave.tolist() == list(range(1, UP_WAVES + 1))
+    assert np.allclose(waves.H, 1.0, atol=0.02)
+    # from the first to the last sample of the wave, as in the original script
+    assert (waves["T"] == pd.Timedelta("19min")).all()
+    assert (waves.t_crest < waves.t_trough).all()
+    assert len(C.extract_waves(time, eta, crossing="down")) == DOWN_WAVES
+    with pytest.raises(ValueError, match="crossing"):
+        C.extract_waves(time, eta, crossing="sideways")
+
+
+def test_extract_waves_batch(record):
+    time, eta = record
+    gappy = 2 * eta
+    gappy[45:50] = np.nan
+    waves = C.extract_waves(time, np.stack([eta, gappy]), stations=["abcd", "efgh"])
+    assert waves.columns[0] == "station"
+    single = C.extract_waves(time, eta)
+    pd.testing.assert_frame_equal(waves[waves.station == "abcd"].drop(columns="station"), single)
+    efgh = waves[waves.station == "efgh"]
+    # the wave spanning the gap is dropped
+    assert efgh.wave.tolist() == [1, 3, 4, 5, 6, 7, 8]
+    assert np.allclose(efgh.H, 2.0, atol=0.04)
+
+
+def test_extract_waves_batch_without_data(record):
+    time, eta = record
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        waves = C.extract_waves(time, np.stack([eta, np.full_like(eta, np.nan)]), stations=["abcd", "efgh"])
+    assert set(waves.station) == {"abcd"}